@@ -16,6 +16,9 @@
 import os
 import shutil
 import subprocess
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 
 from executor.export import run as run_export
 from scripts.generate_project import run as run_generate_project
@@ -72,71 +75,184 @@ def get_output_directories(output_root_dir):
     return output_directories
 
 
-def strip_binary(output):
+# Make targets and their output files.
+TARGETS = {
+    "lm_x86": "lm_x86.elf",
+    "lm_x86_avx": "lm_x86_avx.elf",
+    "lm_arm": "lm_arm.elf",
+    "lm_fpga": "lm_fpga.elf",
+    "lm_aarch64": "lm_aarch64.elf",
+    "lib_x86": "lib_x86.so",
+    "lib_x86_avx": "lib_x86_avx.so",
+    "lib_arm": "lib_arm.so",
+    "lib_fpga": "lib_fpga.so",
+    "lib_aarch64": "lib_aarch64.so",
+    "ar_x86": "libdlk_x86.a",
+    "ar_x86_avx": "libdlk_x86_avx.a",
+    "ar_arm": "libdlk_arm.a",
+    "ar_fpga": "libdlk_fpga.a",
+    "ar_aarch64": "libdlk_aarch64.a",
+}
+
+BuildResult = namedtuple("BuildResult", ["targets", "seconds", "returncode", "log_path"])
+
+
+def strip_binary(output, cwd=None):
     """Strip binary file.
 
     Args:
-        output: 
+        output: Output file name.
+        cwd: Directory which has the output file. (Default value = None)
 
     """
 
     if output in {"lm_x86.elf", "lm_x86_avx.elf"}:
-        subprocess.run(("strip", output))
+        subprocess.run(("strip", output), cwd=cwd)
     elif output in {"lib_x86.so", "lib_x86_avx.so"}:
-        subprocess.run(("strip", "-x", "--strip-unneeded", output))
+        subprocess.run(("strip", "-x", "--strip-unneeded", output), cwd=cwd)
     elif output in {"lm_arm.elf", "lm_fpga.elf"}:
-        subprocess.run(("arm-linux-gnueabihf-strip", output))
+        subprocess.run(("arm-linux-gnueabihf-strip", output), cwd=cwd)
     elif output in {"lib_arm.so", "lib_fpga.so"}:
-        subprocess.run(("arm-linux-gnueabihf-strip", "-x", "--strip-unneeded", output))
+        subprocess.run(("arm-linux-gnueabihf-strip", "-x", "--strip-unneeded", output), cwd=cwd)
 
 
-def make_all(project_dir, output_dir):
-    """Make each target.
+def group_targets(targets):
+    """Group targets which are built from the same objects.
+
+    `lib_*` and `ar_*` of the same architecture are compiled with the same flags, so they share a build directory.
+    `lm_*` are compiled with `-DFUNC_TIME_MEASUREMENT`, so each one has its own.
+
+    Args:
+        targets (list): Make targets.
+
+    Returns:
+        dict: Build directory name to the list of targets.
+
+    """
+    groups = OrderedDict()
+    for target in targets:
+        if target not in TARGETS:
+            raise ValueError("Unknown target {}. Choose from {}.".format(target, ", ".join(TARGETS)))
+        kind, arch = target.split("_", 1)
+        name = target if kind == "lm" else "lib_" + arch
+        groups.setdefault(name, [])
+        if target not in groups[name]:
+            groups[name].append(target)
+    return groups
+
+
+def sync_build_directory(project_dir, build_dir):
+    """Mirror the sources of the project into the build directory by hard links.
+
+    Objects made by earlier builds are kept, so that make only rebuilds objects of changed sources.
 
     Args:
         project_dir (str): Path to project directory
-        output_dir (str): Path to output directory
+        build_dir (str): Path to build directory in the project directory
 
     """
+    build_root = os.path.dirname(build_dir)
+    for root, dirs, files in os.walk(project_dir):
+        dirs[:] = [d for d in dirs if os.path.join(root, d) != build_root]
+        dest_root = os.path.join(build_dir, os.path.relpath(root, project_dir))
+        os.makedirs(dest_root, exist_ok=True)
+        for name in files:
+            src = os.path.join(root, name)
+            dest = os.path.join(dest_root, name)
+            if os.path.lexists(dest):
+                if os.path.samefile(src, dest):
+                    continue
+                os.remove(dest)
+            try:
+                os.link(src, dest)
+            except OSError:
+                shutil.copy2(src, dest)
+
+
+def build_targets(project_dir, build_dir, targets, jobs, compiler_cache=None):
+    """Build targets in an isolated build directory.
 
-    make_list = [
-        ["lm_x86", "lm_x86.elf"],
-        ["lm_x86_avx", "lm_x86_avx.elf"],
-        ["lm_arm", "lm_arm.elf"],
-        ["lm_fpga", "lm_fpga.elf"],
-        ["lm_aarch64", "lm_aarch64.elf"],
-        ["lib_x86", "lib_x86.so"],
-        ["lib_x86_avx", "lib_x86_avx.so"],
-        ["lib_arm", "lib_arm.so"],
-        ["lib_fpga", "lib_fpga.so"],
-        ["lib_aarch64", "lib_aarch64.so"],
-        ["ar_x86", "libdlk_x86.a"],
-        ["ar_x86_avx", "libdlk_x86_avx.a"],
-        ["ar_arm", "libdlk_arm.a"],
-        ["ar_fpga", "libdlk_fpga.a"],
-        ["ar_aarch64", "libdlk_aarch64.a"],
-    ]
-    output_dir = os.path.abspath(output_dir)
-    running_dir = os.getcwd()
-    # Change current directory to project directory
-    os.chdir(project_dir)
+    Args:
+        project_dir (str): Path to project directory
+        build_dir (str): Path to build directory
+        targets (list): Make targets which share the objects
+        jobs (int): The number of make jobs
+        compiler_cache (str): Compiler cache command, e.g. "ccache". (Default value = None)
+
+    Returns:
+        BuildResult: Elapsed time, return code and log file of make.
 
-    cxxflags_cache = os.getenv("CXXFLAGS", "")
+    """
+    start = time.time()
+    sync_build_directory(project_dir, build_dir)
+
+    env = dict(os.environ)
+    if targets[0].startswith("lm_"):
+        env["CXXFLAGS"] = env.get("CXXFLAGS", "") + " -DFUNC_TIME_MEASUREMENT"
+
+    command = ["make"] + targets + ["-j{}".format(jobs), "--quiet"]
+    if compiler_cache:
+        command.append("CCACHE={}".format(compiler_cache))
 
-    # Make each target and move output files
-    for target, output in make_list:
-        if target in {"lm_x86", "lm_x86_avx", "lm_arm", "lm_fpga", "lm_aarch64"}:
-            os.environ["CXXFLAGS"] = cxxflags_cache + " -DFUNC_TIME_MEASUREMENT"
-        else:
-            os.environ["CXXFLAGS"] = cxxflags_cache
+    log_path = os.path.join(build_dir, "make.log")
+    with open(log_path, "w") as log:
+        returncode = subprocess.run(command, cwd=build_dir, env=env, stdout=log, stderr=subprocess.STDOUT).returncode
 
-        subprocess.run(("make", "clean", "--quiet"))
-        subprocess.run(("make", target, "-j4", "--quiet"))
-        strip_binary(output)
-        output_file_path = os.path.join(output_dir, output)
-        os.rename(output, output_file_path)
-    # Return running directory
-    os.chdir(running_dir)
+    return BuildResult(targets, time.time() - start, returncode, log_path)
+
+
+def make_all(project_dir, output_dir, targets=None, jobs=None, compiler_cache=None):
+    """Make each target.
+
+    Targets are built concurrently, each group of targets in its own build directory under `<project_dir>/build`,
+    so that they don't share objects compiled with different flags. The build directories are kept for
+    incremental builds.
+
+    Args:
+        project_dir (str): Path to project directory
+        output_dir (str): Path to output directory
+        targets (list): Make targets to build. All targets if None. (Default value = None)
+        jobs (int): The total number of make jobs. The number of CPUs if None. (Default value = None)
+        compiler_cache (str): Compiler cache command, e.g. "ccache". (Default value = None)
+
+    Returns:
+        list: BuildResult of each group of targets.
+
+    """
+    groups = group_targets(list(TARGETS) if targets is None else targets)
+    project_dir = os.path.abspath(project_dir)
+    output_dir = os.path.abspath(output_dir)
+    jobs = jobs or os.cpu_count() or 1
+    workers = max(1, min(len(groups), jobs))
+    jobs_per_build = max(1, jobs // workers)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(build_targets, project_dir, os.path.join(project_dir, "build", name), members,
+                            jobs_per_build, compiler_cache)
+            for name, members in groups.items()
+        ]
+        results = [future.result() for future in futures]
+
+    failed = []
+    for result in results:
+        build_dir = os.path.dirname(result.log_path)
+        status = "ok" if result.returncode == 0 else "FAILED (see {})".format(result.log_path)
+        print("make {}: {:.1f} sec, {}".format(" ".join(result.targets), result.seconds, status))
+        if result.returncode != 0:
+            failed += result.targets
+            continue
+
+        # Move output files
+        for target in result.targets:
+            output = TARGETS[target]
+            strip_binary(output, cwd=build_dir)
+            shutil.move(os.path.join(build_dir, output), os.path.join(output_dir, output))
+
+    if failed:
+        raise RuntimeError("Failed to make {}.".format(", ".join(failed)))
+
+    return results
 
 
 def run(experiment_id,
@@ -144,7 +260,10 @@ def run(experiment_id,
         output_template_dir=None,
         image_size=(None, None),
         project_name=None,
-        save_npy_for_debug=True):
+        save_npy_for_debug=True,
+        targets=None,
+        jobs=None,
+        compiler_cache=None):
     """Convert from trained model.
 
     Args:
@@ -153,6 +272,10 @@ def run(experiment_id,
         output_template_dir:  (Default value = None)
         image_size: (Default value = (None)
         project_name: (Default value = None)
+        targets: Make targets to build. All targets if None. (Default value = None)
+        jobs: The total number of make jobs and code generation processes.
+            The number of CPUs for make and a single code generation process if None. (Default value = None)
+        compiler_cache: Compiler cache command, e.g. "ccache". (Default value = None)
 
     Returns:
         str: Path of exported dir.
@@ -160,6 +283,10 @@ def run(experiment_id,
 
     """
 
+    if targets is not None:
+        # fail fast on unknown targets before exporting.
+        group_targets(targets)
+
     # Export model
     if save_npy_for_debug:
         export_dir = run_export(experiment_id, restore_path=restore_path, image_size=image_size)
@@ -182,7 +309,8 @@ def run(experiment_id,
         project_name=project_name,
         activate_hard_quantization=activate_hard_quantization,
         threshold_skipping=threshold_skipping,
-        cache_dma=cache_dma
+        cache_dma=cache_dma,
+        codegen_jobs=jobs or 1,
     )
 
     # Create output dir from template
@@ -198,7 +326,7 @@ def run(experiment_id,
     # Make
     project_dir_name = "{}.prj".format(project_name)
     project_dir = os.path.join(export_dir, project_dir_name)
-    make_all(project_dir, output_directories.get("library_dir"))
+    make_all(project_dir, output_directories.get("library_dir"), targets, jobs, compiler_cache)
 
     return output_root_dir
 
@@ -209,7 +337,10 @@ def convert(
     template=None,
     image_size=(None, None),
     project_name=None,
-    save_npy_for_debug=True
+    save_npy_for_debug=True,
+    targets=None,
+    jobs=None,
+    compiler_cache=None,
 ):
     output_dir = os.environ.get('OUTPUT_DIR', 'saved')
 
@@ -218,4 +349,5 @@ def convert(
     else:
         restore_path = os.path.join(output_dir, experiment_id, 'checkpoints', checkpoint)
 
-    return run(experiment_id, restore_path, template, image_size, project_name, save_npy_for_debug)
+    return run(experiment_id, restore_path, template, image_size, project_name, save_npy_for_debug,
+               targets, jobs, compiler_cache)
@@ -15,6 +15,7 @@
 # limitations under the License.
 # =============================================================================
 import os
+import shutil
 
 import click
 
@@ -110,8 +111,39 @@ def train(config, experiment_id=None):
     help="project name which generated by convert",
     default=None,
 )
-def convert(experiment_id, checkpoint, template, image_size, project_name):
-    export_output_root_dir = run_convert(experiment_id, checkpoint, template, image_size, project_name)
+@click.option(
+    "--targets",
+    help="comma separated make targets to build, e.g. lm_fpga,lib_fpga. all targets are built by default.",
+    default=None,
+)
+@click.option(
+    "-j",
+    "--jobs",
+    type=int,
+    help="the total number of make jobs and code generation processes. "
+         "the number of CPUs for make and a single code generation process by default.",
+    default=None,
+)
+@click.option(
+    "--ccache",
+    is_flag=True,
+    help="use ccache to cache compilations.",
+    default=False,
+)
+def convert(experiment_id, checkpoint, template, image_size, project_name, targets, jobs, ccache):
+    if targets:
+        targets = [target.strip() for target in targets.split(",") if target.strip()]
+    compiler_cache = None
+    if ccache:
+        if shutil.which("ccache"):
+            compiler_cache = "ccache"
+        else:
+            click.echo('ccache is not found, compiling without cache.')
+
+    export_output_root_dir = run_convert(
+        experiment_id, checkpoint, template, image_size, project_name,
+        targets=targets, jobs=jobs, compiler_cache=compiler_cache,
+    )
 
     click.echo('Output files are generated in {}'.format(export_output_root_dir))
     click.echo('Please see {}/README.md to run prediction'.format(export_output_root_dir))
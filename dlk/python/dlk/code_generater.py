@@ -13,19 +13,90 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # =============================================================================
+import multiprocessing
 import shutil
-from collections import defaultdict
+import time
 from os import path
 from pathlib import Path
-from typing import cast
+from typing import Dict, List, Optional, Tuple, cast
+
+import numpy as np
 
 import utils
 from core.config import Config
+from core.data_types import QUANTIZED_PACKED, QUANTIZED_PACKED_KERNEL
 from core.graph import Graph
-from core.operators import Conv
+from core.memory_planner import plan_memory
+from core.operators import Constant, Conv
 from template import Template
 
 
+class ConstBlobWriter(object):
+    """Write data of constants into a binary file, each of which is aligned.
+
+    Args:
+        file: Binary file object to write.
+        config (Config): Collection of configurations
+
+    """
+
+    alignment = 64
+
+    def __init__(self, file, config: Config) -> None:
+        self.file = file
+        self.config = config
+        self.size = 0
+
+    def _nptype(self, node: Constant) -> Optional[np.dtype]:
+        if node.dtype in [QUANTIZED_PACKED(), QUANTIZED_PACKED_KERNEL()]:
+            return self.config.default_qword_dtype.nptype()
+        try:
+            return node.dtype.nptype()
+        except NotImplementedError:
+            return None
+
+    def _write(self, data, nptype) -> int:
+        # little endian, as all the targets are.
+        data = np.ascontiguousarray(data, dtype=np.dtype(nptype).newbyteorder('<'))
+        offset = self.size
+        self.file.write(data.tobytes())
+        padding = -(offset + data.nbytes) % self.alignment
+        self.file.write(bytes(padding))
+        self.size += data.nbytes + padding
+        return offset
+
+    def add(self, node: Constant) -> Optional[Dict[str, int]]:
+        """Write data of the constant.
+
+        Returns:
+            dict: Offsets of `data`, and `transposed_data` and `kn2row_data` if the node has them,
+                or None if the constant should be written as C++ source.
+
+        """
+        nptype = self._nptype(node)
+        if node.is_scalar or nptype is None:
+            return None
+
+        offsets = {'data': self._write(node.data, nptype)}
+        if node.transposed_data:
+            offsets['transposed_data'] = self._write(node.transposed_data, nptype)
+            offsets['kn2row_data'] = self._write(node.kn2row_data, nptype)
+        return offsets
+
+
+# code generator used by the forked worker processes of `CodeGenerater.generate_inputs`.
+_worker_generater: Optional['CodeGenerater'] = None
+
+
+def _generate_input_in_worker(task: Tuple[int, Optional[Dict[str, int]]]) -> List[Tuple[str, float]]:
+    index, offsets = task
+    generater = cast(CodeGenerater, _worker_generater)
+    # only the times of this task are sent back to the parent process.
+    generater.file_times = []
+    generater._generate_input(generater._consts[index], offsets)
+    return generater.file_times
+
+
 class CodeGenerater(object):
 
     def __init__(self,
@@ -36,15 +107,34 @@ class CodeGenerater(object):
         self.params = params
         self.config = config
         assert len(self.graph.get_inputs()) == 1, 'Codegenerator does not support multiple inputs.'
+        self.memory_plan = plan_memory(self.graph)
         self.template = Template({
             'graph': self.graph,
             'params': self.params,
             'config': self.config,
             'graph_input': self.graph.get_inputs()[0],
             'graph_output': self.graph.non_variables[-1],
+            'memory_plan': self.memory_plan,
         })
         self.src_dir = path.join(self.config.output_pj_path, 'src')
         self.header_dir = path.join(self.config.output_pj_path, 'include')
+        self.file_times: List[Tuple[str, float]] = []
+        self._consts: List[Constant] = []
+
+    def _timed_generate(self, template_path: str, export_dir: str, new_name: Optional[str] = None,
+                        **feed_dict) -> None:
+        start = time.perf_counter()
+        export_path = self.template.generate(template_path, export_dir, new_name, **feed_dict)
+        self.file_times.append((export_path, time.perf_counter() - start))
+
+    def file_time_report(self, top: int = 10) -> str:
+        """Return the total time of generating the constant sources and the slowest files."""
+        total = sum(seconds for _, seconds in self.file_times)
+        lines = [f'generated {len(self.file_times)} constant source files in {total:.2f} s '
+                 f'({self.config.codegen_jobs} jobs)']
+        for export_path, seconds in sorted(self.file_times, key=lambda x: -x[1])[:top]:
+            lines.append(f'{seconds * 1000:>10.1f} ms  {path.relpath(export_path, self.config.output_pj_path)}')
+        return '\n'.join(lines)
 
     def generate_files_from_template(self) -> None:
         src_dir_path = self.template.root_dir
@@ -67,26 +157,76 @@ class CodeGenerater(object):
                     self.template.generate(relative_src_file_path,
                                            dest_file_dir_path)
                 else:
-                    shutil.copy2(src_file_path, dest_file_path)
+                    # not `copy2`, the sources must be newer than the objects of the earlier builds.
+                    shutil.copy(src_file_path, dest_file_path)
+
+    def _generate_input(self, node: Constant, offsets: Optional[Dict[str, int]]) -> None:
+        input_src_dir_path = path.join(self.src_dir, 'inputs')
+        input_header_dir_path = path.join(self.header_dir, 'inputs')
+
+        if offsets is not None:
+            self._timed_generate(path.join('manual', 'consts', 'input_blob.tpl.cpp'),
+                                 input_src_dir_path,
+                                 new_name=node.name + '.cpp',
+                                 node=node,
+                                 offsets=offsets)
+        else:
+            self._timed_generate(path.join('manual', 'consts', 'input.tpl.cpp'),
+                                 input_src_dir_path,
+                                 new_name=node.name + '.cpp',
+                                 node=node)
+
+        self._timed_generate(path.join('manual', 'consts', 'input.tpl.h'),
+                             input_header_dir_path,
+                             new_name=node.name + '.h',
+                             node=node)
 
     def generate_inputs(self) -> None:
+        """Generate the sources of the constants.
+
+        With `config.codegen_jobs` > 1, the sources are rendered by forked worker processes,
+        the largest constants first. The offsets in the blob are assigned in this process beforehand,
+        so that the generated files don't depend on the number of jobs.
+        """
         input_src_dir_path = path.join(self.src_dir, 'inputs')
         input_header_dir_path = path.join(self.header_dir, 'inputs')
         utils.make_dirs([input_src_dir_path, input_header_dir_path])
 
-        input_src_template_path = path.join('consts', 'input.tpl.cpp')
-        input_header_template_path = path.join('consts', 'input.tpl.h')
+        blob_name = 'const_blob.bin'
+        blob = None
+        self._consts = self.graph.consts
+        if self.config.const_blob:
+            with open(path.join(input_src_dir_path, blob_name), 'wb') as blob_file:
+                blob = ConstBlobWriter(blob_file, self.config)
+                tasks = [(i, blob.add(node)) for i, node in enumerate(self._consts)]
+        else:
+            tasks = [(i, None) for i in range(len(self._consts))]
 
-        for node in self.graph.consts:
-            self.template.manual_generate(input_src_template_path,
+        if blob:
+            self.template.manual_generate(path.join('consts', 'const_blob.tpl.cpp'),
                                           input_src_dir_path,
-                                          new_name=node.name + '.cpp',
-                                          node=node)
-
-            self.template.manual_generate(input_header_template_path,
+                                          blob_name=blob_name,
+                                          alignment=blob.alignment)
+            self.template.manual_generate(path.join('consts', 'const_blob.tpl.h'),
                                           input_header_dir_path,
-                                          new_name=node.name + '.h',
-                                          node=node)
+                                          size=blob.size,
+                                          alignment=blob.alignment)
+
+        jobs = min(self.config.codegen_jobs, len(tasks))
+        if jobs <= 1:
+            for index, offsets in tasks:
+                self._generate_input(self._consts[index], offsets)
+            return
+
+        global _worker_generater
+        tasks.sort(key=lambda task: -self._consts[task[0]].size)
+        _worker_generater = self
+        try:
+            with multiprocessing.get_context('fork').Pool(jobs) as pool:
+                for file_times in pool.imap_unordered(_generate_input_in_worker, tasks):
+                    self.file_times.extend(file_times)
+        finally:
+            _worker_generater = None
 
     def generate_thresholds(self):
         src_template_path = path.join('manual', 'consts', 'thresholds.tpl.cpp')
@@ -95,13 +235,13 @@ class CodeGenerater(object):
         qconvs_with_ts = [x for x in self.graph.convs(quantized_only=True)
                           if x.has_thresholds]
 
-        self.template.generate(src_template_path,
-                               self.src_dir,
-                               quantized_convs=qconvs_with_ts)
+        self._timed_generate(src_template_path,
+                             self.src_dir,
+                             quantized_convs=qconvs_with_ts)
 
-        self.template.generate(header_template_path,
-                               self.header_dir,
-                               quantized_convs=qconvs_with_ts)
+        self._timed_generate(header_template_path,
+                             self.header_dir,
+                             quantized_convs=qconvs_with_ts)
 
     def generate_scaling_factors(self):
         src_template_path = path.join('manual', 'consts', 'scaling_factors.tpl.cpp')
@@ -109,51 +249,10 @@ class CodeGenerater(object):
 
         qconvs_convs = self.graph.convs(quantized_only=True)
 
-        self.template.generate(src_template_path,
-                               self.src_dir,
-                               quantized_convs=qconvs_convs)
-
-        self.template.generate(header_template_path,
-                               self.header_dir,
-                               quantized_convs=qconvs_convs)
-
-    def reuse_output_buffers(self):
-
-        operations = self.graph.non_variables
-        candidates = defaultdict(set)
-
-        for idx, op in enumerate(operations):
-            prev_ops = operations[:idx]
-            next_ops = operations[idx:]
-
-            next_inputs = []
-            for x in next_ops:
-                for i in x.input_ops.values():
-                    next_inputs.append(i.name)
-
-            aliased = set()
-            for prev_op in prev_ops:
-                if prev_op.op_type in {'Reshape', 'Split'}:
-                    aliased.add(prev_op.name)
-                    for i in prev_op.input_ops.values():
-                        aliased.add(i.name)
-                if prev_op.name not in next_inputs and prev_op.size >= op.size and prev_op.dtype == op.dtype:
-                    candidates[op.name].add(prev_op.name)
-
-            candidates[op.name] = candidates[op.name].difference(aliased)
-
-        being_reused = []
-        reusing = []
-        for op in operations:
-            cs = candidates[op.name]
-            if cs:
-                reusable_buffer = None
-                for option in cs:
-                    if option not in being_reused and option not in reusing:
-                        reusable_buffer = option
-                        break
-
-                if reusable_buffer:
-                    op.available_buffer = reusable_buffer
-                    being_reused.append(reusable_buffer)
-                    reusing.append(op.name)
+        self._timed_generate(src_template_path,
+                             self.src_dir,
+                             quantized_convs=qconvs_convs)
+
+        self._timed_generate(header_template_path,
+                             self.header_dir,
+                             quantized_convs=qconvs_convs)
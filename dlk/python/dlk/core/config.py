@@ -32,7 +32,9 @@ class Config(object):
                  optimized_pb_path=None,
                  output_pj_path=None,
                  debug: bool = False,
-                 cache_dma: bool = False
+                 cache_dma: bool = False,
+                 const_blob: bool = False,
+                 codegen_jobs: int = 1
                  ) -> None:
         """Init the config object."""
         self.activate_hard_quantization: bool = activate_hard_quantization
@@ -43,6 +45,8 @@ class Config(object):
         self.output_pj_path: str = output_pj_path
         self.__debug: bool = debug
         self.__cache_dma: bool = cache_dma
+        self.__const_blob: bool = const_blob
+        self.__codegen_jobs: int = max(1, codegen_jobs)
 
     @property
     def pre_processor(self) -> str:
@@ -63,3 +67,13 @@ class Config(object):
     @property
     def cache(self) -> bool:
         return self.__cache_dma
+
+    @property
+    def const_blob(self) -> bool:
+        """Whether constants are written into a binary blob instead of C++ source."""
+        return self.__const_blob
+
+    @property
+    def codegen_jobs(self) -> int:
+        """Number of processes generating the constant sources."""
+        return self.__codegen_jobs
@@ -15,9 +15,9 @@
 # =============================================================================
 """Graph module."""
 from collections import OrderedDict, defaultdict
-from typing import TYPE_CHECKING, Any, Dict, List, Optional, Set, cast
+from typing import TYPE_CHECKING, Dict, List, Optional, cast
 
-from core.graph_pattern_matching import sort_graph
+from core.graph_pattern_matching import top_order
 from core.operators import Conv, Operator
 
 
@@ -30,6 +30,13 @@ class Graph(object):
         self.__op_type_list: Dict[str, List[Operator]] = defaultdict(lambda: [])
         self.__non_variable_list: List[Operator] = []
 
+        # execution order and consumers index, cached until operators or their connections change.
+        self.__version = 0
+        self.__index_key: Optional[tuple] = None
+        self.__execution_order: List[Operator] = []
+        self.__non_variables: List[Operator] = []
+        self.__consumers: Dict[str, List[Operator]] = {}
+
     def __eq__(self, other) -> bool:
         """Return the two graphs are equivalent."""
         if other is None or not isinstance(other, Graph):
@@ -64,6 +71,8 @@ class Graph(object):
             if not op.is_variable:
                 self.__non_variable_list.append(op)
 
+            self.__version += 1
+
         else:
             ValueError(f'{op.name} is already registered in this graph.')
 
@@ -85,6 +94,7 @@ class Graph(object):
     def remove_op(self, op: Operator) -> None:
         if self.__ops.get(op.name) is not None:
             del self.__ops[op.name]
+            self.__version += 1
 
         t = type(op).__name__
         to_remove = [i for i, val in
@@ -109,11 +119,46 @@ class Graph(object):
     def consts(self) -> List[Operator]:
         return list(self.__op_type_list['Constant'])
 
+    def __update_index(self) -> None:
+        """Recompute the execution order and consumers index if the graph has changed."""
+        key = (self.__version, Operator._connection_version)
+        if key == self.__index_key:
+            return
+
+        exec_list: List[Operator] = []
+        visited: Dict[str, bool] = {}
+        for op in self.__ops.values():
+            top_order(op, exec_list, visited)
+
+        consumers: Dict[str, List[Operator]] = {name: [] for name in visited}
+        for op in exec_list:
+            for name in {i.name for i in op.input_nodes}:
+                consumers[name].append(op)
+
+        self.__execution_order = exec_list
+        self.__non_variables = [op for op in exec_list if not op.is_variable]
+        self.__consumers = consumers
+        self.__index_key = key
+
+    @property
+    def execution_order(self) -> List[Operator]:
+        """Return all operators in topological order, where every operator comes after its inputs."""
+        self.__update_index()
+        return list(self.__execution_order)
+
     @property
     def non_variables(self) -> List[Operator]:
-        node_list = sort_graph(self)
-        node_list = [node for node in node_list if not cast(Operator, node).is_variable]
-        return node_list
+        self.__update_index()
+        return list(self.__non_variables)
+
+    def get_producers(self, op: Operator) -> List[Operator]:
+        """Return the input operators of the operator."""
+        return op.input_nodes
+
+    def get_consumers(self, op: Operator) -> List[Operator]:
+        """Return the operators which take the operator as an input, in execution order."""
+        self.__update_index()
+        return list(self.__consumers.get(op.name, []))
 
     def find_node_by_op_type(self, op_type: str) -> List[Operator]:
         """Find nodes which op_type is specified by the argument.
@@ -19,57 +19,53 @@
 def sort_graph(graph):
     """Helper function to topologically sort a given graph.
 
+    The order is cached in the graph until operators or their connections change,
+    see `Graph.execution_order`.
+
     Args:
         graph (Graph): The input graph to be sorted. It is not modified.
 
     Returns:
         list(Operator): A list of Operator. Each element of the list is a reference to
             a Operator object.
-    
-    """
-    exec_list = list()
-    input_nodes = list()
-    for node in graph.operators:
-        input_nodes += [n.name for n in node.input_nodes]
-
-    output_nodes = list()
-    for node in graph.operators:
-        if node not in input_nodes:
-            output_nodes.append(node)
-
-    visited = {}
-    for node in graph.operators:
-        visited[node.name] = False
-
-    for node in output_nodes:
-        top_order(node, exec_list, visited)
 
-    return exec_list
+    """
+    return graph.execution_order
 
 
 def top_order(output_node, exec_list, visited):
     """It topologically sorts a given graph.
 
+    This is an iterative depth first search, so that deep graphs don't hit the recursion limit.
+
     Args:
         output_node (Operator): The starting node. First one in the ordered list.
         exec_list (list[operator]): The ordered list. Note that this is an output
             parameter.
-        visited: (list[str]): List of already visited nodes.
-    
+        visited: (dict[str, bool]): Whether each node is already visited. Note that this is
+            also an output parameter.
+
     """
-    if visited[output_node.name]:
+    if visited.get(output_node.name):
         return
-    for input_node in output_node.input_nodes:
-        top_order(input_node, exec_list, visited)
-
-    exec_list.append(output_node)
     visited[output_node.name] = True
+    stack = [(output_node, iter(output_node.input_nodes))]
+    while stack:
+        node, inputs = stack[-1]
+        for input_node in inputs:
+            if not visited.get(input_node.name):
+                visited[input_node.name] = True
+                stack.append((input_node, iter(input_node.input_nodes)))
+                break
+        else:
+            stack.pop()
+            exec_list.append(node)
 
 
 def get_nodes_in_branch(starting_node, stop_node, node_list):
     """Helper function that gives us all nodes in a branch defined by a given node.
        The starting node will be the output node of the branch.
-    
+
        Note that there is an optional stop node. stop_node is allowed to be None.
 
     Args:
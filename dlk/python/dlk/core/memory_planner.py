@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 The Blueoil Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+"""Static memory planner for the outputs of the operators in the generated network.
+
+Each output of a non variable operator is a buffer, live from the operator writing it
+to the last operator reading it in the execution order. All buffers are placed into a
+single arena with the greedy by size strategy: the largest buffers are placed first,
+each one into the smallest gap that fits between the buffers with overlapping live ranges.
+The output of a `Reshape` shares the buffer of its input, as the reshape does not change
+the memory layout.
+"""
+from typing import Dict, List, Optional
+
+from core.data_types import QUANTIZED_PACKED
+from core.graph import Graph
+from core.operators import Operator
+
+ARENA_ALIGNMENT = 64
+
+
+def _align(size: int) -> int:
+    return -(-size // ARENA_ALIGNMENT) * ARENA_ALIGNMENT
+
+
+def buffer_names(op: Operator) -> List[str]:
+    """Return the buffer names of the outputs of the operator, as named in the generated code."""
+    keys = list(op.output_ops.keys())
+    if len(keys) > 1:
+        return [op.name + '_' + k for k in keys]
+    return [op.name for _ in keys]
+
+
+def buffer_size(op: Operator) -> int:
+    """Return the size in bytes of an output buffer of the operator."""
+    if op.dtype == QUANTIZED_PACKED():
+        # one bit per element, in whole 64 bit words at most.
+        return -(-op.size // 64) * 8
+    try:
+        itemsize = op.dtype.nptype()().itemsize
+    except NotImplementedError:
+        itemsize = 8
+    return op.size * itemsize
+
+
+class TensorBuffer(object):
+    """An output buffer of an operator.
+
+    Args:
+        name (str): Buffer name in the generated code.
+        op (Operator): Operator writing the buffer.
+        size (int): Size in bytes.
+        first (int): Index of the operator writing the buffer in the execution order.
+        last (int): Index of the last operator reading the buffer in the execution order.
+
+    """
+
+    def __init__(self, name: str, op: Operator, size: int, first: int, last: int) -> None:
+        self.name = name
+        self.op = op
+        self.size = size
+        self.first = first
+        self.last = last
+        self.offset: Optional[int] = None
+        self.alias_of: Optional['TensorBuffer'] = None
+
+    def overlaps(self, other: 'TensorBuffer') -> bool:
+        return self.first <= other.last and other.first <= self.last
+
+
+class MemoryPlan(object):
+    """Offsets of the output buffers in one arena.
+
+    Args:
+        buffers (list[TensorBuffer]): All buffers in the execution order, with offsets assigned.
+
+    """
+
+    def __init__(self, buffers: List[TensorBuffer]) -> None:
+        self.buffers = buffers
+        self.offsets: Dict[str, int] = {b.name: b.offset for b in buffers}
+
+    @property
+    def arena_size(self) -> int:
+        """Size in bytes of the arena."""
+        return max([b.offset + _align(b.size) for b in self.buffers], default=0)
+
+    @property
+    def unplanned_size(self) -> int:
+        """Size in bytes when every buffer is allocated separately."""
+        return sum(b.size for b in self.buffers)
+
+    @property
+    def peak_live_size(self) -> int:
+        """Max of the total size of the buffers live at the same time, the lower bound of the arena size."""
+        roots = [b for b in self.buffers if b.alias_of is None]
+        steps = {b.first for b in roots}
+        return max([sum(_align(b.size) for b in roots if b.first <= s <= b.last) for s in steps], default=0)
+
+    def report(self) -> str:
+        """Return a summary of the activation memory."""
+        return '\n'.join([
+            f'activation buffers: {len(self.buffers)}',
+            f'activation memory without planning: {self.unplanned_size / 1024:.1f} KiB',
+            f'activation memory with planning: {self.arena_size / 1024:.1f} KiB '
+            f'(lower bound {self.peak_live_size / 1024:.1f} KiB)',
+        ])
+
+
+def _live_buffers(graph: Graph) -> List[TensorBuffer]:
+    operations = graph.non_variables
+    order = {op.name: idx for idx, op in enumerate(operations)}
+    end = len(operations)
+    buffers: Dict[str, TensorBuffer] = {}
+    result = []
+
+    for idx, op in enumerate(operations):
+        size = buffer_size(op)
+        for name, consumers in zip(buffer_names(op), op.output_ops.values()):
+            # outputs read by a variable, i.e. the graph output, are live until the end.
+            last = max([order.get(c.name, end) for c in consumers], default=idx)
+            buf = TensorBuffer(name, op, size, idx, last)
+            buffers[name] = buf
+            result.append(buf)
+
+        if op.op_type == 'Reshape' and len(result) > 0 and result[-1].op is op:
+            src = op.input_ops['data']
+            root = buffers.get(src.name)
+            buf = result[-1]
+            if root is not None and src.dtype == op.dtype and root.size == buf.size:
+                while root.alias_of is not None:
+                    root = root.alias_of
+                buf.alias_of = root
+                root.last = max(root.last, buf.last)
+
+    return result
+
+
+def plan_memory(graph: Graph) -> MemoryPlan:
+    """Assign offsets in one arena to the output buffers of the non variable operators.
+
+    Args:
+        graph (Graph): Graph to plan.
+
+    Returns:
+        MemoryPlan: The offsets and the sizes.
+
+    """
+    buffers = _live_buffers(graph)
+    placed: List[TensorBuffer] = []
+
+    for buf in sorted((b for b in buffers if b.alias_of is None), key=lambda b: (-b.size, b.first)):
+        best_offset = None
+        best_gap = None
+        offset = 0
+        for other in sorted((p for p in placed if p.overlaps(buf)), key=lambda p: p.offset):
+            gap = other.offset - offset
+            if gap >= buf.size and (best_gap is None or gap < best_gap):
+                best_offset, best_gap = offset, gap
+            offset = max(offset, other.offset + _align(other.size))
+
+        buf.offset = offset if best_offset is None else best_offset
+        placed.append(buf)
+
+    for buf in buffers:
+        if buf.alias_of is not None:
+            buf.offset = buf.alias_of.offset
+
+    return MemoryPlan(buffers)
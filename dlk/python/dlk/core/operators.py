@@ -42,6 +42,9 @@ class Operator(object):
     _input_names: List[str] = ['input']
     _output_names: List[str] = ['output']
 
+    # incremented whenever inputs or outputs of any operator change, to invalidate orders cached by graphs.
+    _connection_version: int = 0
+
     def __init__(self,
                  name: str,
                  shape: List[int],
@@ -53,13 +56,19 @@ class Operator(object):
         self._input_ops: Ops = input_ops
         self._output_ops: OutOps = {}
         self._dtype = dtype
-        self._data = np.zeros(shape, dtype=dtype.nptype())
+        # allocated lazily, as most operators only need the shape and dtype.
+        self._data: Optional[np.ndarray] = None
         self.update_shape(shape, dimension_format)
         self.view: View = View(self)
         self.__connect_to_outputs()
         self._check_consistency()
         self._rank = len(shape)
-        self._available_buffer = ''
+        Operator._connections_changed()
+
+    @staticmethod
+    def _connections_changed() -> None:
+        """Notify that connections between operators have changed."""
+        Operator._connection_version += 1
 
     def update_shape(self, shape: List[int], dimension_format: str) -> None:
         self._shape: List[int] = shape
@@ -232,6 +241,7 @@ class Operator(object):
         """
         self._assert(ident in self._input_names, "Illegal input name")
         self._input_ops[ident] = node
+        Operator._connections_changed()
 
     def add_inputs(self, inputs: Ops) -> None:
         """Add input (possibly multiple) nodes at a once.
@@ -243,6 +253,7 @@ class Operator(object):
         """
         assert set(inputs.keys()).issubset(set(self._input_names)), "Illegal output names included"
         self._input_ops.update(inputs)
+        Operator._connections_changed()
 
     def add_output(self, ident: str, node: 'Operator') -> None:
         """Add output node.
@@ -258,6 +269,7 @@ class Operator(object):
             lst.append(node)
         else:
             self._output_ops[ident] = [node]
+        Operator._connections_changed()
 
     def add_outputs(self, outputs: OutOps) -> None:
         """Add output (possibly multiple) nodes at a once.
@@ -277,6 +289,7 @@ class Operator(object):
                 self._output_ops[n] = list(outputs[n])
 
         self._output_ops.update(outputs)
+        Operator._connections_changed()
 
     def remove_input(self, ident: str) -> None:
         """Remove an input node.
@@ -287,6 +300,7 @@ class Operator(object):
 
         """
         self._input_ops.pop(ident)
+        Operator._connections_changed()
 
     def remove_output(self, ident: str) -> None:
         """Remove an output node.
@@ -297,6 +311,7 @@ class Operator(object):
 
         """
         self._output_ops.pop(ident)
+        Operator._connections_changed()
 
     @property
     def shape(self) -> List[int]:
@@ -388,14 +403,6 @@ class Operator(object):
     def rank(self) -> int:
         return self._rank
 
-    @property
-    def available_buffer(self) -> str:
-        return self._available_buffer
-
-    @available_buffer.setter
-    def available_buffer(self, v: str) -> None:
-        self._available_buffer = v
-
     def transpose(self, perm: List[int]) -> None:
         """Transpose the shape and format. This operation is destructive."""
         self._assert(len(set(perm)) == len(self._shape), "Illegal permutation specified.")
@@ -417,9 +424,16 @@ class Operator(object):
         """Get the output data.
 
         This value is valid only after `run_forward()` or some value has assigned with the setter.
+        Otherwise zeros are allocated on the first access.
         """
+        if self._data is None:
+            self._data = np.zeros(self._shape, dtype=self._dtype.nptype())
         return self._data
 
+    @data.setter
+    def data(self, val: np.ndarray) -> None:
+        self._data = val
+
     @property
     def is_monotonic(self) -> bool:
         raise NotImplementedError(f'operator {self.name} is monotonic or not?')
@@ -467,9 +481,9 @@ class Variable(Operator):
                  shape: List[int],
                  dtype: DataType,
                  input_ops: Ops,
-                 data: np.ndarray,
+                 data: Optional[np.ndarray],
                  dimension_format: str = 'NHWC') -> None:
-        """Init the variable."""
+        """Init the variable. If data is None, zeros are allocated on the first access."""
         super().__init__(name, shape, dtype, input_ops, dimension_format=dimension_format)
         self._data = data
 
@@ -485,16 +499,8 @@ class Variable(Operator):
     def transpose(self, perm: List[int]) -> None:
         """Transpose the shape and format. This operation is destructive."""
         super().transpose(perm)
-        self._data = self._data.transpose(perm)
-
-    @property
-    def data(self) -> np.ndarray:
-        """Return data."""
-        return self._data
-
-    @data.setter
-    def data(self, val: np.ndarray) -> None:
-        self._data = val
+        if self._data is not None:
+            self._data = self._data.transpose(perm)
 
     @property
     def preserve_quantization(self) -> bool:
@@ -513,8 +519,7 @@ class Input(Variable):
                  dtype: DataType,
                  dimension_format: str = 'NHWC') -> None:
         """Init the input variable."""
-        data = np.zeros(shape, dtype=dtype.nptype())
-        super().__init__(name, shape, dtype, {}, data, dimension_format=dimension_format)
+        super().__init__(name, shape, dtype, {}, None, dimension_format=dimension_format)
 
 
 class Constant(Variable):
@@ -598,8 +603,7 @@ class Output(Variable):
                  dimension_format: str = ''
                  ) -> None:
         """Init the output variable."""
-        data = np.zeros(shape, dtype=dtype.nptype())
-        super().__init__(name, shape, dtype, input_ops, data, dimension_format=dimension_format)
+        super().__init__(name, shape, dtype, input_ops, None, dimension_format=dimension_format)
 
     def _check_consistency(self) -> None:
         super()._check_consistency()
@@ -3174,3 +3178,90 @@ class BatchNormalizationOptimized(Operator):
     @property
     def preserve_quantization(self) -> bool:
         return False
+
+
+class ElementwiseChain(Operator):
+    """Chain of elementwise operators fused into one operator.
+
+    Created by `pass_fuse_elementwise` from a chain of `BatchNormalizationOptimized`,
+    `Relu`, `LeakyRelu`, `Add`, `Mul` and `Maximum`, so that the chain is computed
+    in one pass over the input without intermediate outputs.
+
+    Inputs
+    ------
+    X
+        The input tensor of the first operator in the chain.
+
+    operand1, ..., operand8
+        The other inputs of the operators in the chain. Each one is a scalar,
+        a tensor of size C or a tensor of the same shape as X.
+
+    Outputs
+    -------
+    Y
+        The output tensor of the same shape as X.
+
+    Attributes (optional constructor parameters)
+    ----------
+    fused_ops : list of tuple
+        The fused operators in order. Each one is a tuple of the operator type,
+        the input names of the operands and the attributes, e.g.
+        `('BatchNormalizationOptimized', ['operand1', 'operand2'], {})` or `('LeakyRelu', [], {'alpha': 0.1})`.
+
+    """
+
+    _input_names = ['X'] + [f'operand{i}' for i in range(1, 9)]
+    _output_names = ['Y']
+
+    def __init__(self,
+                 name: str,
+                 shape: List[int],
+                 dtype: DataType,
+                 input_ops: Ops,
+                 dimension_format: str = 'NHWC',
+                 fused_ops: Optional[List[Any]] = None) -> None:
+        """Init the elementwise chain operator."""
+        self.fused_ops = fused_ops or []
+        super().__init__(name, shape, dtype, input_ops, dimension_format=dimension_format)
+
+    def _check_consistency(self) -> None:
+        super()._check_consistency()
+        self._assert(self._input_ops['X'].shape == self.shape,
+                     f'Shape mismatch at {self.op_type} "{self.name}"')
+        for op_type, operands, _ in self.fused_ops:
+            for k in operands:
+                self._assert(k in self._input_ops, f'{op_type} in {self.op_type} "{self.name}" lacks input {k}')
+
+    def run_forward(self) -> np.ndarray:
+        x = self.input_ops['X'].data
+        for op_type, operands, attrs in self.fused_ops:
+            args = [self.input_ops[k].data for k in operands]
+            if op_type == 'BatchNormalizationOptimized':
+                x = x * args[0] + args[1]
+            elif op_type == 'Relu':
+                x = np.maximum(x, 0)
+            elif op_type == 'LeakyRelu':
+                x = np.maximum(x * attrs['alpha'], x)
+            elif op_type == 'Add':
+                x = x + args[0]
+            elif op_type == 'Mul':
+                x = x * args[0]
+            elif op_type == 'Maximum':
+                x = np.maximum(x, args[0])
+            else:
+                raise ValueError(f'{op_type} is not supported in {self.op_type}.')
+
+        self._data = x
+        return self._data
+
+    @property
+    def _dispatch_name(self) -> str:
+        return type(self).__name__
+
+    @property
+    def is_monotonic(self) -> bool:
+        return False
+
+    @property
+    def preserve_quantization(self) -> bool:
+        return False
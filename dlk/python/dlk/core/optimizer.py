@@ -14,17 +14,18 @@
 # limitations under the License.
 # =============================================================================
 """Module of optimization passes."""
-import math
+import time
 import warnings
-from collections import defaultdict
-from typing import Any, List, cast
+from collections import defaultdict, namedtuple
+from typing import Any, Callable, List, Optional, cast
 
 import numpy as np
 
-from core.data_types import QUANTIZED_NOT_PACKED, QUANTIZED_PACKED, QUANTIZED_PACKED_KERNEL, Int32, PackedUint32, Uint32
+from core.data_types import QUANTIZED_NOT_PACKED, QUANTIZED_PACKED, QUANTIZED_PACKED_KERNEL, Float32, Int32, \
+    PackedUint32, Uint32
 from core.graph import Graph
 from core.graph_pattern_matching import get_nodes_in_branch, sort_graph
-from core.operators import Constant, Conv, Lookup, Operator, BatchNormalizationOptimized
+from core.operators import Constant, Conv, Lookup, Operator, BatchNormalizationOptimized, ElementwiseChain
 from modules.packer import Packer
 
 
@@ -90,38 +91,30 @@ def pass_constant_folding(graph: Graph) -> None:
     """Given a node N, if the value of each input of N is known at compilation time then N will be executed.
        The node N and its inputs will be replaced with a Constant node which holds the computed output of N.
 
+       After the first sweep, only the consumers of folded nodes are checked again.
+
     Args:
         graph (Graph): The input graph. It will be modified in-place.
-        processed_nodes (list): The list of the processed nodes so far.
     
     """
 
-    done = False
-    processed_nodes = []
-    while not done:
-        exec_list = sort_graph(graph)
-        processed_before_precompute = len(processed_nodes)
-        to_be_removed = []
+    def precomputable(m: Operator) -> bool:
+        # We want operators with inputs
+        return bool(m.input_nodes) and all(n.op_type == 'Constant' for n in m.input_nodes)
+
+    # worklist of nodes whose inputs have changed since they were checked.
+    candidates = set(graph.operators)
+    while candidates:
+        exec_list = graph.execution_order
+        to_be_removed: List[Operator] = []
 
         for m in exec_list:
-            if m in processed_nodes:
+            if m not in candidates:
                 continue
-
-            # We want operators with inputs
-            if not m.input_nodes:
+            candidates.discard(m)
+            if not precomputable(m):
                 continue
 
-            precomputable = True
-            for input_node in m.input_nodes:
-                if input_node.op_type != 'Constant':
-                    precomputable = False
-
-            if not precomputable:
-                continue
-
-            processed_nodes += m.input_nodes
-            processed_nodes.append(m)
-
             data = m.run_forward()
 
             new_constant = Constant(
@@ -141,12 +134,12 @@ def pass_constant_folding(graph: Graph) -> None:
                     for input_name, input_node in consumer_node.input_ops.items():
                         if input_node == m:
                             consumer_node.add_input(input_name, new_constant)
+                            candidates.add(consumer_node)
                             break
 
         for op in to_be_removed:
             graph.remove_op(op)
-
-        done = len(processed_nodes) == processed_before_precompute
+        candidates.intersection_update(graph.operators)
 
 
 def pass_propagate_quantization_details_into_conv(graph: Graph) -> None:
@@ -216,6 +209,55 @@ def pass_propagate_quantization_details_into_conv(graph: Graph) -> None:
                 quant_details[m.name] = []
 
 
+def _compute_threshold_table(path: List[Operator], n: int, max_v: float, scaling_factor: Any,
+                             ch: int) -> np.ndarray:
+    """Compute thresholds of all channels from the output values of a quantized convolution.
+
+    Args:
+        path (list[Operator]): Operators from the activation quantizer to the one next to the convolution.
+        n (int): The number of thresholds, `2 ** nbit - 1`.
+        max_v (float): The max value of the activation quantizer.
+        scaling_factor: Scaling factor of the weight quantizer, a scalar or an array of [ch].
+        ch (int): The number of channels.
+
+    Returns:
+        np.ndarray: The threshold table of [ch, n + 1]. The last column is 1 when the thresholds are
+            increasing or all the same, otherwise -1.
+
+    """
+    # assume that the threshold values will be a 13-bit signed integer
+    max_th_value = 2 ** 12 - 1
+
+    # run calculation of all thresholds (t0, t1, t2) in reverse order, for example, q -> bn -> scaling
+    init_threshold = np.repeat(0.5 + np.arange(n, dtype=np.float64)[:, np.newaxis], ch, axis=1)
+    bn_nega = np.zeros(ch, dtype=np.bool_)
+    trans_th = {'data': init_threshold}
+    for op in path:
+        trans_th = op.de_run(**trans_th)
+        if op.op_type == 'BatchNormalization':
+            bn_nega_idx = np.flatnonzero(op.input_ops['scale'].data < 0)
+            bn_nega = np.zeros(ch, dtype=np.bool_)
+            bn_nega[bn_nega_idx[bn_nega_idx < ch]] = True
+    threshold = (trans_th['data'] * np.float64(n)) / (np.float64(max_v) * scaling_factor)
+    threshold = np.broadcast_to(threshold, (n, ch))
+
+    # take care of threshold values that are larger than 13-bit signed integer
+    threshold = np.clip(threshold, -max_th_value, max_th_value)
+    if np.isnan(threshold).any():
+        raise ValueError('cannot convert float NaN to integer')
+
+    threshold_table = np.empty([ch, n + 1], dtype=np.int32)
+    round_down = (np.asarray(scaling_factor) < 0) ^ bn_nega
+    threshold_table[:, :-1] = np.where(round_down, np.floor(threshold), np.ceil(threshold)).T
+
+    increasing = np.all(threshold_table[:, 1:-1] > threshold_table[:, :-2], axis=1)
+    constant = np.all(threshold_table[:, 1:-1] == threshold_table[:, :-2], axis=1)
+    threshold_table[:, -1] = np.where(increasing | constant, 1, -1)
+    threshold_table[constant, 0:-1] = max_th_value
+
+    return threshold_table
+
+
 def pass_compute_thresholds(graph: Graph) -> None:
     """Given a Quantizer node Q:
          - if there is a backward path between Q and a convolution node and,
@@ -269,47 +311,7 @@ def pass_compute_thresholds(graph: Graph) -> None:
 
         n = 2 ** nbit - 1
         ch = conv_node.channel
-        # assume that the threshold values will be a 13-bit signed integer
-        max_th_value = 2 ** 12 - 1
-
-        # The threshold_table is numpy array that holds the threshold values for all channels
-        threshold_table = np.empty([ch, n + 1], dtype=np.int32)
-
-        # Compute threshold (t0, t1, t2)
-        th_val = [0.5 + i for i in range(n)]
-        for th_id, th_v in enumerate(th_val):
-            init_threshold = np.full(ch, th_v, dtype=np.float64)
-
-            # run calculation in reverse order, for example, q -> bn -> scaling
-            bn_nega_idx = []
-            trans_th = {'data': init_threshold}
-            for op in p[:-1]:
-                trans_th = op.de_run(**trans_th)
-                if op.op_type == 'BatchNormalization':
-                    bn_scale = op.input_ops['scale'].data
-                    bn_nega_idx = [v for v in range(len(bn_scale)) if bn_scale[v] < 0]
-            threshold = (trans_th['data'] * np.float64(n)) / (np.float64(max_v) * scaling_factor)
-
-            # take care of threshold values that are larger than 13-bit signed integer
-            threshold[threshold > max_th_value] = max_th_value
-            threshold[threshold < -max_th_value] = -max_th_value
-
-            for ch_id, th_per_ch in enumerate(threshold):
-                if quantizer_conv_weights.op_type == 'BinaryChannelWiseMeanScalingQuantizer':
-                    threshold_table[ch_id, th_id] = int(math.floor(th_per_ch)) \
-                        if (scaling_factor[ch_id] < 0) ^ (ch_id in bn_nega_idx) \
-                        else int(math.ceil(th_per_ch))
-                else:
-                    threshold_table[ch_id, th_id] = int(math.floor(th_per_ch)) \
-                        if (scaling_factor < 0) ^ (ch_id in bn_nega_idx) \
-                        else int(math.ceil(th_per_ch))
-
-        for c in range(ch):
-            threshold_table[c, -1] = 1 \
-                if np.all(threshold_table[c, 1:-1] > threshold_table[c, :-2], axis=0) else -1
-            if np.all(threshold_table[c, 1:-1] == threshold_table[c, :-2], axis=0):
-                threshold_table[c, -1] = 1
-                threshold_table[c, 0:-1] = max_th_value
+        threshold_table = _compute_threshold_table(p[:-1], n, max_v, scaling_factor, ch)
 
         bits_per_word = 32
         rem = (bits_per_word - ch % bits_per_word) % bits_per_word
@@ -605,16 +607,13 @@ def pass_lookup(graph: Graph) -> None:
         lu_bitwidth = quantizer.nbit
         packer = Packer(lu_bitwidth, word_size)
 
-        lsb = np.zeros((256,), np.uint32)
-        msb = np.zeros((256,), np.uint32)
-
-        idx = 0
-        for p in qtz_data:
-            data = packer.run(p.astype(np.float32), p.shape).flatten()
-            lsb[idx] = data[0]
-            msb[idx] = data[1]
-
-            idx += 1
+        # pack all rows at once. padding each row to whole words keeps the words of rows apart.
+        rows = qtz_data.reshape(len(qtz_data), -1).astype(np.float32)
+        padded_rows = np.zeros((len(rows), -(-rows.shape[1] // word_size) * word_size), dtype=np.float32)
+        padded_rows[:, :rows.shape[1]] = rows
+        data = packer.run(padded_rows).reshape(len(rows), -1)
+        lsb = np.ascontiguousarray(data[:, 0])
+        msb = np.ascontiguousarray(data[:, 1])
 
         pe_lsb = Constant('pe_lsb_new', QUANTIZED_PACKED_KERNEL(), lsb,
                           dimension_format='TC', packed=True, actual_shape=[256, word_size])
@@ -727,3 +726,165 @@ def pass_simplify_batchnorm(graph: Graph) -> None:
 
     for node in to_be_removed:
         graph.remove_op(node)
+
+
+_FUSIBLE_ELEMENTWISE = {'BatchNormalizationOptimized', 'Relu', 'LeakyRelu', 'Add', 'Mul', 'Maximum'}
+
+
+def _main_input_key(node: Operator, prev: Operator) -> Optional[str]:
+    """Return the input name of `node` which takes `prev`, if `node` can follow `prev` in an elementwise chain."""
+    if node.op_type not in _FUSIBLE_ELEMENTWISE or node.dtype != Float32() or node.shape != prev.shape \
+            or not node.dimension.endswith('C') or len(node.output_ops) != 1:
+        return None
+
+    keys = [k for k, v in node.input_ops.items() if v is prev]
+    if len(keys) != 1 or (node.op_type == 'BatchNormalizationOptimized' and keys[0] != 'X'):
+        return None
+
+    channels = node.shape[-1]
+    for k, operand in node.input_ops.items():
+        if k == keys[0]:
+            continue
+        if operand.dtype != Float32() or operand.op_type == 'Split':
+            return None
+        if operand.op_type == 'Constant':
+            if not (operand.size == 1 or (operand.size == channels and operand.shape[-1] == channels)
+                    or operand.shape == node.shape):
+                return None
+        elif operand.shape != node.shape:
+            return None
+
+    return keys[0]
+
+
+def pass_fuse_elementwise(graph: Graph) -> None:
+    """Fuse chains of elementwise operators following Conv or Add into ElementwiseChain.
+
+    A chain is a sequence of `BatchNormalizationOptimized`, `Relu`, `LeakyRelu`, `Add`, `Mul`
+    and `Maximum` in float, each one of which takes the previous one as the only consumer.
+    The fused operator computes the chain in one pass without the intermediate outputs.
+
+    Args:
+        graph (Graph): The input graph. It will be modified in-place.
+
+    """
+    max_operands = len(ElementwiseChain.input_names) - 1
+    fused = set()
+
+    for node in sort_graph(graph):
+        if node.name in fused or node.op_type not in _FUSIBLE_ELEMENTWISE:
+            continue
+
+        heads = [v for v in node.input_ops.values() if v.op_type in {'Conv', 'Add'} and v.name not in fused]
+        head = next((v for v in heads if _main_input_key(node, v) is not None), None)
+        if head is None:
+            continue
+
+        chain = [node]
+        chain_names = {node.name}
+        num_operands = len(node.input_ops) - 1
+        while len(chain[-1].output_op_list) == 1:
+            prev, nxt = chain[-1], chain[-1].output_op_list[0]
+            if _main_input_key(nxt, prev) is None or num_operands + len(nxt.input_ops) - 1 > max_operands \
+                    or any(v.name in chain_names for v in nxt.input_ops.values() if v is not prev):
+                break
+            chain.append(nxt)
+            chain_names.add(nxt.name)
+            num_operands += len(nxt.input_ops) - 1
+
+        if len(chain) < 2:
+            continue
+
+        # collect operands and the op list
+        inputs = {'X': head}
+        ops = []
+        prev = head
+        for op in chain:
+            main_key = _main_input_key(op, prev)
+            operand_keys = []
+            for k, v in op.input_ops.items():
+                if k != main_key:
+                    key = f'operand{len(inputs)}'
+                    inputs[key] = v
+                    operand_keys.append(key)
+            attrs = {'alpha': op.alpha} if op.op_type == 'LeakyRelu' else {}
+            ops.append((op.op_type, operand_keys, attrs))
+            prev = op
+
+        # disconnect the chain from its inputs
+        for op in chain:
+            for v in op.input_ops.values():
+                for consumers in v.output_ops.values():
+                    consumers[:] = [c for c in consumers if c is not op]
+
+        last = chain[-1]
+        new_op = ElementwiseChain(
+            last.name + '_fused',
+            last.shape,
+            last.dtype,
+            inputs,
+            dimension_format=last.dimension,
+            fused_ops=ops
+        )
+
+        for op in last.output_op_list:
+            for k, v in op.input_ops.items():
+                if v is last:
+                    op.add_input(k, new_op)
+            new_op.add_output('Y', op)
+
+        graph.add_op(new_op)
+        for op in chain:
+            graph.remove_op(op)
+            fused.add(op.name)
+
+
+PassProfile = namedtuple('PassProfile', ['name', 'seconds', 'num_ops_before', 'num_ops_after'])
+
+
+class PassManager(object):
+    """Run optimization passes on a graph in order.
+
+    Args:
+        passes (list): Optimization passes, functions which take a graph and modify it in-place.
+        profile (bool): Record wall time and the number of operators before and after each pass.
+
+    """
+
+    def __init__(self, passes: List[Callable[[Graph], None]] = None, profile: bool = False) -> None:
+        self.passes: List[Callable[[Graph], None]] = list(passes or [])
+        self.profile = profile
+        self.profiles: List[PassProfile] = []
+
+    def add_pass(self, optimization_pass: Callable[[Graph], None]) -> None:
+        self.passes.append(optimization_pass)
+
+    def run(self, graph: Graph) -> None:
+        """Run all passes on the graph.
+
+        Args:
+            graph (Graph): The input graph. It will be modified in-place.
+
+        """
+        for optimization_pass in self.passes:
+            if not self.profile:
+                optimization_pass(graph)
+                continue
+
+            num_ops_before = len(graph.operators)
+            start = time.perf_counter()
+            optimization_pass(graph)
+            seconds = time.perf_counter() - start
+            self.profiles.append(PassProfile(optimization_pass.__name__, seconds, num_ops_before,
+                                             len(graph.operators)))
+
+    def report(self) -> str:
+        """Return a table of the recorded profiles."""
+        name_width = max([len('pass')] + [len(p.name) for p in self.profiles])
+        lines = [f'{"pass":<{name_width}}  {"time [ms]":>10}  {"ops":>6}  {"delta":>6}']
+        for p in self.profiles:
+            lines.append(f'{p.name:<{name_width}}  {p.seconds * 1000:>10.1f}  {p.num_ops_after:>6}  '
+                         f'{p.num_ops_after - p.num_ops_before:>+6}')
+        total = sum(p.seconds for p in self.profiles)
+        lines.append(f'{"total":<{name_width}}  {total * 1000:>10.1f}')
+        return '\n'.join(lines)
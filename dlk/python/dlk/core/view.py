@@ -22,7 +22,6 @@ from core.data_types import *
 class View(object):
     def __init__(self, op):
         self.op = op
-        self.reuse_buffer_str = ''
 
     @property
     def rank(self):
@@ -44,24 +43,6 @@ class View(object):
         input_ops = op.input_ops
         output_ops = op.output_ops
         inputs_string = self.inputs_to_string(op, input_ops)
-        shape_string = self.shape_to_string(op.shape)
-
-        if op.available_buffer != '':
-            if len(op.output_ops.keys()) > 1:
-                op_name = op.name + '_' + str(list(op.output_ops.keys())[0])
-            else:
-                op_name = op.name
-
-            shape_string = self.shape_to_string(op.shape, channel_active=True)
-
-            self.reuse_buffer_str = (
-                f"""
-                TensorView<{op.dtype.cpptype()}, MemoryLayout::{op.dimension}>::tensor_info_t<std::size_t>"""
-                f""" {op_name}_shape = {{ {shape_string} }};
-                TensorView<{op.dtype.cpptype()}, MemoryLayout::{op.dimension}>"""
-                f""" {op_name}({op.available_buffer}_raw, {op_name}_shape);
-                """
-            )
 
         if self.op.op_type == 'BinaryMeanScalingQuantizer':
             if len(input_ops) != 1:
@@ -435,12 +416,11 @@ class View(object):
             in_shape = input_ops['data'].shape
             out_shape = op.shape
 
-            shape_string = self.shape_to_string(op.shape)
-
             return self.format_string(
                 f"""
                 // Reshape from {in_shape} to {out_shape}'
-                std::copy({input_ops["data"].name}.data(), {input_ops["data"].name}.data()"""
+                if ({input_ops["data"].name}.data() != {op.name}.data())
+                  std::copy({input_ops["data"].name}.data(), {input_ops["data"].name}.data()"""
                 f""" + {input_ops["data"].name}.size(), {op.name}.data());
                 """
             )
@@ -462,7 +442,6 @@ class View(object):
                 self.raise_invalid_args_exception(op, input_ops, output_ops)
 
             inputs_string = self.inputs_to_string(op, input_ops)
-            shape_string = self.shape_to_string(op.shape)
 
             bs = op.block_size
             x_op = input_ops['input']
@@ -493,7 +472,6 @@ class View(object):
                 self.raise_invalid_args_exception(op, input_ops, output_ops)
 
             inputs_string = self.inputs_to_string(op, input_ops)
-            shape_string = self.shape_to_string(op.shape)
 
             number_of_inputs = len(input_ops)
             concat_input = {}
@@ -600,6 +578,52 @@ class View(object):
 
             return self.format_string(f"""func_Lookup({inputs_string}, {op.name});""")
 
+        elif self.op.op_type == 'ElementwiseChain':
+            x_name = self.inputs_to_string(op, {'X': input_ops['X']})
+            size = op.size
+            channels = op.shape[-1]
+
+            def operand(key):
+                in_op = input_ops[key]
+                name = self.inputs_to_string(op, {key: in_op})
+                if in_op.size == 1:
+                    return f'{name}.data()[0]'
+                elif in_op.size == size:
+                    return f'{name}.data()[i]'
+                return f'{name}.data()[c]'
+
+            lines = []
+            for op_type, operands, attrs in op.fused_ops:
+                args = [operand(k) for k in operands]
+                if op_type == 'BatchNormalizationOptimized':
+                    lines.append(f'v = v * {args[0]} + {args[1]};')
+                elif op_type == 'Relu':
+                    lines.append('v = std::max(v, T_FLOAT(0));')
+                elif op_type == 'LeakyRelu':
+                    lines.append(f'v = std::max(v, v * {attrs["alpha"]}f);')
+                elif op_type == 'Add':
+                    lines.append(f'v = v + {args[0]};')
+                elif op_type == 'Mul':
+                    lines.append(f'v = v * {args[0]};')
+                elif op_type == 'Maximum':
+                    lines.append(f'v = std::max(v, {args[0]});')
+                else:
+                    raise TypeError(f"{op_type} is not supported in {op.op_type}.")
+            body = '\n'.join(' ' * 18 + line for line in lines)
+
+            return self.format_string(
+                f"""
+                Measurement::Start("ElementwiseChain");
+                for (std::size_t i = 0; i < {size}; ++i) {{
+                  const std::size_t c = i % {channels};
+                  T_FLOAT v = {x_name}.data()[i];
+{body}
+                  {op.name}.data()[i] = v;
+                }}
+                Measurement::Stop();
+                """
+            )
+
         raise TypeError(f"{self.op.op_type} is not supported in View.run().")
 
     def render_alias(self, op, input_ops, output_ops):
@@ -610,8 +634,6 @@ class View(object):
 
     def format_string(self, string):
         string = dedent(string)
-        if self.reuse_buffer_str:
-            string = dedent(self.reuse_buffer_str) + '\n' + string
 
         def should_be_indent(line):
             return line != "" and line[0] != "#"
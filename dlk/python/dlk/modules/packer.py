@@ -37,16 +37,12 @@ class Packer:
         # generate powers of 2 (1,2,4,8....) here to pack binary values fast
         self.powers = np.power(2, np.arange(wordsize)).astype(np.uint32)
 
-    def _pack_to_word(self, v):
-        wordsize = self.wordsize
-        powers = self.powers
-        if v.size != wordsize:
-            powers = np.power(2, np.arange(v.size)).astype(np.uint32)
-        return np.dot(v, powers).astype(np.uint32)
-
     def run(self, tensor: np.ndarray, data_format: str = 'NHWC') -> np.ndarray:
         """Pack a tensor.
 
+        The flattened tensor is split into words of `wordsize` values, and the last word is padded with zeros.
+        Each word is packed into `bitwidth` bit-planes, the i-th of which has the i-th bits of the values.
+
         Args:
             tensor (np.ndarray): Input tensor.
             data_format (str): Order of dimension. This defaults to 'NHWC', where 'N' is
@@ -63,22 +59,21 @@ class Packer:
         if (tensor >= (2 ** self.bitwidth)).any():
             raise ValueError("all value of input tensor must be less than bit width ({})".format(self.bitwidth))
 
-        output_size = tensor.size // wordsize
-        output_size += 1 if tensor.size % wordsize != 0 else 0
-        output_size *= self.bitwidth
-
-        tensor_flat = tensor.flatten(order='C').astype(np.uint32)
-        output = np.zeros(output_size, dtype=np.uint32)
-        oi = 0
-        for i in range(0, tensor.size, wordsize):
-            if i + wordsize < tensor.size:
-                sliced_tensor = tensor_flat[i:i + wordsize]
-            else:
-                sliced_tensor = tensor_flat[i:]
-
-            for _ in range(0, self.bitwidth):
-                output[oi] = self._pack_to_word(np.bitwise_and(sliced_tensor, 1))
-                oi += 1
-                sliced_tensor = np.right_shift(sliced_tensor, 1)
+        num_words = -(-tensor.size // wordsize)
+        output_size = num_words * self.bitwidth
+
+        words = np.zeros(num_words * wordsize, dtype=np.uint32)
+        words[:tensor.size] = tensor.flatten(order='C').astype(np.uint32)
+        words = words.reshape(num_words, 1, wordsize)
+
+        # all bit-planes at once, the shape is [num_words, bitwidth, wordsize].
+        shifts = np.arange(self.bitwidth, dtype=np.uint32).reshape(1, self.bitwidth, 1)
+        bit_planes = np.bitwise_and(np.right_shift(words, shifts), 1).astype(np.uint8)
+
+        if wordsize == 32:
+            output = np.packbits(bit_planes, axis=-1, bitorder='little').view('<u4').astype(np.uint32)
+        else:
+            # bits over 32 are dropped, as `powers` wrap around to 0.
+            output = np.dot(bit_planes.astype(np.uint32), self.powers).astype(np.uint32)
 
         return output.reshape([1, output_size])
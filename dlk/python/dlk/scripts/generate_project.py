@@ -32,52 +32,61 @@ from core.optimizer import pass_remove_identities, pass_transpose, pass_constant
     pass_propagate_quantization_details_into_conv, pass_compute_thresholds, pass_pack_weights, \
     pass_quantize_convolutions, pass_propagate_datatypes, \
     pass_propagate_format, pass_propagate_output_type_backward, \
-    pass_lookup, pass_simplify_batchnorm
+    pass_lookup, pass_simplify_batchnorm, pass_fuse_elementwise, PassManager
 
 SCRITPS_DIR = path.abspath(path.dirname(__file__))
 DLK_ROOT_DIR = path.abspath(path.join(SCRITPS_DIR, '..'))
 ROOT_DIR = path.abspath(path.join(SCRITPS_DIR, '../../..'))
 
 
-def optimize_graph_step(graph: Graph, config: Config) -> None:
+def optimize_graph_step(graph: Graph, config: Config, profile_passes: bool = False) -> PassManager:
     """Optimizing graph that imported from tensorflow pb.
 
     Args:
         graph (Graph): Graph that optimization passes are applying to
         config (Config): Collection of configurations
+        profile_passes (bool): Record wall time and the number of operators of each pass
 
     Returns:
+        PassManager: Pass manager which has run the passes, and has the profiles if `profile_passes` is True
 
-    
     """
+    pass_manager = PassManager(profile=profile_passes)
 
-    pass_remove_identities(graph)
-    pass_transpose(graph)
+    pass_manager.add_pass(pass_remove_identities)
+    pass_manager.add_pass(pass_transpose)
 
     if config.activate_hard_quantization:
-        pass_lookup(graph)
-        pass_propagate_quantization_details_into_conv(graph)
+        pass_manager.add_pass(pass_lookup)
+        pass_manager.add_pass(pass_propagate_quantization_details_into_conv)
         if config.threshold_skipping:
-            pass_compute_thresholds(graph)
-        pass_pack_weights(graph)
-        pass_quantize_convolutions(graph)
+            pass_manager.add_pass(pass_compute_thresholds)
+        pass_manager.add_pass(pass_pack_weights)
+        pass_manager.add_pass(pass_quantize_convolutions)
 
     if config.threshold_skipping:
-        pass_propagate_output_type_backward(graph)
-    pass_propagate_datatypes(graph)
-    pass_propagate_format(graph)
+        pass_manager.add_pass(pass_propagate_output_type_backward)
+    pass_manager.add_pass(pass_propagate_datatypes)
+    pass_manager.add_pass(pass_propagate_format)
 
-    pass_constant_folding(graph)
-    pass_simplify_batchnorm(graph)
+    pass_manager.add_pass(pass_constant_folding)
+    pass_manager.add_pass(pass_simplify_batchnorm)
+    pass_manager.add_pass(pass_fuse_elementwise)
 
+    pass_manager.run(graph)
+    return pass_manager
 
-def generate_code_step(graph: Graph, config: Config) -> None:
+
+def generate_code_step(graph: Graph, config: Config) -> CodeGenerater:
     """Generate code for the model.
 
     Args:
         graph (Graph): Graph the code generation is based on
         config (Config): Collection of configurations
-    
+
+    Returns:
+        CodeGenerater: Code generator which has the memory plan of the network
+
     """
     params = Params(graph, config)
 
@@ -85,7 +94,6 @@ def generate_code_step(graph: Graph, config: Config) -> None:
                             params,
                             config)
 
-    builder.reuse_output_buffers()
     builder.generate_files_from_template()
     builder.generate_inputs()
 
@@ -95,6 +103,8 @@ def generate_code_step(graph: Graph, config: Config) -> None:
     if config.threshold_skipping:
         builder.generate_thresholds()
 
+    return builder
+
 
 def run(input_path: str,
         dest_dir_path: str,
@@ -102,7 +112,10 @@ def run(input_path: str,
         activate_hard_quantization: bool,
         threshold_skipping: bool = False,
         debug: bool = False,
-        cache_dma: bool = False):
+        cache_dma: bool = False,
+        profile_passes: bool = False,
+        const_blob: bool = False,
+        codegen_jobs: int = 1):
 
     output_dlk_test_dir = path.join(dest_dir_path, f'{project_name}.test')
     optimized_pb_path = path.join(dest_dir_path, f'{project_name}')
@@ -115,7 +128,9 @@ def run(input_path: str,
                     optimized_pb_path=optimized_pb_path,
                     output_pj_path=output_project_path,
                     debug=debug,
-                    cache_dma=cache_dma
+                    cache_dma=cache_dma,
+                    const_blob=const_blob,
+                    codegen_jobs=codegen_jobs
                     )
 
     dest_dir_path = path.abspath(dest_dir_path)
@@ -124,14 +139,21 @@ def run(input_path: str,
     click.echo('import pb file')
     io = TensorFlowIO()
     graph: Graph = io.read(input_path)
+    click.echo(f'peak memory after import: {utils.peak_memory_mb():.1f} MiB')
 
     click.echo('optimize graph step: start')
-    optimize_graph_step(graph, config)
+    pass_manager = optimize_graph_step(graph, config, profile_passes=profile_passes)
+    if profile_passes:
+        click.echo(pass_manager.report())
     click.echo('optimize graph step: done!')
+    click.echo(f'peak memory after optimization: {utils.peak_memory_mb():.1f} MiB')
 
     click.echo('generate code step: start')
-    generate_code_step(graph, config)
+    builder = generate_code_step(graph, config)
+    click.echo(builder.memory_plan.report())
+    click.echo(builder.file_time_report())
     click.echo(f'generate code step: done!')
+    click.echo(f'peak memory after code generation: {utils.peak_memory_mb():.1f} MiB')
 
 
 @click.command(context_settings=dict(help_option_names=['-h', '--help']))
@@ -179,13 +201,38 @@ def run(input_path: str,
     default=False,
     help="use cached DMA buffers",
 )
+@click.option(
+    "-blob",
+    "--const_blob",
+    is_flag=True,
+    default=False,
+    help="write constants into a binary blob instead of C++ source",
+)
+@click.option(
+    "--profile-passes",
+    "profile_passes",
+    is_flag=True,
+    default=False,
+    help="print wall time and the number of operators of each optimization pass",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    "codegen_jobs",
+    type=click.IntRange(min=1),
+    default=1,
+    help="number of processes generating the constant sources",
+)
 def main(input_path,
          output_path,
          project_name,
          activate_hard_quantization,
          threshold_skipping,
          debug,
-         cache_dma):
+         cache_dma,
+         profile_passes,
+         const_blob,
+         codegen_jobs):
 
     click.echo('start running')
     run(input_path=input_path,
@@ -194,7 +241,10 @@ def main(input_path,
         activate_hard_quantization=activate_hard_quantization,
         threshold_skipping=threshold_skipping,
         debug=debug,
-        cache_dma=cache_dma)
+        cache_dma=cache_dma,
+        profile_passes=profile_passes,
+        const_blob=const_blob,
+        codegen_jobs=codegen_jobs)
 
 
 if __name__ == '__main__':
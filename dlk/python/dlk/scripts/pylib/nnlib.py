@@ -24,6 +24,11 @@ class NNLib(object):
     def __init__(self):
         self.lib = None
         self.nnlib = None
+        self.input_shape = None
+        self.output_shape = None
+        self._input = None
+        self._batch_input = None
+        self._output_size = None
 
     def load(self, libpath):
         self.lib = ct.cdll.LoadLibrary(libpath)
@@ -64,7 +69,14 @@ class NNLib(object):
         return True
 
     def init(self):
-        return self.lib.network_init(self.nnlib)
+        result = self.lib.network_init(self.nnlib)
+        if result:
+            # cache shapes not to query them on each run.
+            self.input_shape = self.get_input_shape()
+            self.output_shape = self.get_output_shape()
+            self._input = np.zeros(int(np.prod(self.input_shape)), np.float32)
+            self._output_size = int(np.prod(self.output_shape))
+        return result
 
     def delete(self):
         if self.nnlib:
@@ -95,9 +107,41 @@ class NNLib(object):
 
         return tuple(s)
 
-    def run(self, tensor):
-        input = tensor.flatten().astype(np.float32)
-        output = np.zeros((self.get_output_shape()), np.float32)
+    def _input_of(self, tensor, buffer):
+        """Return `tensor` as C-contiguous float32 array, through `buffer` only when it needs conversion."""
+        tensor = np.asarray(tensor)
+        if tensor.size != buffer.size:
+            raise ValueError("Input size should be {}, but got {}.".format(buffer.size, tensor.size))
+
+        if tensor.dtype == np.float32 and tensor.flags["C_CONTIGUOUS"]:
+            return tensor
+
+        np.copyto(buffer.reshape(tensor.shape), tensor, casting="unsafe")
+        return buffer
+
+    def _output_of(self, output, size, shape):
+        if output is None:
+            return np.empty(shape, np.float32)
+
+        if output.dtype != np.float32 or not output.flags["C_CONTIGUOUS"] or output.size != size:
+            raise ValueError("Output should be C-contiguous float32 array of size {}.".format(size))
+        return output
+
+    def run(self, tensor, output=None):
+        """Run network of an input tensor.
+
+        Args:
+            tensor: Input tensor of `input_shape`. It's passed without copy when it is C-contiguous float32.
+            output: Optional float32 array of `output_shape` to write the result into.
+
+        Returns:
+            np.ndarray: Output tensor of `output_shape`.
+        """
+        if self.output_shape is None:
+            raise RuntimeError("init() should be called before run().")
+
+        input = self._input_of(tensor, self._input)
+        output = self._output_of(output, self._output_size, self.output_shape)
 
         self.lib.network_run(
             self.nnlib,
@@ -105,3 +149,37 @@ class NNLib(object):
             output)
 
         return output
+
+    def run_batch(self, tensors, output=None):
+        """Run network of N input tensors in one call.
+
+        Args:
+            tensors: Input tensors of [N, ...], each `tensors[i]` has the size of `input_shape`.
+            output: Optional float32 array of [N, ...] to write the results into.
+                It is allocated in shape of `(N,) + output_shape[1:]` when omitted.
+
+        Returns:
+            np.ndarray: Output tensors.
+        """
+        if self.output_shape is None:
+            raise RuntimeError("init() should be called before run_batch().")
+
+        tensors = np.asarray(tensors)
+        num = len(tensors)
+        input_size = self._input.size
+        output_size = self._output_size
+
+        if self._batch_input is None or self._batch_input.size != num * input_size:
+            self._batch_input = np.zeros(num * input_size, np.float32)
+        inputs = self._input_of(tensors, self._batch_input).reshape(num, input_size)
+
+        output = self._output_of(output, num * output_size, (num,) + tuple(self.output_shape[1:]))
+        outputs = output.reshape(num, output_size)
+
+        for i in range(num):
+            self.lib.network_run(
+                self.nnlib,
+                inputs[i],
+                outputs[i])
+
+        return output
@@ -21,12 +21,15 @@ from jinja2 import FileSystemLoader
 
 class Template(object):
 
+    # the number of rendered chunks joined before writing.
+    stream_buffer_size = 256
+
     def __init__(self, config):
         self.jinja = self._create_jinja()
         self.config = config
 
     def generate(self, template_path, export_dir, new_name=None, **feed_dict):
-        template_string = self.generate_string(template_path, **feed_dict)
+        template = self.jinja.get_template(template_path)
         template_path = template_path.replace('.tpl', '')
 
         if new_name is None:
@@ -35,7 +38,11 @@ class Template(object):
             template_name = new_name
 
         export_path = path.join(export_dir, template_name)
-        self._save_string_as_file(template_string, export_path)
+        # stream the rendered chunks into the file, not to build large constants as one string.
+        stream = template.stream(**self.config, **feed_dict)
+        stream.enable_buffering(self.stream_buffer_size)
+        with open(export_path, "w", buffering=1024 * 1024) as file:
+            stream.dump(file)
 
         return export_path
 
@@ -52,10 +59,6 @@ class Template(object):
     def root_dir(self):
         return path.join(path.dirname(path.abspath(__file__)), 'templates')
 
-    def _save_string_as_file(self, string, file_path):
-        with open(file_path, "w") as file:
-            file.write(string)
-
     def _create_jinja(self):
         loader = FileSystemLoader(self.root_dir, encoding='utf8')
         jinja = JinjaEnv(loader=loader)
@@ -41,7 +41,6 @@ public:
 private:
     // declarations
     {% for node in graph.non_variables %}
-    {% if node.available_buffer == '' %}
     {% for out_k in node.output_ops.keys() -%}
     {% if node.output_ops.keys()|length > 1 %}
     {{ node.dtype.cpptype() }} *{{ node.name + '_' + out_k }}_raw = 0;
@@ -49,15 +48,11 @@ private:
     {{ node.dtype.cpptype() }} *{{ node.name }}_raw = 0;
     {% endif %}
     {%- endfor %}
-    {% elif node.available_buffer != '' and node.output_ops.keys()|length > 1 %}
-    {% for out_k in node.output_ops.keys() -%}
-    {% if out_k != node.output_ops.keys()|list|first %}
-    {{ node.dtype.cpptype() }} *{{ node.name + '_' + out_k }}_raw = 0;
-    {% endif %}
-    {%- endfor %}
-    {% endif %}
     {%- endfor %}
 
+    // output buffers of all operators, placed by the memory planner
+    std::unique_ptr<BYTE[]> activation_arena;
+
     QUANTIZED_PACKED *device_input_buf = 0;
     BIN_CONV_OUTPUT *device_output_buf = 0;
 
@@ -0,0 +1,29 @@
+/* Copyright 2019 The Blueoil Authors. All Rights Reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+==============================================================================*/
+
+#include "global.h"
+#include "inputs/const_blob.h"
+
+// Link the constants written by the code generator into the data section.
+// The assembler finds the blob file by the include path `-Wa,-I<src/inputs>`.
+__asm__(
+  ".pushsection .data\n"
+  ".balign {{ alignment }}\n"
+  ".global dlk_const_blob\n"
+  ".hidden dlk_const_blob\n"
+  "dlk_const_blob:\n"
+  ".incbin \"{{ blob_name }}\"\n"
+  ".popsection\n"
+);
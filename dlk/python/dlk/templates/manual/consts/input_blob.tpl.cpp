@@ -0,0 +1,63 @@
+/* Copyright 2019 The Blueoil Authors. All Rights Reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+==============================================================================*/
+
+#include "global.h"
+#include "tensor_view.h"
+#include "inputs/{{ node.name }}.h"
+#include "inputs/const_blob.h"
+
+{% if node.transposed_data -%}
+
+#ifdef RUN_ON_FPGA
+static constexpr decltype({{ node.name }})::tensor_info_t<std::size_t> {{ node.name }}_shape = {
+  {% for l in node.transposed_shape -%}
+  {{- l -}},
+  {%- endfor %}
+};
+const TensorView<{{ node.dtype.cpptype() }}, MemoryLayout::{{ node.transposed_dimension_format }}> {{ node.name }}(
+    reinterpret_cast<{{ node.dtype.cpptype() }}*>(dlk_const_blob + {{ offsets.transposed_data }}),
+    {{ node.name }}_shape);
+#elif defined USE_NEON || defined USE_AVX
+static constexpr decltype({{ node.name }})::tensor_info_t<std::size_t> {{ node.name }}_shape = {
+  {% for l in node.shape -%}
+  {{- l -}},
+  {%- endfor %}
+};
+const TensorView<{{ node.dtype.cpptype() }}, MemoryLayout::{{ node.dimension }}> {{ node.name }}(
+    reinterpret_cast<{{ node.dtype.cpptype() }}*>(dlk_const_blob + {{ offsets.data }}),
+    {{ node.name }}_shape);
+#else
+static constexpr decltype({{ node.name }})::tensor_info_t<std::size_t> {{ node.name }}_shape = {
+  {% for l in node.kn2row_shape -%}
+  {{- l -}},
+  {%- endfor %}
+};
+const TensorView<{{ node.dtype.cpptype() }}, MemoryLayout::{{ node.kn2row_dimension_format }}> {{ node.name }}(
+    reinterpret_cast<{{ node.dtype.cpptype() }}*>(dlk_const_blob + {{ offsets.kn2row_data }}),
+    {{ node.name }}_shape);
+#endif
+
+{% else -%}
+
+static constexpr decltype({{ node.name }})::tensor_info_t<std::size_t> {{ node.name }}_shape = {
+  {% for l in node.shape -%}
+  {{- l -}},
+  {%- endfor %}
+};
+const TensorView<{{ node.dtype.cpptype() }}, MemoryLayout::{{ node.dimension }}> {{ node.name }}(
+    reinterpret_cast<{{ node.dtype.cpptype() }}*>(dlk_const_blob + {{ offsets.data }}),
+    {{ node.name }}_shape);
+
+{%- endif %}
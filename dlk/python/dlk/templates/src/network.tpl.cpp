@@ -143,25 +143,6 @@ Network::Network()
 
 Network::~Network()
 {
-  {% for node in graph.non_variables -%}
-  {% if node.available_buffer == '' -%}
-  {% for out_k in node.output_ops.keys() -%}
-  {% if node.output_ops.keys()|length > 1 %}
-  delete []{{ node.name + '_' + out_k }}_raw;
-  {% else %}
-  delete []{{ node.name }}_raw;
-  {% endif %}
-  {%- endfor %}
-  {% elif node.available_buffer != '' and node.output_ops.keys()|length > 1 %}
-  {% for out_k in node.output_ops.keys() -%}
-  {% if out_k != node.output_ops.keys()|list|first %}
-  delete []{{ node.name + '_' + out_k }}_raw;
-  {% endif %}
-  {%- endfor %}
-  {% endif %}
-  {%- endfor %}
-  {{ '\n' -}}
-
 #if defined RUN_ON_FPGA
 #else
   delete [] device_input_buf;
@@ -244,22 +225,13 @@ bool Network::init()
       MAX_SIZE_INPUTS_PER_LAYER * sizeof(QUANTIZED_NOT_PACKED)
   );
 
+  // activation memory: {{ memory_plan.arena_size }} bytes, {{ memory_plan.unplanned_size }} bytes without planning
+  activation_arena = std::make_unique<BYTE[]>({{ memory_plan.arena_size }});
   {% for node in graph.non_variables -%}
-  {% if node.available_buffer == '' %}
-  {% for out_k in node.output_ops.keys() -%}
-  {% if node.output_ops.keys()|length > 1 %}
-  {{ node.name + '_' + out_k }}_raw = new {{ node.dtype.cpptype() }}[{{ node.view.size_in_words_as_cpp }}]();
-  {% else %}
-  {{ node.name }}_raw = new {{ node.dtype.cpptype() }}[{{ node.view.size_in_words_as_cpp }}]();
-  {% endif %}
-  {%- endfor %}
-  {% elif node.available_buffer != '' and node.output_ops.keys()|length > 1 %}
   {% for out_k in node.output_ops.keys() -%}
-  {% if out_k != node.output_ops.keys()|list|first %}
-  {{ node.name + '_' + out_k }}_raw = new {{ node.dtype.cpptype() }}[{{ node.view.size_in_words_as_cpp }}]();
-  {% endif %}
-  {%- endfor %}
-  {% endif %}
+  {% set buffer_name = node.name + '_' + out_k if node.output_ops.keys()|length > 1 else node.name -%}
+  {{ buffer_name }}_raw = reinterpret_cast<{{ node.dtype.cpptype() }}*>(activation_arena.get() + {{ memory_plan.offsets[buffer_name] }});
+  {% endfor -%}
   {%- endfor %}
   {{ '\n' -}}
 
@@ -338,37 +310,15 @@ bool Network::run(float *network_input, float *network_output)
   {{ '\n' -}}
 
   {% for node in graph.non_variables -%}
-  {% if node.available_buffer == '' %}
-  {% for out_k in node.output_ops.keys() -%}
-  {% if node.output_ops.keys()|length > 1 %}
-  TensorView<{{ node.dtype.cpptype() }}, MemoryLayout::{{ node.dimension }}>::tensor_info_t<std::size_t> {{ node.name + '_' + out_k }}_shape = {
-    {% for len in node.shape -%}
-    {{- len -}},
-    {%- endfor %}
-  };
-  TensorView<{{ node.dtype.cpptype() }}, MemoryLayout::{{ node.dimension }}>
-    {{ node.name + '_' + out_k }}({{ node.name + '_' + out_k }}_raw, {{ node.name + '_' + out_k }}_shape);
-  {% else %}
-  TensorView<{{ node.dtype.cpptype() }}, MemoryLayout::{{ node.dimension }}>::tensor_info_t<std::size_t> {{ node.name }}_shape = {
-    {% for len in node.shape -%}
-    {{- len -}},
-    {%- endfor %}
-  };
-  TensorView<{{ node.dtype.cpptype() }}, MemoryLayout::{{ node.dimension }}> {{ node.name }}({{ node.name }}_raw, {{ node.name }}_shape);
-  {% endif %}
-  {%- endfor %}
-  {% elif node.available_buffer != '' and node.output_ops.keys()|length > 1 %}
   {% for out_k in node.output_ops.keys() -%}
-  {% if out_k != node.output_ops.keys()|list|first %}
-  TensorView<{{ node.dtype.cpptype() }}, MemoryLayout::{{ node.dimension }}>::tensor_info_t<std::size_t> {{ node.name + '_' + out_k }}_shape = {
+  {% set buffer_name = node.name + '_' + out_k if node.output_ops.keys()|length > 1 else node.name -%}
+  TensorView<{{ node.dtype.cpptype() }}, MemoryLayout::{{ node.dimension }}>::tensor_info_t<std::size_t> {{ buffer_name }}_shape = {
     {% for len in node.shape -%}
     {{- len -}},
     {%- endfor %}
   };
-  TensorView<{{ node.dtype.cpptype() }}, MemoryLayout::{{ node.dimension }}> {{ node.name + '_' + out_k }}({{ node.name + '_' + out_k }}_raw, {{ node.name + '_' + out_k }}_shape);
-  {% endif %}
-  {%- endfor %}
-  {% endif %}
+  TensorView<{{ node.dtype.cpptype() }}, MemoryLayout::{{ node.dimension }}> {{ buffer_name }}({{ buffer_name }}_raw, {{ buffer_name }}_shape);
+  {% endfor -%}
   {%- endfor %}
   {{ '\n' -}}
 
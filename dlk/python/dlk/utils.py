@@ -16,7 +16,9 @@
 """Utility functions."""
 import importlib
 import os
+import resource
 import shutil
+import sys
 from os import path
 from pathlib import Path
 from typing import Any, Generator, List, Mapping, Union
@@ -54,6 +56,13 @@ def get_files_generator(src_dir_path: str, excepts: str = '') -> Generator[str,
                 yield path.join(dirpath, file_name)
 
 
+def peak_memory_mb() -> float:
+    """Return the high-water mark of the resident memory of this process in MiB."""
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS, in kilobytes on Linux.
+    return max_rss / (1024 * 1024) if sys.platform == 'darwin' else max_rss / 1024
+
+
 def dynamic_class_load(path: str) -> Any:
     """Load a class defined by the argument.
 
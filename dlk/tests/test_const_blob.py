@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 The Blueoil Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+"""Test file for writing constants into a binary blob."""
+import io
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+import unittest
+
+import numpy as np
+
+from code_generater import CodeGenerater, ConstBlobWriter
+from core.config import Config
+from core.data_types import Float32, Int32
+from core.graph import Graph
+from core.operators import Constant, Conv, Input, Output
+from core.params import Params
+
+
+def create_conv_graph(num_layers: int, channels: int) -> Graph:
+    """Create a graph of convolutions which has `num_layers * 9 * channels ** 2` float weights."""
+    graph = Graph()
+    shape = [1, 8, 8, channels]
+    node = Input('input', shape, Float32())
+    rng = np.random.RandomState(0)
+    for i in range(num_layers):
+        w = Constant(f'weight{i}', Float32(), rng.normal(size=[channels, 3, 3, channels]).astype(np.float32))
+        node = Conv(f'conv{i}', shape, Float32(), {'X': node, 'W': w}, kernel_shape=[3, 3], pads=[1, 1, 1, 1])
+    graph.add_op_and_inputs(Output('output', shape, Float32(), {'input': node}))
+    return graph
+
+
+def generate_consts(graph: Graph, output_path: str, const_blob: bool, codegen_jobs: int = 1) -> CodeGenerater:
+    config = Config(output_pj_path=output_path, const_blob=const_blob, codegen_jobs=codegen_jobs)
+    builder = CodeGenerater(graph, Params(graph, config), config)
+    builder.generate_files_from_template()
+    builder.generate_inputs()
+    return builder
+
+
+def read_inputs(output_path: str) -> dict:
+    """Return the contents of the generated constant files."""
+    contents = {}
+    for dir_name in [os.path.join('src', 'inputs'), os.path.join('include', 'inputs')]:
+        for file_name in os.listdir(os.path.join(output_path, dir_name)):
+            with open(os.path.join(output_path, dir_name, file_name), 'rb') as f:
+                contents[os.path.join(dir_name, file_name)] = f.read()
+    return contents
+
+
+class TestConstBlob(unittest.TestCase):
+    """Test class for ConstBlobWriter."""
+
+    def test_const_blob_writer(self) -> None:
+        """Test offsets and data in the blob."""
+        f = io.BytesIO()
+        blob = ConstBlobWriter(f, Config())
+
+        a = Constant('a', Float32(), np.arange(5, dtype=np.float32))
+        b = Constant('b', Int32(), np.array([[1, -2], [3, -4]]))
+        scalar = Constant('scalar', Float32(), np.array([1.5]))
+
+        self.assertEqual(blob.add(a), {'data': 0})
+        self.assertEqual(blob.add(b), {'data': 64})
+        self.assertIsNone(blob.add(scalar))
+        self.assertEqual(blob.size, 128)
+
+        data = f.getvalue()
+        self.assertEqual(len(data), 128)
+        np.testing.assert_array_equal(np.frombuffer(data[:20], dtype='<f4'), a.data)
+        np.testing.assert_array_equal(np.frombuffer(data[64:80], dtype='<i4'), b.data.flatten())
+
+    def test_generate_const_blob(self) -> None:
+        """Test generating the blob and the sources which refer to it."""
+        output_path = tempfile.mkdtemp()
+        try:
+            generate_consts(create_conv_graph(2, 4), output_path, const_blob=True)
+
+            inputs_dir = os.path.join(output_path, 'src', 'inputs')
+            self.assertEqual(os.path.getsize(os.path.join(inputs_dir, 'const_blob.bin')), 2 * 576)
+            with open(os.path.join(inputs_dir, 'weight1.cpp')) as f:
+                self.assertIn('dlk_const_blob + 576', f.read())
+            with open(os.path.join(inputs_dir, 'const_blob.cpp')) as f:
+                self.assertIn('.incbin \\"const_blob.bin\\"', f.read())
+        finally:
+            shutil.rmtree(output_path)
+
+    def test_parallel_generation(self) -> None:
+        """Test generating the constants in worker processes gives the same files."""
+        graph = create_conv_graph(3, 4)
+        for const_blob in [False, True]:
+            sequential_path = tempfile.mkdtemp()
+            parallel_path = tempfile.mkdtemp()
+            try:
+                generate_consts(graph, sequential_path, const_blob)
+                builder = generate_consts(graph, parallel_path, const_blob, codegen_jobs=2)
+
+                self.assertEqual(read_inputs(sequential_path), read_inputs(parallel_path))
+                # .cpp and .h of each weight.
+                self.assertEqual(len(builder.file_times), 2 * 3)
+                self.assertIn('weight0.cpp', builder.file_time_report())
+            finally:
+                shutil.rmtree(sequential_path)
+                shutil.rmtree(parallel_path)
+
+
+def benchmark_const_emission(num_layers: int = 16, channels: int = 128) -> None:
+    """Compare generating and compiling constants as C++ source and as a blob.
+
+    `PYTHONPATH=python/dlk python tests/test_const_blob.py`
+    """
+    graph = create_conv_graph(num_layers, channels)
+    num_params = sum(c.size for c in graph.consts)
+    for const_blob in [False, True]:
+        output_path = tempfile.mkdtemp()
+        try:
+            start = time.perf_counter()
+            generate_consts(graph, output_path, const_blob)
+            generate_seconds = time.perf_counter() - start
+
+            inputs_dir = os.path.join(output_path, 'src', 'inputs')
+            sources = sorted(os.path.join('src', 'inputs', f) for f in os.listdir(inputs_dir) if f.endswith('.cpp'))
+            source_bytes = sum(os.path.getsize(os.path.join(output_path, s)) for s in sources)
+
+            start = time.perf_counter()
+            for source in sources:
+                subprocess.run(['g++', '-std=c++14', '-O3', '-I./include', '-Wa,-I./src/inputs', '-c', source,
+                                '-o', source.replace('.cpp', '.o')], cwd=output_path, check=True)
+            compile_seconds = time.perf_counter() - start
+
+            mode = 'blob' if const_blob else 'source'
+            print(f'{mode:>6}: {num_params} params, sources {source_bytes / 1024 ** 2:.1f} MiB, '
+                  f'generate {generate_seconds:.2f} s, compile {compile_seconds:.2f} s')
+        finally:
+            shutil.rmtree(output_path)
+
+
+if __name__ == '__main__':
+    benchmark_const_emission()
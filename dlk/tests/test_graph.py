@@ -20,7 +20,7 @@ import numpy as np
 
 from core.data_types import Float32
 from core.graph import Graph
-from core.operators import Constant, Conv, Input, Output
+from core.operators import Constant, Conv, Identity, Input, Output
 
 
 class TestGraph(unittest.TestCase):
@@ -69,6 +69,53 @@ class TestGraph(unittest.TestCase):
         self.assertTrue(graph.check_nodes(), "All inputs of operators must match their outputs.")
         print("Graph test passed!")
 
+    def test_execution_order_of_deep_graph(self) -> None:
+        """Test the execution order of a graph deeper than the recursion limit."""
+        graph = Graph()
+        shape = [1, 2, 2, 3]
+        x = graph.add_op(Input('input', shape, Float32()))
+        nodes = [x]
+        for i in range(5000):
+            nodes.append(Identity(f'identity{i}', shape, Float32(), {'input': nodes[-1]}))
+        y = Output('output', shape, Float32(), {'input': nodes[-1]})
+        nodes.append(y)
+
+        # add ops in reverse order
+        for node in reversed(nodes):
+            graph.add_op(node)
+
+        self.assertEqual(graph.execution_order, nodes)
+        self.assertEqual(graph.non_variables, nodes[1:-1])
+        self.assertEqual(graph.get_consumers(x), [nodes[1]])
+        self.assertEqual(graph.get_producers(y), [nodes[-2]])
+
+    def test_execution_order_update(self) -> None:
+        """Test the cached execution order is updated when the graph changes."""
+        graph = Graph()
+        shape = [1, 2, 2, 3]
+        x = Input('input', shape, Float32())
+        a = Identity('a', shape, Float32(), {'input': x})
+        b = Identity('b', shape, Float32(), {'input': x})
+        y = Output('output', shape, Float32(), {'input': a})
+        for op in [x, a, b, y]:
+            graph.add_op(op)
+
+        self.assertEqual(graph.execution_order, [x, a, b, y])
+        self.assertEqual(graph.get_consumers(x), [a, b])
+
+        # reconnect the output to b
+        y.remove_input('input')
+        y.add_input('input', b)
+        graph.remove_op(a)
+        self.assertEqual(graph.execution_order, [x, b, y])
+        self.assertEqual(graph.get_consumers(x), [b])
+        self.assertEqual(graph.get_consumers(b), [y])
+
+        # new op which has b as an input
+        c = graph.add_op(Identity('c', shape, Float32(), {'input': b}))
+        self.assertEqual(graph.execution_order, [x, b, y, c])
+        self.assertEqual(graph.get_consumers(b), [y, c])
+
 
 if __name__ == '__main__':
     unittest.main()
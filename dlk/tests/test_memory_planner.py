@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 The Blueoil Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+"""Test file for the memory planner."""
+import unittest
+
+import numpy as np
+
+from core.data_types import Float32, Int32
+from core.graph import Graph
+from core.memory_planner import ARENA_ALIGNMENT, MemoryPlan, plan_memory
+from core.operators import Add, Constant, Input, Output, Relu, Reshape, Split
+
+
+class TestMemoryPlanner(unittest.TestCase):
+    """Test class for the memory planner."""
+
+    def assert_valid_plan(self, plan: MemoryPlan) -> None:
+        """Assert buffers live at the same time don't share memory, unless one is an alias of the other."""
+        for i, a in enumerate(plan.buffers):
+            self.assertEqual(a.offset % ARENA_ALIGNMENT, 0)
+            self.assertLessEqual(a.offset + a.size, plan.arena_size)
+            for b in plan.buffers[i + 1:]:
+                if a.alias_of is not None or b.alias_of is not None:
+                    continue
+                if a.overlaps(b):
+                    self.assertTrue(a.offset + a.size <= b.offset or b.offset + b.size <= a.offset,
+                                    f'{a.name} and {b.name} overlap')
+
+    def test_chain(self) -> None:
+        """Test a chain of operators needs two buffers at a time."""
+        graph = Graph()
+        shape = [1, 8, 8, 16]
+        node = Input('input', shape, Float32())
+        for i in range(6):
+            node = Relu(f'relu{i}', shape, Float32(), {'X': node})
+        graph.add_op_and_inputs(Output('output', shape, Float32(), {'input': node}))
+
+        plan = plan_memory(graph)
+        self.assert_valid_plan(plan)
+
+        size = 1 * 8 * 8 * 16 * 4
+        self.assertEqual(plan.unplanned_size, 6 * size)
+        self.assertEqual(plan.arena_size, 2 * size)
+        self.assertEqual(plan.peak_live_size, 2 * size)
+
+        # the graph output is live until the end.
+        output_buffer = plan.buffers[-1]
+        self.assertEqual(output_buffer.name, 'relu5')
+        self.assertEqual(output_buffer.last, len(graph.non_variables))
+
+    def test_branches(self) -> None:
+        """Test buffers read by a later operator stay live."""
+        graph = Graph()
+        rng = np.random.RandomState(0)
+        x = Input('input', [1, 4, 4, 8], Float32())
+        nodes = [x]
+        for i in range(30):
+            shape = [1, 4, 4, 8]
+            recent = nodes[-4:]
+            if rng.rand() < 0.5 and len(recent) > 1:
+                a, b = rng.choice(len(recent), 2)
+                node = Add(f'add{i}', shape, Float32(), {'A': recent[a], 'B': recent[b]})
+            else:
+                node = Relu(f'relu{i}', shape, Float32(), {'X': recent[rng.randint(len(recent))]})
+            nodes.append(node)
+        graph.add_op_and_inputs(Output('output', [1, 4, 4, 8], Float32(), {'input': nodes[-1]}))
+
+        plan = plan_memory(graph)
+        self.assert_valid_plan(plan)
+        self.assertLessEqual(plan.peak_live_size, plan.arena_size)
+        self.assertLess(plan.arena_size, plan.unplanned_size)
+
+    def test_reshape_and_split(self) -> None:
+        """Test a reshape shares the buffer of its input and each output of a split has its own buffer."""
+        graph = Graph()
+        x = Input('input', [1, 4, 4, 8], Float32())
+        relu = Relu('relu', [1, 4, 4, 8], Float32(), {'X': x})
+        new_shape = Constant('new_shape', Int32(), np.array([1, 4, 2, 16]))
+        reshape = Reshape('reshape', [1, 4, 2, 16], Float32(), {'data': relu, 'shape': new_shape})
+        axis = Constant('axis', Int32(), np.array([3]))
+        split = Split('split', [1, 4, 2, 8], Float32(), {'A': axis, 'B': reshape}, num_split=2)
+        relu1 = Relu('relu1', [1, 4, 2, 8], Float32(), {'X': split})
+        relu2 = Relu('relu2', [1, 4, 2, 8], Float32(), {'X': split})
+        add = Add('add', [1, 4, 2, 8], Float32(), {'A': relu1, 'B': relu2})
+        graph.add_op_and_inputs(Output('output', [1, 4, 2, 8], Float32(), {'input': add}))
+
+        plan = plan_memory(graph)
+        self.assert_valid_plan(plan)
+
+        buffers = {b.name: b for b in plan.buffers}
+        self.assertEqual(set(buffers), {'relu', 'reshape', 'split_output1', 'split_output2', 'relu1', 'relu2', 'add'})
+        self.assertIs(buffers['reshape'].alias_of, buffers['relu'])
+        self.assertEqual(plan.offsets['reshape'], plan.offsets['relu'])
+        # the input of the reshape is live as long as the reshape.
+        self.assertEqual(buffers['relu'].last, buffers['reshape'].last)
+        self.assertNotEqual(plan.offsets['split_output1'], plan.offsets['split_output2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
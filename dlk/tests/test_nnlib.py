@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 The Blueoil Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+"""Test file for the python binding of the generated library."""
+import unittest
+
+import numpy as np
+
+from scripts.pylib.nnlib import NNLib
+
+INPUT_SHAPE = (1, 2, 2, 3)
+OUTPUT_SHAPE = (1, 4)
+
+
+class StubLib(object):
+    """Stand-in of the generated library, which sums each pixel of the input."""
+
+    def __init__(self):
+        self.inputs = []
+
+    def network_create(self):
+        return 1
+
+    def network_init(self, nnlib):
+        return True
+
+    def network_delete(self, nnlib):
+        pass
+
+    def network_get_input_rank(self, nnlib):
+        return len(INPUT_SHAPE)
+
+    def network_get_output_rank(self, nnlib):
+        return len(OUTPUT_SHAPE)
+
+    def network_get_input_shape(self, nnlib, shape):
+        shape[:] = INPUT_SHAPE
+
+    def network_get_output_shape(self, nnlib, shape):
+        shape[:] = OUTPUT_SHAPE
+
+    def network_run(self, nnlib, input, output):
+        self.inputs.append(input)
+        output.reshape(-1)[:] = input.reshape(4, 3).sum(axis=1)
+
+
+def expected_output(tensor):
+    return np.asarray(tensor, np.float32).reshape(-1, 4, 3).sum(axis=2)
+
+
+class TestNNLib(unittest.TestCase):
+    """Test class for NNLib with a stub library."""
+
+    def setUp(self) -> None:
+        self.stub = StubLib()
+        self.nnlib = NNLib()
+        self.nnlib.lib = self.stub
+        self.nnlib.nnlib = self.stub.network_create()
+        self.assertTrue(self.nnlib.init())
+
+    def test_shapes(self) -> None:
+        self.assertEqual(self.nnlib.input_shape, INPUT_SHAPE)
+        self.assertEqual(self.nnlib.output_shape, OUTPUT_SHAPE)
+
+    def test_run_before_init(self) -> None:
+        nnlib = NNLib()
+        with self.assertRaises(RuntimeError):
+            nnlib.run(np.zeros(INPUT_SHAPE, np.float32))
+        with self.assertRaises(RuntimeError):
+            nnlib.run_batch(np.zeros((2,) + INPUT_SHAPE[1:], np.float32))
+
+    def test_run_without_copy(self) -> None:
+        tensor = np.random.rand(*INPUT_SHAPE).astype(np.float32)
+        output = self.nnlib.run(tensor)
+
+        # C-contiguous float32 input is passed as it is.
+        self.assertIs(self.stub.inputs[-1], tensor)
+        self.assertEqual(output.shape, OUTPUT_SHAPE)
+        np.testing.assert_allclose(output, expected_output(tensor).reshape(OUTPUT_SHAPE))
+
+    def test_run_with_copy(self) -> None:
+        # wrong dtype is converted into the input buffer.
+        tensor = np.random.rand(*INPUT_SHAPE)
+        output = self.nnlib.run(tensor)
+        self.assertIs(self.stub.inputs[-1], self.nnlib._input)
+        np.testing.assert_allclose(output, expected_output(tensor).reshape(OUTPUT_SHAPE), rtol=1e-6)
+
+        # non-contiguous input is copied into the input buffer.
+        tensor = np.random.rand(1, 2, 2, 6).astype(np.float32)[..., ::2]
+        self.assertFalse(tensor.flags["C_CONTIGUOUS"])
+        output = self.nnlib.run(tensor)
+        self.assertIs(self.stub.inputs[-1], self.nnlib._input)
+        np.testing.assert_allclose(output, expected_output(tensor).reshape(OUTPUT_SHAPE))
+
+        with self.assertRaises(ValueError):
+            self.nnlib.run(np.zeros((1, 2, 2, 2), np.float32))
+
+    def test_run_into_output(self) -> None:
+        tensor = np.random.rand(*INPUT_SHAPE).astype(np.float32)
+        output = np.empty(OUTPUT_SHAPE, np.float32)
+        self.assertIs(self.nnlib.run(tensor, output=output), output)
+        np.testing.assert_allclose(output, expected_output(tensor).reshape(OUTPUT_SHAPE))
+
+        for wrong_output in [
+            np.empty(OUTPUT_SHAPE, np.float64),
+            np.empty((1, 5), np.float32),
+            np.empty((1, 8), np.float32)[:, ::2],
+        ]:
+            with self.assertRaises(ValueError):
+                self.nnlib.run(tensor, output=wrong_output)
+
+    def test_run_batch(self) -> None:
+        tensors = np.random.rand(3, 2, 2, 3).astype(np.float32)
+        output = self.nnlib.run_batch(tensors)
+
+        self.assertEqual(output.shape, (3, 4))
+        np.testing.assert_allclose(output, expected_output(tensors))
+        # each input is a view of the batch without copy.
+        for i, input in enumerate(self.stub.inputs):
+            self.assertTrue(np.shares_memory(input, tensors[i]))
+
+    def test_run_batch_with_copy(self) -> None:
+        tensors = np.random.rand(3, 2, 2, 3)
+        output = self.nnlib.run_batch(tensors)
+
+        np.testing.assert_allclose(output, expected_output(tensors), rtol=1e-6)
+        for input in self.stub.inputs:
+            self.assertTrue(np.shares_memory(input, self.nnlib._batch_input))
+
+    def test_run_batch_into_output(self) -> None:
+        tensors = np.random.rand(2, 2, 2, 3).astype(np.float32)
+        output = np.empty((2, 4), np.float32)
+        self.assertIs(self.nnlib.run_batch(tensors, output=output), output)
+        np.testing.assert_allclose(output, expected_output(tensors))
+
+        for wrong_output in [
+            np.empty((2, 4), np.float64),
+            np.empty((3, 4), np.float32),
+            np.empty((2, 8), np.float32)[:, ::2],
+        ]:
+            with self.assertRaises(ValueError):
+                self.nnlib.run_batch(tensors, output=wrong_output)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -84,6 +84,26 @@ class TestOperators(unittest.TestCase):
 
         print("Conv test passed!")
 
+    def test_lazy_data(self) -> None:
+        """Test data of operators is allocated on the first access."""
+        # 64 GiB if allocated eagerly
+        shape = [1, 65536, 65536, 4]
+        x = Input('input', shape, Float32())
+        m = MaxPool('MaxPool', shape, Float32(), {'X': x}, kernel_shape=[1, 1])
+        m.transpose([0, 3, 1, 2])
+
+        self.assertIsNone(x._data)
+        self.assertIsNone(m._data)
+
+        y = Input('small_input', [1, 3, 3, 2], Float32())
+        y.transpose([0, 3, 1, 2])
+        self.assertEqual(y.data.shape, (1, 2, 3, 3))
+        self.assertEqual(y.data.dtype, np.float32)
+        self.assertFalse(y.data.any())
+
+        y.data = np.ones([1, 2, 3, 3])
+        self.assertTrue(y.data.all())
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -18,15 +18,58 @@ import unittest
 from core.data_types import Float32, PackedUint32, Int32, QUANTIZED_PACKED
 from core.optimizer import pass_remove_identities, pass_transpose, pass_constant_folding, \
     pass_propagate_quantization_details_into_conv, pass_compute_thresholds, pass_pack_weights, \
-    pass_quantize_convolutions, pass_propagate_datatypes, pass_propagate_output_type_backward
+    pass_quantize_convolutions, pass_propagate_datatypes, pass_propagate_output_type_backward, pass_fuse_elementwise, \
+    PassManager, _compute_threshold_table
 from core.graph import Graph
 from core.operators import Add, AveragePool, BatchNormalization, Constant, Conv, Identity, Input, \
     MaxPool, Operator, Output, Transpose, BinaryMeanScalingQuantizer, QTZ_linear_mid_tread_half, Reshape, Softmax, \
-    SpaceToDepth
+    SpaceToDepth, BinaryChannelWiseMeanScalingQuantizer, BatchNormalizationOptimized, LeakyRelu, Mul, Relu
 
+import math
 import numpy as np
 
 
+def reference_threshold_table(path, n, max_v, scaling_factor, ch, channel_wise) -> np.ndarray:
+    """Previous per threshold and per channel loop of `pass_compute_thresholds`."""
+    max_th_value = 2 ** 12 - 1
+    threshold_table = np.empty([ch, n + 1], dtype=np.int32)
+
+    th_val = [0.5 + i for i in range(n)]
+    for th_id, th_v in enumerate(th_val):
+        init_threshold = np.full(ch, th_v, dtype=np.float64)
+
+        bn_nega_idx = []
+        trans_th = {'data': init_threshold}
+        for op in path:
+            trans_th = op.de_run(**trans_th)
+            if op.op_type == 'BatchNormalization':
+                bn_scale = op.input_ops['scale'].data
+                bn_nega_idx = [v for v in range(len(bn_scale)) if bn_scale[v] < 0]
+        threshold = (trans_th['data'] * np.float64(n)) / (np.float64(max_v) * scaling_factor)
+
+        threshold[threshold > max_th_value] = max_th_value
+        threshold[threshold < -max_th_value] = -max_th_value
+
+        for ch_id, th_per_ch in enumerate(threshold):
+            if channel_wise:
+                threshold_table[ch_id, th_id] = int(math.floor(th_per_ch)) \
+                    if (scaling_factor[ch_id] < 0) ^ (ch_id in bn_nega_idx) \
+                    else int(math.ceil(th_per_ch))
+            else:
+                threshold_table[ch_id, th_id] = int(math.floor(th_per_ch)) \
+                    if (scaling_factor < 0) ^ (ch_id in bn_nega_idx) \
+                    else int(math.ceil(th_per_ch))
+
+    for c in range(ch):
+        threshold_table[c, -1] = 1 \
+            if np.all(threshold_table[c, 1:-1] > threshold_table[c, :-2], axis=0) else -1
+        if np.all(threshold_table[c, 1:-1] == threshold_table[c, :-2], axis=0):
+            threshold_table[c, -1] = 1
+            threshold_table[c, 0:-1] = max_th_value
+
+    return threshold_table
+
+
 class TestPassTranspose(unittest.TestCase):
     """Test class for transposing pass."""
     def test_pass_transpose(self) -> None:
@@ -466,47 +509,72 @@ class TestPassComputeThresholds(unittest.TestCase):
 
         print("Test pass #8-1 compute_thresholds of enormous values passed!")
 
+    def test_threshold_table_same_as_reference(self) -> None:
+        """Test the threshold tables are bit-exact with the previous per channel loop."""
+        rng = np.random.RandomState(0)
+        for channel_wise in [False, True]:
+            for nbit in [1, 2, 3]:
+                for scale in [1, 10 ** (-30)]:
+                    ch = 64
+                    data1 = np.float32(rng.rand(ch, 2, 2, ch))
+                    data2 = np.float32(rng.normal(scale=scale, size=(ch, 2, 2, ch)))
+                    bn_scale = rng.normal(size=ch)
+                    graph = self.create_sample_graph(data1, data2, ch=ch, nbit=nbit, bn_scale=bn_scale,
+                                                     channel_wise=channel_wise)
+
+                    conv = graph.get_op('conv2')
+                    conv.quantizer.run_forward_no_scaling_factor()
+                    scaling_factor = conv.quantizer.scaling_factor
+                    path = [graph.get_op('aqtz2'), graph.get_op('bn')]
+                    n = 2 ** nbit - 1
+
+                    np.testing.assert_array_equal(
+                        _compute_threshold_table(path, n, 2.0, scaling_factor, ch),
+                        reference_threshold_table(path, n, 2.0, scaling_factor, ch, channel_wise))
+
     @staticmethod
-    def create_sample_graph(data1: np.ndarray, data2: np.ndarray) -> Graph:
+    def create_sample_graph(data1: np.ndarray, data2: np.ndarray, ch: int = 3, nbit: int = 2,
+                            bn_scale: np.ndarray = None, channel_wise: bool = False) -> Graph:
         graph = Graph()
 
         # input
-        x = Input('placeholder', [1, 5, 5, 3], Float32())
+        x = Input('placeholder', [1, 5, 5, ch], Float32())
 
         # Conv1
         w1 = Constant('weight1', Float32(), data1)
-        conv1 = Conv('conv1', [1, 4, 4, 3], Float32(), {'X': x, 'W': w1}, kernel_shape=[2, 2])
+        conv1 = Conv('conv1', [1, 4, 4, ch], Float32(), {'X': x, 'W': w1}, kernel_shape=[2, 2])
 
         # activation quantizer
-        s1 = Constant('aq_const1', Int32(), np.array([2], dtype=np.int32))
+        s1 = Constant('aq_const1', Int32(), np.array([nbit], dtype=np.int32))
         s2 = Constant('aq_const2', Float32(), np.array([2.0], dtype=np.float32))
-        aq1 = QTZ_linear_mid_tread_half('aqtz1', [1, 4, 4, 3], Float32(), {'X': conv1, 'Y': s1, 'Z': s2})
+        aq1 = QTZ_linear_mid_tread_half('aqtz1', [1, 4, 4, ch], Float32(), {'X': conv1, 'Y': s1, 'Z': s2})
 
         # Conv2
         w2 = Constant('weight2', Float32(), data2)
-        kq = BinaryMeanScalingQuantizer('kqtz1', [1, 2, 2, 3], Float32(), {'input': w2})
-        conv2 = Conv('conv2', [1, 3, 3, 3], Float32(), {'X': aq1, 'W': kq}, kernel_shape=[2, 2])
+        quantizer = BinaryChannelWiseMeanScalingQuantizer if channel_wise else BinaryMeanScalingQuantizer
+        kq = quantizer('kqtz1', list(data2.shape), Float32(), {'input': w2})
+        conv2 = Conv('conv2', [1, 3, 3, ch], Float32(), {'X': aq1, 'W': kq}, kernel_shape=[2, 2])
         conv2.a_quantizer = [aq1]
         conv2.quantizer = kq
         conv2.is_quantized = True
 
-        sc = Constant('bn_scale', Float32(), np.random.rand(3))
-        be = Constant('bn_b', Float32(), np.random.rand(3))
-        mu = Constant('bn_mu', Float32(), np.random.rand(3))
-        va = Constant('bn_var', Float32(), np.random.rand(3))
-        bn = BatchNormalization('bn', [1, 3, 3, 3], Float32(), {'X': conv2,
-                                                                'scale': sc,
-                                                                'B': be,
-                                                                'mean': mu,
-                                                                'var': va})
+        sc = Constant('bn_scale', Float32(), np.random.rand(ch) if bn_scale is None else bn_scale)
+        be = Constant('bn_b', Float32(), np.random.rand(ch))
+        mu = Constant('bn_mu', Float32(), np.random.rand(ch))
+        va = Constant('bn_var', Float32(), np.random.rand(ch))
+        bn = BatchNormalization('bn', [1, 3, 3, ch], Float32(), {'X': conv2,
+                                                                 'scale': sc,
+                                                                 'B': be,
+                                                                 'mean': mu,
+                                                                 'var': va})
 
         # activation quantizer
-        s3 = Constant('aq_const3', Int32(), np.array([2], dtype=np.int32))
+        s3 = Constant('aq_const3', Int32(), np.array([nbit], dtype=np.int32))
         s4 = Constant('aq_const4', Float32(), np.array([2.0], dtype=np.float32))
-        aq2 = QTZ_linear_mid_tread_half('aqtz2', [1, 3, 3, 3], Float32(), {'X': bn, 'Y': s3, 'Z': s4})
+        aq2 = QTZ_linear_mid_tread_half('aqtz2', [1, 3, 3, ch], Float32(), {'X': bn, 'Y': s3, 'Z': s4})
 
         # One output
-        y = Output('output', [1, 3, 3, 3], Float32(), {'input': aq2})
+        y = Output('output', [1, 3, 3, ch], Float32(), {'input': aq2})
 
         # add ops to the graph
         graph.add_op_and_inputs(y)
@@ -527,6 +595,24 @@ class TestPassConstantFolding(unittest.TestCase):
 
         print("Test pass #9 constant folding passed!")
 
+    def test_pass_constant_folding_chain(self) -> None:
+        """Test folding a chain of constant operators into a constant."""
+        graph = Graph()
+        x = Input('placeholder', [2], Float32())
+        node = Constant('potato_0', Float32(), np.array([1, 2]))
+        for i in range(1, 50):
+            node = Add(f'potatoes_{i}', [2], Float32(),
+                       {'A': node, 'B': Constant(f'potato_{i}', Float32(), np.array([1, 2]))})
+        add = Add('more_potatoes', [2], Float32(), {'A': x, 'B': node})
+        y = Output('output', [2], Float32(), {'input': add})
+        graph.add_op_and_inputs(y)
+
+        pass_constant_folding(graph)
+
+        self.assertEqual([op.name for op in graph.execution_order],
+                         ['placeholder', 'potatoes_49_new', 'more_potatoes', 'output'])
+        self.assertEqual(list(graph.get_op('potatoes_49_new').data), [50, 100])
+
     @staticmethod
     def create_sample_graph() -> Graph:
         graph = Graph()
@@ -547,5 +633,92 @@ class TestPassConstantFolding(unittest.TestCase):
         return graph
 
 
+class TestPassFuseElementwise(unittest.TestCase):
+    """Test class for fusing elementwise operators."""
+    def test_pass_fuse_elementwise(self) -> None:
+        """Test a chain after Conv is fused into one operator computing the same result."""
+        graph = self.create_sample_graph()
+        rng = np.random.RandomState(0)
+        conv = graph.get_op('conv')
+        conv_data = rng.normal(size=conv.shape).astype(np.float32)
+        conv.data = conv_data
+
+        pass_fuse_elementwise(graph)
+
+        self.assertEqual([op.name for op in graph.non_variables], ['conv', 'leaky_relu_fused'])
+        fused = graph.get_op('leaky_relu_fused')
+        self.assertEqual([op_type for op_type, _, _ in fused.fused_ops],
+                         ['BatchNormalizationOptimized', 'Relu', 'Add', 'Mul', 'LeakyRelu'])
+        self.assertIs(fused.input_ops['X'], conv)
+        self.assertIs(graph.get_op('output').input_ops['input'], fused)
+        self.assertEqual(graph.get_consumers(conv), [fused])
+
+        scale = graph.get_op('bn_scale').data
+        bias = graph.get_op('bn_bias').data
+        expected = np.maximum(conv_data * scale + bias, 0)
+        expected = (expected + conv_data) * 0.5
+        expected = np.maximum(expected * 0.1, expected)
+        np.testing.assert_allclose(fused.run_forward(), expected, rtol=1e-6)
+
+        code = fused.view.run()
+        self.assertIn('v = v * bn_scale.data()[c] + bn_bias.data()[c];', code)
+        self.assertIn('v = v + conv.data()[i];', code)
+        self.assertIn('v = v * half.data()[0];', code)
+        self.assertIn('leaky_relu_fused.data()[i] = v;', code)
+
+    def test_pass_fuse_elementwise_branch(self) -> None:
+        """Test an operator read by others than the chain ends the chain."""
+        graph = self.create_sample_graph()
+        relu = graph.get_op('relu')
+        graph.add_op_and_inputs(Output('output2', relu.shape, Float32(), {'input': relu}))
+
+        pass_fuse_elementwise(graph)
+
+        self.assertEqual([op.name for op in graph.non_variables], ['conv', 'relu_fused', 'leaky_relu_fused'])
+        self.assertEqual([op_type for op_type, _, _ in graph.get_op('relu_fused').fused_ops],
+                         ['BatchNormalizationOptimized', 'Relu'])
+        self.assertEqual([op_type for op_type, _, _ in graph.get_op('leaky_relu_fused').fused_ops],
+                         ['Add', 'Mul', 'LeakyRelu'])
+        self.assertIs(graph.get_op('output2').input_ops['input'], graph.get_op('relu_fused'))
+
+    @staticmethod
+    def create_sample_graph() -> Graph:
+        graph = Graph()
+        shape = [1, 4, 4, 8]
+
+        x = Input('placeholder', shape, Float32())
+        w = Constant('weight', Float32(), np.zeros([8, 3, 3, 8], dtype=np.float32))
+        conv = Conv('conv', shape, Float32(), {'X': x, 'W': w}, kernel_shape=[3, 3], pads=[1, 1, 1, 1])
+
+        scale = Constant('bn_scale', Float32(), np.linspace(-1, 1, 8, dtype=np.float32))
+        bias = Constant('bn_bias', Float32(), np.linspace(0, 1, 8, dtype=np.float32))
+        bn = BatchNormalizationOptimized('bn', shape, Float32(), {'X': conv, 'scale': scale, 'bias': bias})
+        relu = Relu('relu', shape, Float32(), {'X': bn})
+        add = Add('add', shape, Float32(), {'A': relu, 'B': conv})
+        half = Constant('half', Float32(), np.array([0.5], dtype=np.float32))
+        mul = Mul('mul', shape, Float32(), {'A': add, 'B': half})
+        leaky_relu = LeakyRelu('leaky_relu', shape, Float32(), {'X': mul}, alpha=0.1)
+
+        y = Output('output', shape, Float32(), {'input': leaky_relu})
+        graph.add_op_and_inputs(y)
+
+        return graph
+
+
+class TestPassManager(unittest.TestCase):
+    """Test class for PassManager."""
+    def test_pass_manager(self) -> None:
+        """Test running passes with profiling."""
+        graph = TestPassConstantFolding.create_sample_graph()
+
+        pass_manager = PassManager([pass_transpose], profile=True)
+        pass_manager.add_pass(pass_constant_folding)
+        pass_manager.run(graph)
+
+        self.assertEqual([p.name for p in pass_manager.profiles], ['pass_transpose', 'pass_constant_folding'])
+        self.assertEqual([(p.num_ops_before, p.num_ops_after) for p in pass_manager.profiles], [(6, 6), (6, 4)])
+        self.assertIn('pass_constant_folding', pass_manager.report())
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -15,6 +15,7 @@
 # =============================================================================
 """Unittest for Packer."""
 
+import timeit
 import unittest
 
 import numpy as np
@@ -22,6 +23,28 @@ import numpy as np
 from modules.packer import Packer
 
 
+def reference_pack(bitwidth: int, wordsize: int, tensor: np.ndarray) -> np.ndarray:
+    """Previous word by word implementation of `Packer.run`."""
+    powers = np.power(2, np.arange(wordsize)).astype(np.uint32)
+
+    output_size = tensor.size // wordsize
+    output_size += 1 if tensor.size % wordsize != 0 else 0
+    output_size *= bitwidth
+
+    tensor_flat = tensor.flatten(order='C').astype(np.uint32)
+    output = np.zeros(output_size, dtype=np.uint32)
+    oi = 0
+    for i in range(0, tensor.size, wordsize):
+        sliced_tensor = tensor_flat[i:i + wordsize]
+        for _ in range(0, bitwidth):
+            v = np.bitwise_and(sliced_tensor, 1)
+            output[oi] = np.dot(v, powers[:v.size]).astype(np.uint32)
+            oi += 1
+            sliced_tensor = np.right_shift(sliced_tensor, 1)
+
+    return output.reshape([1, output_size])
+
+
 class TestPacker(unittest.TestCase):
     """Test class for Packer."""
 
@@ -95,6 +118,35 @@ class TestPacker(unittest.TestCase):
         with self.assertRaises(ValueError):
             packer.run(test_input)
 
+    def test_same_as_reference(self):
+        """Test for the same output as the previous implementation."""
+        rng = np.random.RandomState(0)
+        for bitwidth in [1, 2, 3, 8]:
+            for wordsize in [8, 16, 32, 37, 64]:
+                for size in [1, 31, 32, 33, 1000]:
+                    test_input = rng.randint(0, 2 ** bitwidth, size=[size]).astype(np.float32)
+                    np.testing.assert_array_equal(
+                        Packer(bitwidth, wordsize).run(test_input),
+                        reference_pack(bitwidth, wordsize, test_input),
+                        err_msg=f'bitwidth {bitwidth}, wordsize {wordsize}, size {size}')
+
+
+def benchmark_packer(shape=(512, 3, 3, 512), bitwidth=1, wordsize=32, repeat=3):
+    """Compare `Packer.run` with the previous implementation. `python tests/test_packer.py benchmark`"""
+    test_input = np.random.RandomState(0).randint(0, 2 ** bitwidth, size=shape).astype(np.float32)
+    packer = Packer(bitwidth, wordsize)
+
+    reference = timeit.timeit(lambda: reference_pack(bitwidth, wordsize, test_input), number=repeat) / repeat
+    vectorized = timeit.timeit(lambda: packer.run(test_input), number=repeat) / repeat
+    print(f'Packer of {test_input.size} values, bitwidth {bitwidth}, wordsize {wordsize}: '
+          f'reference {reference * 1000:.1f} msec, vectorized {vectorized * 1000:.1f} msec '
+          f'({reference / vectorized:.0f}x)')
+
 
 if __name__ == '__main__':
-    unittest.main(verbosity=2)
+    import sys
+    if sys.argv[1:] == ['benchmark']:
+        benchmark_packer()
+        benchmark_packer(shape=(256, 3), bitwidth=2)
+    else:
+        unittest.main(verbosity=2)
@@ -24,6 +24,7 @@ import tensorflow as tf
 from lmnet import environment
 from lmnet.datasets.base import ObjectDetectionBase
 from lmnet.datasets.dataset_iterator import DatasetIterator
+from lmnet.datasets.packed import packed_dataset_class
 from lmnet.datasets.tfds import TFDSClassification, TFDSObjectDetection
 from lmnet.utils import config as config_util
 from lmnet.utils import executor, module_loader
@@ -45,9 +46,24 @@ def setup_dataset(config, subset, seed):
         else:
             DatasetClass = TFDSClassification
 
-    dataset = DatasetClass(subset=subset, **dataset_kwargs, **tfds_kwargs)
+    # If there is a settings for packed dataset, packed dataset class will be used.
+    packed_kwargs = dataset_kwargs.pop("packed_kwargs", {})
+    if packed_kwargs:
+        DatasetClass = packed_dataset_class(DatasetClass)
+
+    dataset = DatasetClass(subset=subset, **dataset_kwargs, **tfds_kwargs, **packed_kwargs)
     enable_prefetch = dataset_kwargs.pop("enable_prefetch", False)
-    return DatasetIterator(dataset, seed=seed, enable_prefetch=enable_prefetch)
+    prefetch_processes = dataset_kwargs.pop("prefetch_processes", 8)
+    prefetch_batches_in_flight = dataset_kwargs.pop("prefetch_batches_in_flight", None)
+    prefetch_shared_memory = dataset_kwargs.pop("prefetch_shared_memory", False)
+    return DatasetIterator(
+        dataset,
+        seed=seed,
+        enable_prefetch=enable_prefetch,
+        prefetch_processes=prefetch_processes,
+        prefetch_batches_in_flight=prefetch_batches_in_flight,
+        prefetch_shared_memory=prefetch_shared_memory,
+    )
 
 
 def evaluate(config, restore_path, output_dir):
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 The Blueoil Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+import os
+import time
+
+import click
+
+from lmnet.datasets.packed import write_packed_subset
+from lmnet.datasets.tfds import TFDSMixin
+from lmnet.utils import config as config_util
+
+
+def _get_packed_settings(config_file):
+    config = config_util.load(config_file)
+    dataset_class = config.DATASET_CLASS
+    dataset_kwargs = {key.lower(): val for key, val in config.DATASET.items()}
+
+    if "packed_kwargs" not in dataset_kwargs:
+        raise ValueError("The given config file does not contain settings for packing datasets.\n"
+                         "Please see help messages (python executor/pack_dataset.py -h) for detail.")
+
+    if issubclass(dataset_class, TFDSMixin) or "tfds_kwargs" in dataset_kwargs:
+        raise ValueError("You cannot pack dataset classes which is a TFDS format.")
+
+    packed_kwargs = dataset_kwargs.pop("packed_kwargs")
+    dataset_kwargs.pop("augmentor", None)
+    dataset_kwargs.pop("pre_processor", None)
+
+    subsets = ["train", "validation"]
+    if dataset_kwargs.get("train_validation_saving_size", 0) > 0:
+        subsets.append("train_validation_saving")
+
+    return dataset_class, dataset_kwargs, packed_kwargs, subsets
+
+
+def run(config_file, overwrite, subsets=None):
+    """Pack datasets from config file"""
+    dataset_class, dataset_kwargs, packed_kwargs, default_subsets = _get_packed_settings(config_file)
+    subsets = subsets or default_subsets
+
+    output_dir = os.path.join(os.path.expanduser(packed_kwargs["data_dir"]), packed_kwargs["name"])
+    if not overwrite and os.path.exists(output_dir):
+        raise ValueError("Output path already exists: {}\n"
+                         "Please use --overwrite if you want to overwrite."
+                         .format(output_dir))
+
+    for subset in subsets:
+        start = time.time()
+        dataset = dataset_class(subset=subset, **dataset_kwargs)
+        meta = write_packed_subset(
+            dataset,
+            os.path.join(output_dir, subset),
+            image_format=packed_kwargs.get("image_format", "raw"),
+            shard_size=packed_kwargs.get("shard_size", 1024 ** 3),
+        )
+        print("Packed {} subset: {} examples in {:.1f} sec.".format(subset, meta["num_examples"], time.time() - start))
+
+    print("Done!!")
+
+
+@click.command(context_settings=dict(help_option_names=["-h", "--help"]))
+@click.option(
+    "-c",
+    "--config_file",
+    help="A path to config file",
+    required=True,
+)
+@click.option(
+    "-o",
+    "--overwrite",
+    help="Overwrite if the output directory already exists.",
+    is_flag=True,
+    default=False,
+)
+@click.option(
+    "-s",
+    "--subset",
+    help="Subset to be packed. Default is train and validation (and train_validation_saving if it is used).",
+    multiple=True,
+)
+def main(config_file, overwrite, subset):
+    """
+    A script to pack datasets into a binary format
+
+    \b
+    This script packs existing dataset classes into sharded binary files
+    which are read with memory mapping by `lmnet.datasets.packed`.
+    You can use training config files to specify which dataset class to be used as data source.
+    The following settings are required in the config file.
+
+    \b
+    ```
+    DATASET_CLASS = <dataset class>
+    DATASET.PACKED_KWARGS = {
+        "name": "<a dataset name to be generated>",
+        "data_dir": "<a directory path to output packed dataset>",
+        "image_format": "<raw or jpeg, default is raw>",
+    }
+    ```
+
+    \b
+    If you have a training config file with the settings above,
+    you can execute this script and the training script with the same config file.
+    Then the packed dataset will be used for training.
+
+    \b
+    ```
+    python executor/pack_dataset.py -c common_config_file.py
+    python executor/train.py        -c common_config_file.py
+    ```
+    """
+
+    run(os.path.expanduser(config_file), overwrite, list(subset))
+
+
+if __name__ == "__main__":
+    main()
@@ -25,23 +25,45 @@ from lmnet import environment
 from lmnet.common import Tasks
 from lmnet.datasets.base import ObjectDetectionBase
 from lmnet.datasets.dataset_iterator import DatasetIterator
-from lmnet.datasets.tfds import TFDSClassification, TFDSObjectDetection
+from lmnet.datasets.packed import packed_dataset_class
+from lmnet.datasets.tfds import TFDSClassification, TFDSMixin, TFDSObjectDetection
 from lmnet.utils import config as config_util
 from lmnet.utils import executor
 from lmnet.utils import horovod as horovod_util
+from lmnet.utils.background_validator import BackgroundValidator, stratum_labels
+from lmnet.utils.background_writer import BackgroundWriter
+from lmnet.utils.random import stratified_sample
 from lmnet.utils import module_loader
 
 
-def _save_checkpoint(saver, sess, global_step, step):
+def _save_checkpoint(background_writer, snapshot=None):
     checkpoint_file = "save.ckpt"
-    saver.save(
-        sess,
-        os.path.join(environment.CHECKPOINTS_DIR, checkpoint_file),
-        global_step=global_step,
+    background_writer.save(os.path.join(environment.CHECKPOINTS_DIR, checkpoint_file), snapshot=snapshot)
+
+
+def _create_model(config, dataset):
+    ModelClass = config.NETWORK_CLASS
+    network_kwargs = {key.lower(): val for key, val in config.NETWORK.items()}
+    if config.TASK == Tasks.OBJECT_DETECTION:
+        return ModelClass(
+            classes=dataset.classes,
+            num_max_boxes=dataset.num_max_boxes,
+            is_debug=config.IS_DEBUG,
+            **network_kwargs,
+        )
+    return ModelClass(
+        classes=dataset.classes,
+        is_debug=config.IS_DEBUG,
+        **network_kwargs,
     )
 
 
-def setup_dataset(config, subset, rank):
+def setup_dataset(config, subset, rank, num_shards=1):
+    """Create `DatasetIterator` of the subset.
+
+    With `num_shards` > 1, the dataset is partitioned into disjoint shards with a shared shuffle seed,
+    and the iterator reads the `rank`-th shard. Otherwise `rank` is the shuffle seed.
+    """
     DatasetClass = config.DATASET_CLASS
     dataset_kwargs = {key.lower(): val for key, val in config.DATASET.items()}
 
@@ -53,9 +75,82 @@ def setup_dataset(config, subset, rank):
         else:
             DatasetClass = TFDSClassification
 
-    dataset = DatasetClass(subset=subset, **dataset_kwargs, **tfds_kwargs)
+    # If there is a settings for packed dataset, packed dataset class will be used.
+    packed_kwargs = dataset_kwargs.pop("packed_kwargs", {})
+    if packed_kwargs:
+        DatasetClass = packed_dataset_class(DatasetClass)
+
+    dataset = DatasetClass(subset=subset, **dataset_kwargs, **tfds_kwargs, **packed_kwargs)
     enable_prefetch = dataset_kwargs.pop("enable_prefetch", False)
-    return DatasetIterator(dataset, seed=rank, enable_prefetch=enable_prefetch)
+    prefetch_processes = dataset_kwargs.pop("prefetch_processes", 8)
+    prefetch_batches_in_flight = dataset_kwargs.pop("prefetch_batches_in_flight", None)
+    prefetch_shared_memory = dataset_kwargs.pop("prefetch_shared_memory", False)
+    return DatasetIterator(
+        dataset,
+        seed=0 if num_shards > 1 else rank,
+        enable_prefetch=enable_prefetch,
+        prefetch_processes=prefetch_processes,
+        prefetch_batches_in_flight=prefetch_batches_in_flight,
+        prefetch_shared_memory=prefetch_shared_memory,
+        num_shards=num_shards,
+        shard_index=rank if num_shards > 1 else 0,
+    )
+
+
+def setup_quick_validation_dataset(validation_dataset, size):
+    """Return `DatasetIterator` of a fixed subsample of the validation dataset.
+
+    The subsample keeps the proportion of each class when the dataset knows the labels without loading the samples.
+    Returns None for TFDS datasets, which can't be subsampled.
+    """
+    dataset = validation_dataset.dataset
+    if isinstance(dataset, TFDSMixin):
+        print("WARNING: quick validation is disabled, as TFDS validation datasets can't be subsampled.")
+        return None
+    labels = stratum_labels(dataset)
+    if labels is None:
+        labels = [0] * dataset.num_per_epoch
+    return DatasetIterator(dataset, seed=0, indices=stratified_sample(labels, size, seed=0))
+
+
+def setup_input(model, train_dataset, config):
+    """Return the images and labels tensors which the network consumes, and the initializer of the input pipeline.
+
+    By default, these are the placeholders of the model and the batches are fed through `feed_dict`.
+    With `DATASET.ENABLE_TF_DATA`, the training batches come from a tf.data pipeline over `train_dataset`.
+    The tensors are `placeholder_with_default` of the next batch, so that feeding them still works
+    for the validation steps, and the training steps feed only `is_training`.
+    """
+    images_placeholder, labels_placeholder = model.placeholders()
+    if not config.DATASET.get("ENABLE_TF_DATA", False):
+        return images_placeholder, labels_placeholder, None
+
+    dataset = train_dataset.to_tf_dataset(
+        (images_placeholder.dtype, labels_placeholder.dtype),
+        (images_placeholder.shape, labels_placeholder.shape),
+        prefetch_size=config.DATASET.get("TF_DATA_PREFETCH_SIZE", 2),
+        prefetch_to_device=config.DATASET.get("PREFETCH_TO_DEVICE"),
+    )
+    iterator = tf.compat.v1.data.make_initializable_iterator(dataset)
+    images, labels = iterator.get_next()
+    images = tf.compat.v1.placeholder_with_default(images, images_placeholder.shape, name="images_input")
+    labels = tf.compat.v1.placeholder_with_default(labels, labels_placeholder.shape, name="labels_input")
+    print("ENABLE tf.data input")
+    return images, labels, iterator.initializer
+
+
+def _create_export_graph(config, dataset):
+    """Return the inference graph from the plain placeholders of the model, without the tf.data input pipeline.
+
+    The variables have the same names as the training graph, to export the graph with the training values.
+    """
+    graph = tf.Graph()
+    with graph.as_default():
+        model = _create_model(config, dataset)
+        is_training_placeholder = tf.compat.v1.placeholder(tf.bool, name="is_training_placeholder")
+        images_placeholder, _ = model.placeholders()
+        model.inference(images_placeholder, is_training_placeholder)
+    return graph
 
 
 def start_training(config):
@@ -64,11 +159,11 @@ def start_training(config):
     if use_horovod:
         hvd = horovod_util.setup()
         rank = hvd.rank()
+        num_shards = hvd.size()
     else:
         rank = 0
+        num_shards = 1
 
-    ModelClass = config.NETWORK_CLASS
-    network_kwargs = {key.lower(): val for key, val in config.NETWORK.items()}
     if "train_validation_saving_size".upper() in config.DATASET.keys():
         use_train_validation_saving = config.DATASET.TRAIN_VALIDATION_SAVING_SIZE > 0
     else:
@@ -77,8 +172,15 @@ def start_training(config):
     if use_train_validation_saving:
         top_train_validation_saving_set_accuracy = 0
 
-    train_dataset = setup_dataset(config, "train", rank)
+    # validate in a second session on a background thread of rank 0, while the training continues.
+    overlap_validation = config.get("OVERLAP_VALIDATION", False)
+    quick_validation_steps = config.get("QUICK_VALIDATION_STEPS", 0) if overlap_validation else 0
+
+    # each rank trains on its own shard of the train dataset.
+    train_dataset = setup_dataset(config, "train", rank, num_shards=num_shards)
     print("train dataset num:", train_dataset.num_per_epoch)
+    if num_shards > 1:
+        print("train dataset shard: {} of {}".format(rank, num_shards))
 
     if use_train_validation_saving:
         train_validation_saving_dataset = setup_dataset(config, "train_validation_saving", rank)
@@ -87,26 +189,23 @@ def start_training(config):
     validation_dataset = setup_dataset(config, "validation", rank)
     print("validation dataset num:", validation_dataset.num_per_epoch)
 
+    if quick_validation_steps and rank == 0:
+        quick_validation_dataset = setup_quick_validation_dataset(
+            validation_dataset, config.get("QUICK_VALIDATION_SIZE", 512),
+        )
+        if quick_validation_dataset is None:
+            quick_validation_steps = 0
+        else:
+            print("quick validation dataset num:", quick_validation_dataset.num_per_epoch)
+
     graph = tf.Graph()
     with graph.as_default():
-        if config.TASK == Tasks.OBJECT_DETECTION:
-            model = ModelClass(
-                classes=train_dataset.classes,
-                num_max_boxes=train_dataset.num_max_boxes,
-                is_debug=config.IS_DEBUG,
-                **network_kwargs,
-            )
-        else:
-            model = ModelClass(
-                classes=train_dataset.classes,
-                is_debug=config.IS_DEBUG,
-                **network_kwargs,
-            )
+        model = _create_model(config, train_dataset)
 
         global_step = tf.Variable(0, name="global_step", trainable=False)
         is_training_placeholder = tf.compat.v1.placeholder(tf.bool, name="is_training_placeholder")
 
-        images_placeholder, labels_placeholder = model.placeholders()
+        images_placeholder, labels_placeholder, input_init_op = setup_input(model, train_dataset, config)
 
         output = model.inference(images_placeholder, is_training_placeholder)
         if config.TASK == Tasks.OBJECT_DETECTION:
@@ -133,9 +232,11 @@ def start_training(config):
             bcast_global_variables_op = hvd.broadcast_global_variables(0)
 
         if use_train_validation_saving:
-            saver = tf.compat.v1.train.Saver(max_to_keep=1)
+            max_to_keep = 1
         else:
-            saver = tf.compat.v1.train.Saver(max_to_keep=config.KEEP_CHECKPOINT_MAX)
+            max_to_keep = config.KEEP_CHECKPOINT_MAX
+        saver = tf.compat.v1.train.Saver(max_to_keep=max_to_keep)
+        saver_var_list = tf.global_variables()
 
         if config.IS_PRETRAIN:
             all_vars = tf.global_variables()
@@ -147,6 +248,9 @@ def start_training(config):
             ])
             pretrain_saver = tf.compat.v1.train.Saver(pretrain_var_list, name="pretrain_saver")
 
+    # the exported graph must not pull the batches from the iterator of the training graph.
+    export_graph = _create_export_graph(config, train_dataset) if input_init_op is not None else None
+
     if use_horovod:
         # For distributed training
         session_config = tf.ConfigProto(
@@ -169,12 +273,16 @@ def start_training(config):
 
     sess = tf.Session(graph=graph, config=session_config)
     sess.run([init_op, reset_metrics_op])
+    if input_init_op is not None:
+        sess.run(input_init_op)
 
     if rank == 0:
         train_writer = tf.summary.FileWriter(environment.TENSORBOARD_DIR + "/train", sess.graph)
         if use_train_validation_saving:
             train_val_saving_writer = tf.summary.FileWriter(environment.TENSORBOARD_DIR + "/train_validation_saving")
         val_writer = tf.summary.FileWriter(environment.TENSORBOARD_DIR + "/validation")
+        if quick_validation_steps:
+            quick_val_writer = tf.summary.FileWriter(environment.TENSORBOARD_DIR + "/quick_validation")
 
         if config.IS_PRETRAIN:
             print("------- Load pretrain data ----------")
@@ -196,6 +304,27 @@ def start_training(config):
             val_writer.add_session_log(SessionLog(status=SessionLog.START), global_step=last_step + 1)
             print("recovered. last step", last_step)
 
+        # checkpoints and summaries are written in background not to stall the training steps.
+        background_writer = BackgroundWriter(
+            sess, global_step, saver_var_list, saver_def=saver.as_saver_def(), max_to_keep=max_to_keep,
+        )
+        if overlap_validation:
+            background_validator = BackgroundValidator(
+                lambda: _create_model(config, train_dataset),
+                [var.op.name for var in saver_var_list],
+                config.BATCH_SIZE,
+                config.SUMMARISE_STEPS,
+                session_config=session_config,
+            )
+
+    def save_if_top_accuracy(metrics, snapshot):
+        """Save the snapshot when its train_validation_saving accuracy is the top, on the validator thread."""
+        nonlocal top_train_validation_saving_set_accuracy
+        if metrics["accuracy"] > top_train_validation_saving_set_accuracy:
+            top_train_validation_saving_set_accuracy = metrics["accuracy"]
+            print("New top train_validation_saving accuracy is: ", top_train_validation_saving_set_accuracy)
+            _save_checkpoint(background_writer, snapshot)
+
     if use_horovod:
         # broadcast variables from rank 0 to all other processes
         sess.run(bcast_global_variables_op)
@@ -213,13 +342,16 @@ def start_training(config):
         progbar.update(last_step)
     for step in range(last_step, max_steps):
 
-        images, labels = train_dataset.feed()
-
-        feed_dict = {
-            is_training_placeholder: True,
-            images_placeholder: images,
-            labels_placeholder: labels,
-        }
+        if input_init_op is not None:
+            # the batch is taken from the tf.data pipeline.
+            feed_dict = {is_training_placeholder: True}
+        else:
+            images, labels = train_dataset.feed()
+            feed_dict = {
+                is_training_placeholder: True,
+                images_placeholder: images,
+                labels_placeholder: labels,
+            }
 
         if step * ((step + 1) % config.SUMMARISE_STEPS) == 0 and rank == 0:
             # Runtime statistics for develop.
@@ -233,7 +365,7 @@ def start_training(config):
                 # run_metadata=run_metadata,
             )
             # train_writer.add_run_metadata(run_metadata, "step: {}".format(step + 1))
-            train_writer.add_summary(summary, step + 1)
+            background_writer.add_summary(train_writer, summary, step + 1)
 
             metrics_values = sess.run(list(metrics_ops_dict.values()))
             metrics_feed_dict = {placeholder: value for placeholder, value in zip(metrics_placeholders, metrics_values)}
@@ -241,15 +373,28 @@ def start_training(config):
             metrics_summary, = sess.run(
                 [metrics_summary_op], feed_dict=metrics_feed_dict,
             )
-            train_writer.add_summary(metrics_summary, step + 1)
-            train_writer.flush()
+            background_writer.add_summary(train_writer, metrics_summary, step + 1)
+
+            prefetch_stats = train_dataset.prefetch_stats()
+            if prefetch_stats:
+                prefetch_summary = tf.compat.v1.Summary(value=[
+                    tf.compat.v1.Summary.Value(tag="prefetch/{}".format(key), simple_value=value)
+                    for key, value in prefetch_stats.items()
+                ])
+                background_writer.add_summary(train_writer, prefetch_summary, step + 1)
+            background_writer.flush_summary(train_writer)
         else:
             sess.run([train_op], feed_dict=feed_dict)
 
         to_be_saved = step == 0 or (step + 1) == max_steps or (step + 1) % config.SAVE_CHECKPOINT_STEPS == 0
 
         if to_be_saved and rank == 0:
-            if use_train_validation_saving:
+            if use_train_validation_saving and overlap_validation:
+                background_validator.submit(
+                    background_writer.snapshot(), train_validation_saving_dataset, train_val_saving_writer, step + 1,
+                    callback=save_if_top_accuracy,
+                )
+            elif use_train_validation_saving:
 
                 sess.run(reset_metrics_op)
                 train_validation_saving_step_size = int(math.ceil(train_validation_saving_dataset.num_per_epoch
@@ -270,8 +415,8 @@ def start_training(config):
 
                     if train_validation_saving_step % config.SUMMARISE_STEPS == 0:
                         summary, _ = sess.run([summary_op, metrics_update_op], feed_dict=feed_dict)
-                        train_val_saving_writer.add_summary(summary, step + 1)
-                        train_val_saving_writer.flush()
+                        background_writer.add_summary(train_val_saving_writer, summary, step + 1)
+                        background_writer.flush_summary(train_val_saving_writer)
                     else:
                         sess.run([metrics_update_op], feed_dict=feed_dict)
 
@@ -282,8 +427,8 @@ def start_training(config):
                 metrics_summary, = sess.run(
                     [metrics_summary_op], feed_dict=metrics_feed_dict,
                 )
-                train_val_saving_writer.add_summary(metrics_summary, step + 1)
-                train_val_saving_writer.flush()
+                background_writer.add_summary(train_val_saving_writer, metrics_summary, step + 1)
+                background_writer.flush_summary(train_val_saving_writer)
 
                 current_train_validation_saving_set_accuracy = sess.run(metrics_ops_dict["accuracy"])
 
@@ -291,24 +436,26 @@ def start_training(config):
                     top_train_validation_saving_set_accuracy = current_train_validation_saving_set_accuracy
                     print("New top train_validation_saving accuracy is: ", top_train_validation_saving_set_accuracy)
 
-                    _save_checkpoint(saver, sess, global_step, step)
+                    _save_checkpoint(background_writer)
 
             else:
-                _save_checkpoint(saver, sess, global_step, step)
+                _save_checkpoint(background_writer)
 
             if step == 0:
                 # check create pb on only first step.
-                minimal_graph = tf.graph_util.convert_variables_to_constants(
-                    sess,
-                    sess.graph.as_graph_def(add_shapes=True),
-                    ["output"],
-                )
                 pb_name = "minimal_graph_with_shape_{}.pb".format(step + 1)
                 pbtxt_name = "minimal_graph_with_shape_{}.pbtxt".format(step + 1)
-                tf.io.write_graph(minimal_graph, environment.CHECKPOINTS_DIR, pb_name, as_text=False)
-                tf.io.write_graph(minimal_graph, environment.CHECKPOINTS_DIR, pbtxt_name, as_text=True)
-
-        if step == 0 or (step + 1) % config.TEST_STEPS == 0:
+                background_writer.export_graph(environment.CHECKPOINTS_DIR, pb_name, pbtxt_name, graph=export_graph)
+
+        is_validation_step = step == 0 or (step + 1) % config.TEST_STEPS == 0
+        if overlap_validation:
+            if rank == 0 and is_validation_step:
+                background_validator.submit(background_writer.snapshot(), validation_dataset, val_writer, step + 1)
+            elif rank == 0 and quick_validation_steps and (step + 1) % quick_validation_steps == 0:
+                background_validator.submit(
+                    background_writer.snapshot(), quick_validation_dataset, quick_val_writer, step + 1,
+                )
+        elif is_validation_step:
             # init metrics values
             sess.run(reset_metrics_op)
             test_step_size = int(math.ceil(validation_dataset.num_per_epoch / config.BATCH_SIZE))
@@ -325,8 +472,8 @@ def start_training(config):
                 if test_step % config.SUMMARISE_STEPS == 0:
                     summary, _ = sess.run([summary_op, metrics_update_op], feed_dict=feed_dict)
                     if rank == 0:
-                        val_writer.add_summary(summary, step + 1)
-                        val_writer.flush()
+                        background_writer.add_summary(val_writer, summary, step + 1)
+                        background_writer.flush_summary(val_writer)
                 else:
                     sess.run([metrics_update_op], feed_dict=feed_dict)
 
@@ -338,16 +485,28 @@ def start_training(config):
                 [metrics_summary_op], feed_dict=metrics_feed_dict,
             )
             if rank == 0:
-                val_writer.add_summary(metrics_summary, step + 1)
-                val_writer.flush()
+                background_writer.add_summary(val_writer, metrics_summary, step + 1)
+                background_writer.flush_summary(val_writer)
 
         if rank == 0:
             progbar.update(step + 1)
     # training loop end.
+    if rank == 0:
+        if overlap_validation:
+            # the validations may queue checkpoints, so they finish first.
+            background_validator.close()
+            print(background_validator.report())
+        # write out the queued checkpoints and summaries before exit.
+        background_writer.close()
+        print(background_writer.report())
+    # close the session first, not to leave the tf.data pipeline waiting for a batch from the closed dataset.
+    sess.close()
     train_dataset.close()
     validation_dataset.close()
     if use_train_validation_saving:
         train_validation_saving_dataset.close()
+    if quick_validation_steps and rank == 0:
+        quick_validation_dataset.close()
     print("Done")
 
 
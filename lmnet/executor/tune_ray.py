@@ -25,6 +25,7 @@ from easydict import EasyDict
 import ray
 from lmnet.datasets.base import ObjectDetectionBase
 from lmnet.datasets.dataset_iterator import DatasetIterator
+from lmnet.datasets.packed import packed_dataset_class
 from lmnet.datasets.tfds import TFDSClassification, TFDSObjectDetection
 from lmnet.utils import config as config_util
 from lmnet.utils import executor
@@ -149,12 +150,27 @@ def setup_dataset(config, subset, rank):
         else:
             dataset_class = TFDSClassification
 
-    dataset = dataset_class(subset=subset, **dataset_kwargs, **tfds_kwargs)
+    # If there is a settings for packed dataset, packed dataset class will be used.
+    packed_kwargs = dataset_kwargs.pop("packed_kwargs", {})
+    if packed_kwargs:
+        dataset_class = packed_dataset_class(dataset_class)
+
+    dataset = dataset_class(subset=subset, **dataset_kwargs, **tfds_kwargs, **packed_kwargs)
 
     # TODO (Neil): Enable both train and validation
     # For some reasons processes are not terminated cleanly, enable prefetch ONLY for the train dataset.
     enable_prefetch = dataset_kwargs.pop("enable_prefetch", False) if subset == 'train' else False
-    return DatasetIterator(dataset, seed=rank, enable_prefetch=enable_prefetch)
+    prefetch_processes = dataset_kwargs.pop("prefetch_processes", 8)
+    prefetch_batches_in_flight = dataset_kwargs.pop("prefetch_batches_in_flight", None)
+    prefetch_shared_memory = dataset_kwargs.pop("prefetch_shared_memory", False)
+    return DatasetIterator(
+        dataset,
+        seed=rank,
+        enable_prefetch=enable_prefetch,
+        prefetch_processes=prefetch_processes,
+        prefetch_batches_in_flight=prefetch_batches_in_flight,
+        prefetch_shared_memory=prefetch_shared_memory,
+    )
 
 
 class TrainTunable(Trainable):
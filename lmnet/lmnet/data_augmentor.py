@@ -25,6 +25,112 @@ from lmnet import data_processor, pre_processor
 from lmnet.utils.box import fill_dummy_boxes, crop_boxes, iou
 
 
+def _blend_batch(degenerate, images, factors):
+    """Vectorized `PIL.Image.blend(degenerate, image, factor)` over a batch of uint8 images.
+
+    Args:
+        degenerate (np.ndarray): Blending source. Broadcastable to `images`.
+        images (np.ndarray): uint8 images. shape is [batch, height, width, channel]
+        factors (np.ndarray): Blending factor of each image. shape is [batch]
+    """
+    degenerate = np.asarray(degenerate, dtype=np.float32)
+    factors = np.asarray(factors, dtype=np.float32).reshape(-1, 1, 1, 1)
+    blended = degenerate + factors * (images.astype(np.float32) - degenerate)
+    return np.clip(blended, 0, 255).astype(np.uint8)
+
+
+def _grayscale_batch(images):
+    """Vectorized `PIL.Image.convert("L")` over a batch of uint8 RGB images. Return shape is [batch, height, width]"""
+    images = images.astype(np.int32)
+    return (images[..., 0] * 19595 + images[..., 1] * 38470 + images[..., 2] * 7471 + 0x8000) >> 16
+
+
+def _rgb_to_hsv_batch(images):
+    """Vectorized `PIL.Image.convert("HSV")` over a batch of uint8 RGB images."""
+    rgb = images.astype(np.float32)
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    maxc = rgb.max(axis=-1)
+    minc = rgb.min(axis=-1)
+    cr = maxc - minc
+    gray = cr == 0
+    safe_cr = np.where(gray, 1, cr)
+    rc = (maxc - r) / safe_cr
+    gc = (maxc - g) / safe_cr
+    bc = (maxc - b) / safe_cr
+    # follow the float / double precision of the PIL implementation to get the same rounding.
+    rc, gc, bc = rc.astype(np.float64), gc.astype(np.float64), bc.astype(np.float64)
+    h = np.where(r == maxc, (bc - gc).astype(np.float32), np.where(g == maxc, 2.0 + rc - bc, 4.0 + gc - rc))
+    h = h.astype(np.float32).astype(np.float64)
+    h = np.fmod(h / 6.0 + 1.0, 1.0).astype(np.float32)
+    s = cr / np.where(gray, 1, maxc)
+
+    hsv = np.empty(images.shape, dtype=np.uint8)
+    hsv[..., 0] = np.where(gray, 0, np.clip((h.astype(np.float64) * 255.0).astype(np.int32), 0, 255))
+    hsv[..., 1] = np.where(gray, 0, np.clip((s.astype(np.float64) * 255.0).astype(np.int32), 0, 255))
+    hsv[..., 2] = maxc
+    return hsv
+
+
+def _hsv_to_rgb_batch(hsv):
+    """Vectorized `PIL.Image.convert("RGB")` over a batch of uint8 HSV images."""
+    h = hsv[..., 0].astype(np.float64)
+    fs = hsv[..., 1].astype(np.float64) / 255.0
+    v = hsv[..., 2]
+    v_float = v.astype(np.float64)
+
+    i = np.floor(h * 6.0 / 255.0)
+    f = h * 6.0 / 255.0 - i
+    p = np.clip(np.floor(v_float * (1.0 - fs) + 0.5), 0, 255).astype(np.uint8)
+    q = np.clip(np.floor(v_float * (1.0 - fs * f) + 0.5), 0, 255).astype(np.uint8)
+    t = np.clip(np.floor(v_float * (1.0 - fs * (1.0 - f)) + 0.5), 0, 255).astype(np.uint8)
+    i = i.astype(np.int32) % 6
+
+    choices = [
+        (v, t, p),
+        (q, v, p),
+        (p, v, t),
+        (p, q, v),
+        (t, p, v),
+        (v, p, q),
+    ]
+    rgb = np.empty(hsv.shape, dtype=np.uint8)
+    for channel in range(3):
+        rgb[..., channel] = np.choose(i, [choice[channel] for choice in choices])
+
+    gray = hsv[..., 1] == 0
+    rgb[gray] = v[gray][:, np.newaxis]
+    return rgb
+
+
+def _gaussian_blur_batch(images, radiuses):
+    """Gaussian blur with a different radius for each image.
+
+    It is a separable convolution with edge padding,
+    so results are close to but not bit exact with `PIL.ImageFilter.GaussianBlur`.
+    """
+    max_radius = int(math.ceil(3 * max(radiuses.max(), 0)))
+    if max_radius == 0:
+        return images
+
+    offsets = np.arange(-max_radius, max_radius + 1, dtype=np.float32)
+    sigmas = np.maximum(radiuses, 1e-6).astype(np.float32).reshape(-1, 1)
+    kernels = np.exp(-0.5 * (offsets / sigmas) ** 2)
+    kernels /= kernels.sum(axis=1, keepdims=True)
+
+    blurred = images.astype(np.float32)
+    for axis in (1, 2):
+        pad_width = [(0, 0)] * blurred.ndim
+        pad_width[axis] = (max_radius, max_radius)
+        padded = np.pad(blurred, pad_width, mode="edge")
+        length = blurred.shape[axis]
+        blurred = np.zeros_like(blurred)
+        for tap in range(2 * max_radius + 1):
+            window = np.take(padded, np.arange(tap, tap + length), axis=axis)
+            blurred += kernels[:, tap].reshape(-1, 1, 1, 1) * window
+
+    return np.clip(np.round(blurred), 0, 255).astype(np.uint8)
+
+
 class Blur(data_processor.Processor):
     """Gaussian blur filter.
 
@@ -62,6 +168,12 @@ class Blur(data_processor.Processor):
 
         return dict({'image': image}, **kwargs)
 
+    def apply_batch(self, image, **kwargs):
+        radiuses = np.random.uniform(self.min_value, self.max_value, size=len(image))
+        image = _gaussian_blur_batch(np.uint8(image), radiuses)
+
+        return dict({'image': image}, **kwargs)
+
 
 class Brightness(data_processor.Processor):
     """Adjust image brightness.
@@ -102,6 +214,12 @@ class Brightness(data_processor.Processor):
 
         return dict({'image': image}, **kwargs)
 
+    def apply_batch(self, image, **kwargs):
+        factors = np.random.uniform(self.min_value, self.max_value, size=len(image))
+        image = _blend_batch(0, np.uint8(image), factors)
+
+        return dict({'image': image}, **kwargs)
+
 
 class Color(data_processor.Processor):
     """Adjust image color.
@@ -142,6 +260,14 @@ class Color(data_processor.Processor):
 
         return dict({'image': image}, **kwargs)
 
+    def apply_batch(self, image, **kwargs):
+        factors = np.random.uniform(self.min_value, self.max_value, size=len(image))
+        image = np.uint8(image)
+        gray = _grayscale_batch(image)[..., np.newaxis]
+        image = _blend_batch(gray, image, factors)
+
+        return dict({'image': image}, **kwargs)
+
 
 class Contrast(data_processor.Processor):
     """Adjust image contrast.
@@ -182,6 +308,15 @@ class Contrast(data_processor.Processor):
 
         return dict({'image': image}, **kwargs)
 
+    def apply_batch(self, image, **kwargs):
+        factors = np.random.uniform(self.min_value, self.max_value, size=len(image))
+        image = np.uint8(image)
+        means = _grayscale_batch(image).reshape(len(image), -1).mean(axis=1)
+        means = np.floor(means + 0.5).reshape(-1, 1, 1, 1)
+        image = _blend_batch(means, image, factors)
+
+        return dict({'image': image}, **kwargs)
+
 
 class Crop(data_processor.Processor):
     """Crop image.
@@ -293,6 +428,21 @@ class FlipLeftRight(data_processor.Processor):
 
         return dict({'image': image, 'mask': mask, 'gt_boxes': gt_boxes}, **kwargs)
 
+    def apply_batch(self, image, mask=None, gt_boxes=None, **kwargs):
+        flg = np.random.random(len(image)) > self.probability
+        image = np.where(flg.reshape(-1, 1, 1, 1), image[:, :, ::-1, :], image)
+        if mask is not None:
+            if np.ndim(mask) not in (3, 4):
+                raise RuntimeError('Number of dims in mask should be 3 or 4 but get {}.'.format(np.ndim(mask)))
+            flg_mask = flg.reshape((-1,) + (1,) * (np.ndim(mask) - 1))
+            mask = np.where(flg_mask, mask[:, :, ::-1, ...], mask)
+        if gt_boxes is not None:
+            width = image.shape[2]
+            gt_boxes = np.array(gt_boxes)
+            gt_boxes[flg, :, 0] = width - gt_boxes[flg, :, 0] - gt_boxes[flg, :, 2]
+
+        return dict({'image': image, 'mask': mask, 'gt_boxes': gt_boxes}, **kwargs)
+
 
 def _flip_top_bottom_boundingbox(img, boxes):
     """Flip top bottom only bounding box.
@@ -343,6 +493,21 @@ class FlipTopBottom(data_processor.Processor):
 
         return dict({'image': image, 'mask': mask, 'gt_boxes': gt_boxes}, **kwargs)
 
+    def apply_batch(self, image, mask=None, gt_boxes=None, **kwargs):
+        flg = np.random.random(len(image)) > self.probability
+        image = np.where(flg.reshape(-1, 1, 1, 1), image[:, ::-1, :, :], image)
+        if mask is not None:
+            if np.ndim(mask) not in (3, 4):
+                raise RuntimeError('Number of dims in mask should be 3 or 4 but get {}.'.format(np.ndim(mask)))
+            flg_mask = flg.reshape((-1,) + (1,) * (np.ndim(mask) - 1))
+            mask = np.where(flg_mask, mask[:, ::-1, ...], mask)
+        if gt_boxes is not None:
+            height = image.shape[1]
+            gt_boxes = np.array(gt_boxes)
+            gt_boxes[flg, :, 1] = height - gt_boxes[flg, :, 1] - gt_boxes[flg, :, 3]
+
+        return dict({'image': image, 'mask': mask, 'gt_boxes': gt_boxes}, **kwargs)
+
 
 class Hue(data_processor.Processor):
     """Change image hue.
@@ -381,6 +546,18 @@ class Hue(data_processor.Processor):
 
         return dict({'image': image}, **kwargs)
 
+    def apply_batch(self, image, **kwargs):
+        vals = np.random.uniform(self.min_value, self.max_value, size=len(image))
+
+        hsv = _rgb_to_hsv_batch(np.uint8(image))
+        # same wrap around as assigning the shifted float hue into uint8 array.
+        hue = np.trunc(hsv[..., 0] + vals.reshape(-1, 1, 1)).astype(np.int64) % 256
+        hsv[..., 0] = hue
+
+        image = _hsv_to_rgb_batch(hsv)
+
+        return dict({'image': image}, **kwargs)
+
 
 class Pad(data_processor.Processor):
     """Add padding to images.
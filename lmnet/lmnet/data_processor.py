@@ -41,6 +41,16 @@ class Sequence:
             kwargs = processor(**kwargs)
         return kwargs
 
+    def apply_batch(self, **kwargs):
+        for processor in self.processors:
+            kwargs = processor.apply_batch(**kwargs)
+        return kwargs
+
+    @property
+    def support_batch(self):
+        """Return True when all processors support `apply_batch`."""
+        return all(getattr(processor, "support_batch", False) for processor in self.processors)
+
     def __repr__(self):
         return pprint.saferepr(self.processors)
 
@@ -75,6 +85,19 @@ class Processor(metaclass=ABCMeta):
         """
         return kwargs
 
+    def apply_batch(self, **kwargs):
+        """Call processor method for a batch of data.
+
+        Each argument has the batch dimension as the first axis, e.g. image shape is [batch, height, width, channel].
+        Return images and labels etc.
+        """
+        raise NotImplementedError()
+
+    @property
+    def support_batch(self):
+        """Return True when the processor overrides `apply_batch`."""
+        return type(self).apply_batch is not Processor.apply_batch
+
     def __repr__(self):
         return "{}({})".format(self.__class__.__name__, self.__dict__)
 
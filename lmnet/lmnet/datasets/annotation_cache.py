@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 The Blueoil Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+"""Persistent cache of parsed object detection annotations.
+
+Parsing the annotation files (XML, CSV or JSON) of a large object detection dataset takes minutes.
+The parsed result is saved once into `environment.ANNOTATION_CACHE_DIR` as a compact npz index:
+
+    files    uint8 array of the newline joined utf-8 image file paths.
+    boxes    float64 array of [num_boxes, 5(x, y, w, h, class_id)] of all images.
+    offsets  int64 array of [num_images + 1], boxes of i-th image are `boxes[offsets[i]:offsets[i + 1]]`.
+
+The cache file name is a hash of the dataset settings and the mtime and size of the source annotation files,
+so that editing the annotation files invalidates the cache.
+"""
+import hashlib
+import os
+
+import numpy as np
+
+from lmnet import environment
+
+
+class BoxAnnotationIndex:
+    """Flat index of the gt boxes of all images.
+
+    Args:
+        files (list): Image file paths.
+        boxes (np.ndarray): gt boxes of all images. shape is [num_boxes, 5(x, y, w, h, class_id)].
+        offsets (np.ndarray): Start offsets of each image's boxes in `boxes`. shape is [num_images + 1].
+    """
+
+    def __init__(self, files, boxes, offsets):
+        self.files = list(files)
+        self.boxes = boxes
+        self.offsets = offsets
+
+    @classmethod
+    def from_annotations(cls, files, annotations):
+        """Create index from files and gt boxes list ([[[x, y, w, h, class_id]]])."""
+        num_boxes = [len(gt_boxes) for gt_boxes in annotations]
+        offsets = np.zeros(len(annotations) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(num_boxes)
+
+        boxes = np.zeros((offsets[-1], 5), dtype=np.float64)
+        for i, gt_boxes in enumerate(annotations):
+            if num_boxes[i] > 0:
+                boxes[offsets[i]:offsets[i + 1]] = gt_boxes
+
+        return cls(files, boxes, offsets)
+
+    def __len__(self):
+        return len(self.files)
+
+    def __getitem__(self, i):
+        return self.boxes[self.offsets[i]:self.offsets[i + 1]]
+
+    @property
+    def annotations(self):
+        """gt boxes list. Each gt boxes is a view of `boxes`."""
+        return [self[i] for i in range(len(self))]
+
+    @property
+    def num_max_boxes(self):
+        if len(self) == 0:
+            return 0
+        return int(np.diff(self.offsets).max())
+
+    def save(self, path):
+        files = np.frombuffer("\n".join(self.files).encode("utf-8"), dtype=np.uint8)
+        with open(path, "wb") as f:
+            np.savez(f, files=files, boxes=self.boxes, offsets=self.offsets)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            offsets = data["offsets"]
+            files = data["files"].tobytes().decode("utf-8")
+            files = files.split("\n") if len(offsets) > 1 else []
+            return cls(files, data["boxes"], offsets)
+
+
+def _source_stats(source_file):
+    """Return (path, stat) of the source file, or of the files in the source directory."""
+    if not os.path.isdir(source_file):
+        return [(os.path.abspath(source_file), os.stat(source_file))]
+    # the directory mtime does not change when a file in it is edited in place, so stat each file.
+    return sorted((os.path.abspath(entry.path), entry.stat()) for entry in os.scandir(source_file) if entry.is_file())
+
+
+def _cache_file(key, source_files):
+    """Return cache file path, or None when some source files don't exist."""
+    hasher = hashlib.sha1(key.encode("utf-8"))
+    for source_file in source_files:
+        if not os.path.exists(source_file):
+            return None
+        for path, stat in _source_stats(source_file):
+            hasher.update("{}:{}:{}".format(path, stat.st_mtime_ns, stat.st_size).encode("utf-8"))
+
+    return os.path.join(environment.ANNOTATION_CACHE_DIR, "{}.npz".format(hasher.hexdigest()))
+
+
+def cached_annotation_index(key, source_files, files_and_annotations):
+    """Load `BoxAnnotationIndex` from the cache, or create and cache it.
+
+    Args:
+        key (str): Identifier of the dataset settings which affect the annotations,
+            e.g. class name, subset, data dir and classes.
+        source_files (list): Annotation files or directories. The mtime and size of the files, and of the files
+            directly in the directories, invalidate the cache.
+        files_and_annotations (callable): Parse annotations and return files and gt boxes list.
+
+    Returns:
+        BoxAnnotationIndex: index of files and gt boxes.
+    """
+    cache_file = _cache_file(key, source_files) if environment.ANNOTATION_CACHE_DIR else None
+
+    if cache_file and os.path.exists(cache_file):
+        try:
+            return BoxAnnotationIndex.load(cache_file)
+        except (OSError, ValueError, KeyError):
+            print("Broken annotation cache {} is rebuilt.".format(cache_file))
+
+    files, annotations = files_and_annotations()
+    index = BoxAnnotationIndex.from_annotations(files, annotations)
+
+    if cache_file:
+        # write to temporary file and rename it not to read half written cache from other processes.
+        tmp_file = "{}.{}.tmp".format(cache_file, os.getpid())
+        try:
+            os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+            index.save(tmp_file)
+            os.replace(tmp_file, cache_file)
+        except OSError as e:
+            print("Failed to write annotation cache {}: {}".format(cache_file, e))
+
+    return index
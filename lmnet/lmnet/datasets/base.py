@@ -13,12 +13,18 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # =============================================================================
+import collections
+import fcntl
+import functools
+import hashlib
 import os
 from abc import ABCMeta, abstractmethod
 
 import numpy as np
 
 from lmnet import environment
+from lmnet.pre_processor import resize
+from lmnet.utils.image import load_image
 
 
 class Base(metaclass=ABCMeta):
@@ -32,6 +38,7 @@ class Base(metaclass=ABCMeta):
             pre_processor=None,
             data_format='NHWC',
             seed=None,
+            image_cache=None,
             **kwargs
     ):
         assert subset in self.available_subsets, self.available_subsets
@@ -41,6 +48,22 @@ class Base(metaclass=ABCMeta):
         self.pre_processor = pre_processor
         self.data_format = data_format
         self.seed = seed or 0
+        self.image_cache = image_cache
+
+    def _load_image(self, filename, convert_rgb=True):
+        """Returns numpy array of an image, through `image_cache` when it is set."""
+        if self.image_cache is None:
+            return load_image(filename, convert_rgb=convert_rgb)
+        return self.image_cache.load(filename, convert_rgb=convert_rgb)
+
+    def _load_label(self, filename):
+        """Returns numpy array of a label image, e.g. a segmentation mask, through `image_cache` when it is set.
+
+        Label images are never resized by `image_cache`, which would blend the class ids.
+        """
+        if self.image_cache is None:
+            return load_image(filename)
+        return self.image_cache.load(filename, resize=False)
 
     @property
     def data_dir(self):
@@ -128,6 +151,15 @@ class ObjectDetectionBase(Base, metaclass=ABCMeta):
         """Returns conunt max box size of available subsets."""
         pass
 
+    @property
+    @functools.lru_cache(maxsize=None)
+    def _class_ids(self):
+        """Map of {class name: class id} to look up class id of each box in O(1) like `classes.index`."""
+        class_ids = {}
+        for class_id, class_name in enumerate(self.classes):
+            class_ids.setdefault(class_name, class_id)
+        return class_ids
+
     def _fill_dummy_boxes(self, gt_boxes):
         dummy_gt_box = [0, 0, 0, 0, -1]
         if len(gt_boxes) == 0:
@@ -264,3 +296,146 @@ class StoragePathCustomizable():
 
         if self.subset is "validation":
             return self._validation_data_dir
+
+
+class ImageCache:
+    """Size bounded cache of decoded images.
+
+    Decoded uint8 images are kept in an in-memory LRU up to `max_bytes`.
+    The LRU is kept in each process, so with multi process prefetch, each worker has its own LRU
+    and the memory used by the LRUs is up to `max_bytes` times the number of processes.
+    When `cache_dir` is given, images are also spilled to `.npy` files which are read back with memory mapping,
+    so the on-disk store is shared by all prefetch workers and by later runs.
+    Entries are keyed by the file path and its mtime, so a modified image is decoded again.
+
+    Args:
+        max_bytes (int): Max bytes of the in-memory LRU of each process.
+        cache_dir (str): Directory of the on-disk store. Default is None, which disables the store.
+        max_disk_bytes (int): Max bytes of the on-disk store, shared by all the processes using `cache_dir`.
+            Default is None, which means unlimited.
+        resize (list | tuple): Resize images to [height, width] before caching.
+            Use it only for datasets whose labels do not depend on the image size.
+            Label images loaded by `Base._load_label` are not resized.
+
+    Examples:
+        | *DATASET.IMAGE_CACHE = ImageCache(max_bytes=4 * 1024 ** 3, cache_dir="/mnt/nvme/image_cache")*
+    """
+
+    def __init__(self, max_bytes=1024 ** 3, cache_dir=None, max_disk_bytes=None, resize=None):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.resize = resize
+
+        self._images = collections.OrderedDict()
+        self._bytes = 0
+        self._disk_full = False
+
+        if self.cache_dir and not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _key(self, filename, convert_rgb, size=None):
+        mtime = os.stat(filename).st_mtime_ns
+        source = "{}:{}:{}:{}".format(os.path.abspath(filename), mtime, convert_rgb, size)
+        return hashlib.sha1(source.encode("utf-8")).hexdigest()
+
+    def _decode(self, filename, convert_rgb, size):
+        image = load_image(filename, convert_rgb=convert_rgb)
+        if size:
+            image = resize(image, size=size)
+        return image
+
+    def _put_memory(self, key, image):
+        if image.nbytes > self.max_bytes:
+            return
+        self._images[key] = image
+        self._bytes += image.nbytes
+        while self._bytes > self.max_bytes:
+            _, evicted = self._images.popitem(last=False)
+            self._bytes -= evicted.nbytes
+
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir, "{}.npy".format(key))
+
+    def _get_disk(self, key):
+        path = self._disk_path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            return np.load(path, mmap_mode="r")
+        except (OSError, ValueError):
+            # broken file, e.g. a worker was killed while writing.
+            return None
+
+    def _disk_size(self):
+        return sum(entry.stat().st_size for entry in os.scandir(self.cache_dir) if entry.name.endswith(".npy"))
+
+    def _reserve_disk(self, key, nbytes):
+        """Reserve space in the on-disk store, returns False if the image must not be stored.
+
+        The size of the store is kept in a file under a file lock, so the bound holds for all the processes.
+        """
+        with open(os.path.join(self.cache_dir, "lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            # another worker has stored the image.
+            if os.path.exists(self._disk_path(key)):
+                return False
+
+            size_path = os.path.join(self.cache_dir, "size")
+            try:
+                with open(size_path) as f:
+                    size = int(f.read())
+            except (OSError, ValueError):
+                size = None
+
+            if size is None or size + nbytes > self.max_disk_bytes:
+                # count the actual size, as files may be removed or a killed worker may have left a reservation.
+                size = self._disk_size()
+            if size + nbytes > self.max_disk_bytes:
+                self._disk_full = True
+                stored = False
+            else:
+                size += nbytes
+                stored = True
+
+            with open(size_path, "w") as f:
+                f.write(str(size))
+            return stored
+
+    def _put_disk(self, key, image):
+        if self._disk_full:
+            return
+        if self.max_disk_bytes is not None and not self._reserve_disk(key, image.nbytes):
+            return
+
+        # write to a temporary file and rename it, so that other workers never read a partial file.
+        tmp_path = os.path.join(self.cache_dir, "{}.{}.tmp".format(key, os.getpid()))
+        with open(tmp_path, "wb") as f:
+            np.save(f, image)
+        os.replace(tmp_path, self._disk_path(key))
+
+    def load(self, filename, convert_rgb=True, resize=True):
+        """Returns numpy array of an image.
+
+        The returned array is a copy, so callers can modify it in place without breaking the cache.
+        With `resize` False, the image is not resized even if the cache has `resize`, e.g. for label images.
+        """
+        size = self.resize if resize else None
+        key = self._key(filename, convert_rgb, size)
+
+        image = self._images.get(key)
+        if image is not None:
+            self._images.move_to_end(key)
+            return image.copy()
+
+        if self.cache_dir:
+            image = self._get_disk(key)
+            if image is None:
+                image = self._decode(filename, convert_rgb, size)
+                self._put_disk(key, image)
+        else:
+            image = self._decode(filename, convert_rgb, size)
+
+        image = np.array(image)
+        self._put_memory(key, image)
+        return image.copy()
@@ -6,8 +6,8 @@ import os
 
 import numpy as np
 
+from lmnet.datasets.annotation_cache import cached_annotation_index
 from lmnet.datasets.base import ObjectDetectionBase, SegmentationBase
-from lmnet.utils.image import load_image
 
 
 class BDD100KObjectDetection(ObjectDetectionBase):
@@ -54,9 +54,8 @@ class BDD100KObjectDetection(ObjectDetectionBase):
 
         for subset in cls.available_subsets:
             obj = cls(subset=subset, base_path=base_path, is_shuffle=False)
-            gt_boxes_list = obj.bboxs
 
-            subset_max = max([len(gt_boxes) for gt_boxes in gt_boxes_list])
+            subset_max = obj._annotation_index.num_max_boxes
             if subset_max >= num_max_boxes:
                 num_max_boxes = subset_max
 
@@ -101,14 +100,23 @@ class BDD100KObjectDetection(ObjectDetectionBase):
         self._init_files_and_annotations()
 
     def _init_files_and_annotations(self):
+        """Init paths and gt boxes list through persistent annotation cache."""
+        cls = type(self)
+        cache_key = "{}.{}:{}{}{}".format(cls.__module__, cls.__name__, self.subset, self.data_dir, self.classes)
+        self._annotation_index = cached_annotation_index(
+            cache_key, [self.anno_dir, self.img_dir], self._files_and_annotations)
+        self.paths = self._annotation_index.files
+        self.bboxs = self._annotation_index.annotations
+
+    def _files_and_annotations(self):
         img_paths = dict([(os.path.basename(path), path)
                           for path in glob.glob(os.path.join(self.img_dir, "*.jpg"))])
         img_names = set(img_paths.keys())
 
         anno_data = json.load(open(self.anno_dir))
 
-        self.paths = []
-        self.bboxs = []
+        paths = []
+        bboxs = []
         for item in anno_data:
             # Skip if Label not in images
             img_name = item['name']
@@ -118,10 +126,10 @@ class BDD100KObjectDetection(ObjectDetectionBase):
             for label in item['labels']:
                 class_name = label['category'].replace(' ', '_')
                 # Skip if Classname/Category not in Selected classes
-                if class_name not in self.classes:
+                if class_name not in self._class_ids:
                     continue
 
-                cls_idx = self.classes.index(class_name)
+                cls_idx = self._class_ids[class_name]
                 x1 = int(round(label["box2d"]["x1"]))
                 x2 = int(round(label["box2d"]["x2"]))
                 y1 = int(round(label["box2d"]["y1"]))
@@ -136,13 +144,15 @@ class BDD100KObjectDetection(ObjectDetectionBase):
 
             num_boxes = len(bbox)
             if num_boxes > 0:
-                self.paths.append(img_paths[img_name])
-                self.bboxs.append(bbox)
+                paths.append(img_paths[img_name])
+                bboxs.append(bbox)
+
+        return paths, bboxs
 
     def __getitem__(self, i, type=None):
         image_file_path = self.paths[i]
 
-        image = load_image(image_file_path)
+        image = self._load_image(image_file_path)
 
         gt_boxes = self.bboxs[i]
         gt_boxes = np.array(gt_boxes)
@@ -284,8 +294,8 @@ class BDD100KSegmentation(SegmentationBase):
 
     def __getitem__(self, i):
         imgs, labels = self.files_and_annotations()
-        img = load_image(imgs[i])
-        label = load_image(labels[i])
+        img = self._load_image(imgs[i])
+        label = self._load_label(labels[i])
 
         return img, label
 
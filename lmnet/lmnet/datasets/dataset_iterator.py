@@ -13,11 +13,15 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # =============================================================================
+import collections
+import mmap
+import multiprocessing
 import os
 import queue
+import random
 import threading
 import time
-from multiprocessing import Pool
+from multiprocessing import Pool, TimeoutError
 
 import numpy as np
 import tensorflow as tf
@@ -26,21 +30,20 @@ from lmnet.datasets.base import ObjectDetectionBase, SegmentationBase, KeypointD
 from lmnet.datasets.tfds import TFDSMixin
 
 _dataset = None
+_batch_ring = None
 
 
-def _prefetch_setup(dataset, seed, do_shuffle):
-    global _dataset
+def _prefetch_setup(dataset, seed, do_shuffle, batch_ring=None):
+    global _dataset, _batch_ring
     _dataset = dataset
+    _batch_ring = batch_ring
     if do_shuffle:
         np.random.seed(os.getpid()+seed)
         _dataset.seed = os.getpid() + seed
         _dataset._shuffle()
 
 
-def _apply_augmentations(dataset, image, label):
-    augmentor = dataset.augmentor
-    pre_processor = dataset.pre_processor
-
+def _make_sample(dataset, image, label):
     sample = {'image': image}
 
     if issubclass(dataset.__class__, SegmentationBase):
@@ -52,8 +55,11 @@ def _apply_augmentations(dataset, image, label):
     else:
         sample['label'] = label
 
-    if callable(augmentor) and dataset.subset == 'train':
-        sample = augmentor(**sample)
+    return sample
+
+
+def _pre_process(dataset, sample):
+    pre_processor = dataset.pre_processor
 
     if callable(pre_processor):
         sample = pre_processor(**sample)
@@ -76,9 +82,66 @@ def _apply_augmentations(dataset, image, label):
     return (image, label)
 
 
-def _process_one_data(i):
-    image, label = _dataset[i]
-    return _apply_augmentations(_dataset, image, label)
+def _apply_augmentations(dataset, image, label):
+    augmentor = dataset.augmentor
+
+    sample = _make_sample(dataset, image, label)
+
+    if callable(augmentor) and dataset.subset == 'train':
+        sample = augmentor(**sample)
+
+    return _pre_process(dataset, sample)
+
+
+def _can_augment_batch(dataset, images, labels):
+    """Return True when the augmentor can process the whole batch with `apply_batch`."""
+    if not callable(dataset.augmentor) or dataset.subset != 'train':
+        return False
+    if not getattr(dataset.augmentor, "support_batch", False):
+        return False
+    # samples must have the same shape to be stacked into one batch.
+    return len({np.shape(image) for image in images}) == 1 and len({np.shape(label) for label in labels}) == 1
+
+
+def _apply_augmentations_batch(dataset, data_list):
+    """Apply augmentations to a list of (image, label).
+
+    When every processor of the augmentor supports `apply_batch`, the augmentor runs once over the stacked batch,
+    otherwise it falls back to `_apply_augmentations` for each sample.
+    """
+    images, labels = zip(*data_list)
+    if not _can_augment_batch(dataset, images, labels):
+        return [_apply_augmentations(dataset, image, label) for image, label in data_list]
+
+    batch = dataset.augmentor.apply_batch(**_make_sample(dataset, np.stack(images), np.stack(labels)))
+
+    result = []
+    for index in range(len(data_list)):
+        sample = {key: None if value is None else value[index] for key, value in batch.items()}
+        result.append(_pre_process(dataset, sample))
+    return result
+
+
+def _process_data_list(data_ids):
+    return _apply_augmentations_batch(_dataset, [_dataset[i] for i in data_ids])
+
+
+def _process_one_batch(task):
+    """Process one batch in a prefetch worker.
+
+    Workers are long-lived, so the random generators are reseeded by every task instead of recreating the pool.
+    When the task has a slot of the shared batch ring, samples are written into the slot in place
+    and only the slot index is sent back to the parent process.
+    """
+    data_ids, seed, slot = task
+    random.seed(seed)
+    np.random.seed(seed)
+    if slot is None:
+        return _concat_data(_process_data_list(data_ids))
+
+    for index, (image, label) in enumerate(_process_data_list(data_ids)):
+        _batch_ring.write(slot, index, image, label)
+    return slot
 
 
 def _concat_data(data_list):
@@ -88,6 +151,11 @@ def _concat_data(data_list):
     return (images, labels)
 
 
+def _shard_ids(ids, num_shards, shard_index):
+    """Return the ids of the shard. The shards of the same ids are disjoint and cover all the ids."""
+    return ids[shard_index::num_shards]
+
+
 def _xorshift32(r):
     r = r ^ (r << 13 & 0xFFFFFFFF)
     r = r ^ (r >> 17 & 0xFFFFFFFF)
@@ -95,22 +163,119 @@ def _xorshift32(r):
     return r & 0xFFFFFFFF
 
 
+class _SharedBatchRing:
+    """Ring of preallocated batch slots shared between the prefetch workers and the training process.
+
+    The slots live in anonymous shared mmaps, which are inherited by the `fork`-ed prefetch workers.
+    Workers write processed samples into a slot in place and the training process reads the slot
+    through NumPy views without copying, so every sample of the dataset must have the same shape after
+    augmentation and pre-processing.
+
+    Args:
+        num_slots (int): The number of batch slots.
+        batch_size (int): Batch size.
+        image (np.ndarray): A processed sample image which determines the image shape and dtype.
+        label (np.ndarray): A processed sample label which determines the label shape and dtype.
+    """
+
+    def __init__(self, num_slots, batch_size, image, label):
+        image = np.asarray(image)
+        label = np.asarray(label)
+        self.num_slots = num_slots
+        self._image_buffer = mmap.mmap(-1, max(num_slots * batch_size * image.nbytes, 1))
+        self._label_buffer = mmap.mmap(-1, max(num_slots * batch_size * label.nbytes, 1))
+        self.images = np.frombuffer(self._image_buffer, dtype=image.dtype, count=num_slots * batch_size * image.size)
+        self.images = self.images.reshape((num_slots, batch_size) + image.shape)
+        self.labels = np.frombuffer(self._label_buffer, dtype=label.dtype, count=num_slots * batch_size * label.size)
+        self.labels = self.labels.reshape((num_slots, batch_size) + label.shape)
+
+        self.free_slots = queue.Queue()
+        for slot in range(num_slots):
+            self.free_slots.put(slot)
+
+    def write(self, slot, index, image, label):
+        self.images[slot, index] = image
+        self.labels[slot, index] = label
+
+    def read(self, slot):
+        """Return views of the slot. These are valid until the slot is released."""
+        return self.images[slot], self.labels[slot]
+
+    def release(self, slot):
+        self.free_slots.put(slot)
+
+
+class PrefetchStats:
+    """Throughput counters of the multi process prefetcher.
+
+    `worker_stall_time` is the time the prefetch thread waited for workers to finish a batch,
+    `consumer_stall_time` is the time the training loop waited for a prefetched batch
+    and `producer_block_time` is the time the prefetch thread waited because the result queue was full.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.start_time = time.time()
+        self.num_batches = 0
+        self.worker_stall_time = 0.0
+        self.consumer_stall_time = 0.0
+        self.producer_block_time = 0.0
+
+    def add(self, name, value):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + value)
+
+    def summary(self, queue_depth=None):
+        """Return the counters as a dict."""
+        with self._lock:
+            elapsed = time.time() - self.start_time
+            return {
+                "batches": self.num_batches,
+                "batches_per_sec": self.num_batches / elapsed if elapsed > 0 else 0.0,
+                "queue_depth": queue_depth,
+                "worker_stall_time": self.worker_stall_time,
+                "consumer_stall_time": self.consumer_stall_time,
+                "producer_block_time": self.producer_block_time,
+            }
+
+
 class _MultiProcessDatasetPrefetchThread(threading.Thread):
-    def __init__(self, dataset, result_queue, seed):
+    """Feed batches processed by a persistent worker pool into `result_queue`.
+
+    Up to `num_batches_in_flight` batches are dispatched to the pool at once and collected in dispatch order,
+    so the batch order is the same as `_SimpleDatasetReader` for the same seed and shard.
+    When `batch_ring` is given, a batch is dispatched only if a free slot exists
+    and `result_queue` receives slot indices instead of batches.
+    """
+
+    def __init__(
+            self, dataset, result_queue, seed, num_processes=8, num_batches_in_flight=None, batch_ring=None,
+            num_shards=1, shard_index=0, indices=None,
+    ):
         super().__init__()
-        # TODO(tokunaga): the number of processes should be configurable
         self.seed = seed + 1  # seed must not be 0 because using xorshift32.
+        # the shards share the shuffle seed, but not the augmentation seeds.
+        self.task_seed = self.seed + shard_index
+        self.num_shards = num_shards
+        self.shard_index = shard_index
+        self.indices = indices
         self.support_getitem = hasattr(dataset, "__getitem__")
-        self.pool = Pool(processes=8, initializer=_prefetch_setup,
-                         initargs=(dataset, self.seed, not self.support_getitem))
+        self.num_processes = num_processes
+        self.num_batches_in_flight = num_batches_in_flight or num_processes * 2
+        self.batch_ring = batch_ring
+        self.pool = Pool(processes=self.num_processes, initializer=_prefetch_setup,
+                         initargs=(dataset, self.seed, not self.support_getitem, batch_ring))
         self.result_queue = result_queue
         self.batch_size = dataset.batch_size
         self.dataset = dataset
         self.data_ids = []
+        self.stats = PrefetchStats()
         self.terminate = False
         self.setDaemon(True)
 
     def gen_ids(self):
+        if self.indices is not None:
+            return list(self.indices)
         if hasattr(self.dataset, "__len__"):
             length = len(self.dataset)
         else:
@@ -125,49 +290,67 @@ class _MultiProcessDatasetPrefetchThread(threading.Thread):
                 self.seed = _xorshift32(self.seed)
                 random_state = np.random.RandomState(self.seed)
                 random_state.shuffle(self.data_ids)
+                self.data_ids = _shard_ids(self.data_ids, self.num_shards, self.shard_index)
             data_id = self.data_ids.pop()
             task_list.append(data_id)
-        return task_list
-
-    def chunks(self, l, n):
-        """Yield successive n-sized chunks from l."""
-        for i in range(0, len(l), n):
-            yield l[i:i + n]
-
-    def refresh_pool(self):
-        self.pool.close()
-        self.seed += 1
-        self.pool = Pool(processes=8, initializer=_prefetch_setup,
-                         initargs=(self.dataset, self.seed, not self.support_getitem))
-
-    def loop_body(self):
-        task_list = self.gen_task(self.dataset.batch_size * 8)
-        fetch_result = self.pool.map(_process_one_data, task_list)
-        for fetch_result_chunk in self.chunks(fetch_result, self.batch_size):
-            data_batch = _concat_data(fetch_result_chunk)
-            put_ok = False
-            while not put_ok:
-                try:
-                    self.result_queue.put(data_batch, 1)
-                    put_ok = True
-                except queue.Full:
-                    if self.terminate:
-                        break
+        self.task_seed = _xorshift32(self.task_seed)
+        return (task_list, self.task_seed)
+
+    def acquire_slot(self, block):
+        """Return a free slot of the batch ring, or None when there is no free slot."""
+        while not self.terminate:
+            try:
+                return self.batch_ring.free_slots.get(block=block, timeout=1)
+            except queue.Empty:
+                if not block:
+                    return None
+        return None
+
+    def dispatch(self, in_flight):
+        while len(in_flight) < self.num_batches_in_flight:
+            slot = None
+            if self.batch_ring is not None:
+                # wait for the consumer only when there is no batch in flight.
+                slot = self.acquire_slot(block=not in_flight)
+                if slot is None:
+                    break
+            data_ids, seed = self.gen_task(self.batch_size)
+            in_flight.append(self.pool.apply_async(_process_one_batch, ((data_ids, seed, slot),)))
+
+    def wait_result(self, async_result):
+        start = time.time()
+        data_batch = None
+        while not self.terminate:
+            try:
+                data_batch = async_result.get(1)
+                break
+            except TimeoutError:
+                continue
+        self.stats.add("worker_stall_time", time.time() - start)
+        return data_batch
+
+    def put_result(self, data_batch):
+        start = time.time()
+        while not self.terminate:
+            try:
+                self.result_queue.put(data_batch, timeout=1)
+                self.stats.add("num_batches", 1)
+                break
+            except queue.Full:
+                continue
+        self.stats.add("producer_block_time", time.time() - start)
 
     def run(self):
-        count = 0
+        in_flight = collections.deque()
         try:
-            while True:
-                if count == 1000:
-                    self.refresh_pool()
-                    count = 0
-                if self.terminate:
-                    print("break")
+            while not self.terminate:
+                self.dispatch(in_flight)
+                if not in_flight:
+                    continue
+                data_batch = self.wait_result(in_flight.popleft())
+                if data_batch is None:
                     break
-
-                self.loop_body()
-
-                count += 1
+                self.put_result(data_batch)
         finally:
             self.pool.close()
             self.pool.join()
@@ -175,10 +358,13 @@ class _MultiProcessDatasetPrefetchThread(threading.Thread):
 
 class _SimpleDatasetReader:
 
-    def __init__(self, dataset, seed, shuffle=True):
+    def __init__(self, dataset, seed, shuffle=True, num_shards=1, shard_index=0, indices=None):
         self.dataset = dataset
         self.seed = seed + 1  # seed must not be 0 because using xorshift32.
         self.shuffle = shuffle
+        self.num_shards = num_shards
+        self.shard_index = shard_index
+        self.indices = indices
         self.data_ids = []
 
     def _gen_ids(self, size):
@@ -186,31 +372,34 @@ class _SimpleDatasetReader:
         for _ in range(0, size):
             # when data_ids is empty, fill and shuffle.
             if len(self.data_ids) == 0:
-                self.data_ids = list(range(0, len(self.dataset)))
+                if self.indices is not None:
+                    self.data_ids = list(self.indices)
+                else:
+                    self.data_ids = list(range(0, len(self.dataset)))
                 if self.shuffle:
                     self.seed = _xorshift32(self.seed)
                     random_state = np.random.RandomState(self.seed)
                     random_state.shuffle(self.data_ids)
+                self.data_ids = _shard_ids(self.data_ids, self.num_shards, self.shard_index)
 
             yield self.data_ids.pop()
 
     def read(self):
         """Return batch size data."""
-        result = []
-        for i in self._gen_ids(self.dataset.batch_size):
-            image, label = self.dataset[i]
-            image, label = _apply_augmentations(self.dataset, image, label)
-            result.append((image, label))
-        return _concat_data(result)
+        data_list = [self.dataset[i] for i in self._gen_ids(self.dataset.batch_size)]
+        return _concat_data(_apply_augmentations_batch(self.dataset, data_list))
 
 
 class _TFDSReader:
 
-    def __init__(self, dataset):
-        tf_dataset = dataset.tf_dataset.shuffle(1024) \
-                                       .repeat() \
-                                       .batch(dataset.batch_size) \
-                                       .prefetch(tf.data.experimental.AUTOTUNE)
+    def __init__(self, dataset, num_shards=1, shard_index=0):
+        tf_dataset = dataset.tf_dataset
+        if num_shards > 1:
+            tf_dataset = tf_dataset.shard(num_shards, shard_index)
+        tf_dataset = tf_dataset.shuffle(1024) \
+                               .repeat() \
+                               .batch(dataset.batch_size) \
+                               .prefetch(tf.data.experimental.AUTOTUNE)
 
         iterator = tf.data.make_initializable_iterator(tf_dataset)
 
@@ -221,39 +410,104 @@ class _TFDSReader:
 
     def read(self):
         """Return batch size data."""
-        result = []
         batch = self.session.run(self.next_batch)
-        for image, label in zip(batch['image'], batch['label']):
-            image, label = _apply_augmentations(self.dataset, image, label)
-            result.append((image, label))
-        return _concat_data(result)
+        data_list = list(zip(batch['image'], batch['label']))
+        return _concat_data(_apply_augmentations_batch(self.dataset, data_list))
 
 
 class DatasetIterator:
 
     available_subsets = ["train", "train_validation_saving", "validation"]
 
-    """docstring for DatasetIterator."""
-    def __init__(self, dataset, enable_prefetch=False, seed=0):
+    """Iterator which returns batches of the dataset.
+
+    Args:
+        dataset: dataset instance.
+        enable_prefetch (bool): Use multi process prefetch.
+        seed (int): seed of shuffle.
+        prefetch_processes (int): The number of prefetch worker processes.
+        prefetch_batches_in_flight (int): The number of batches which are processed by prefetch workers at once.
+            Default is twice `prefetch_processes`.
+        prefetch_shared_memory (bool): Transport prefetched batches through a ring of shared memory slots.
+            The returned images and labels are views of a slot, and they are valid until the next batch is fetched.
+        num_shards (int): The number of shards which the dataset is partitioned into, e.g. the number of
+            distributed workers. Every epoch is shuffled with `seed` and split into disjoint shards,
+            so the iterators of all shards must have the same seed.
+        shard_index (int): The shard which this iterator reads, in [0, num_shards).
+            Sharding requires a TFDS dataset or a dataset with `__getitem__`.
+        indices (list): Indices of the samples to iterate, e.g. a subsample of the dataset. All samples if None.
+            TFDS datasets are not supported.
+    """
+    def __init__(
+            self,
+            dataset,
+            enable_prefetch=False,
+            seed=0,
+            prefetch_processes=8,
+            prefetch_batches_in_flight=None,
+            prefetch_shared_memory=False,
+            num_shards=1,
+            shard_index=0,
+            indices=None,
+    ):
+        if not 0 <= shard_index < num_shards:
+            raise ValueError("shard_index must be in [0, {}), but got {}.".format(num_shards, shard_index))
+
         self.dataset = dataset
+        self.indices = None if indices is None else [int(i) for i in indices]
         self.enable_prefetch = enable_prefetch
         self.seed = seed
+        self.batch_ring = None
+        self._consumed_slot = None
 
         if issubclass(dataset.__class__, TFDSMixin):
+            if self.indices is not None:
+                raise ValueError("indices are not supported for TFDS datasets.")
             self.enable_prefetch = False
-            self.reader = _TFDSReader(self.dataset)
+            self.reader = _TFDSReader(self.dataset, num_shards=num_shards, shard_index=shard_index)
         else:
+            if num_shards > 1 and not hasattr(dataset, "__getitem__"):
+                # the shards are partitioned by the sample ids, otherwise each shard would read the whole dataset.
+                raise ValueError("num_shards > 1 requires a dataset which supports __getitem__.")
             if self.enable_prefetch:
                 self.prefetch_result_queue = queue.Queue(maxsize=200)
-                self.prefetcher = _MultiProcessDatasetPrefetchThread(self.dataset, self.prefetch_result_queue, seed)
+                if prefetch_shared_memory:
+                    self.batch_ring = self._create_batch_ring(
+                        prefetch_batches_in_flight or prefetch_processes * 2
+                    )
+                self.prefetcher = _MultiProcessDatasetPrefetchThread(
+                    self.dataset,
+                    self.prefetch_result_queue,
+                    seed,
+                    num_processes=prefetch_processes,
+                    num_batches_in_flight=prefetch_batches_in_flight,
+                    batch_ring=self.batch_ring,
+                    num_shards=num_shards,
+                    shard_index=shard_index,
+                    indices=self.indices,
+                )
                 self.prefetcher.start()
                 print("ENABLE prefetch")
             else:
-                self.reader = _SimpleDatasetReader(self.dataset, seed)
+                self.reader = _SimpleDatasetReader(
+                    self.dataset, seed, num_shards=num_shards, shard_index=shard_index, indices=self.indices,
+                )
                 print("DISABLE prefetch")
 
+    def _create_batch_ring(self, num_batches_in_flight):
+        if multiprocessing.get_start_method() != "fork":
+            raise ValueError("prefetch_shared_memory requires the 'fork' start method of multiprocessing.")
+
+        # Process one sample to know the shape and dtype of the processed images and labels.
+        image, label = _apply_augmentations(self.dataset, *self.dataset[0])
+        # slots for the batches in flight, the batches waiting in the queue and the batch held by the consumer.
+        num_slots = num_batches_in_flight * 2 + 1
+        return _SharedBatchRing(num_slots, self.dataset.batch_size, image, label)
+
     @property
     def num_per_epoch(self):
+        if self.indices is not None:
+            return len(self.indices)
         return self.dataset.num_per_epoch
 
     @property
@@ -280,7 +534,16 @@ class DatasetIterator:
 
     def __next__(self):
         if self.enable_prefetch:
-            (images, labels) = self.prefetch_result_queue.get()
+            start = time.time()
+            result = self.prefetch_result_queue.get()
+            self.prefetcher.stats.add("consumer_stall_time", time.time() - start)
+            if self.batch_ring is not None:
+                # the previous batch has been consumed, so its slot can be recycled.
+                if self._consumed_slot is not None:
+                    self.batch_ring.release(self._consumed_slot)
+                self._consumed_slot = result
+                result = self.batch_ring.read(result)
+            (images, labels) = result
         else:
             images, labels = self.reader.read()
         return images, labels
@@ -289,8 +552,40 @@ class DatasetIterator:
         return self.__next__()
 
     def __len__(self):
+        if self.indices is not None:
+            return len(self.indices)
         return len(self.dataset)
 
+    def _generate_batches(self):
+        while True:
+            images, labels = self.__next__()
+            if self.batch_ring is not None:
+                # the shared memory slot is recycled on the next fetch, while tf.data may still buffer the batch.
+                images, labels = np.array(images), np.array(labels)
+            yield images, labels
+
+    def to_tf_dataset(self, output_types, output_shapes, prefetch_size=2, prefetch_to_device=None):
+        """Wrap the iterator into an endless `tf.data.Dataset` of (images, labels) batches.
+
+        The batches are fetched by the background threads of tf.data, so that fetching and copying
+        the next batch overlap with the current step.
+
+        Args:
+            output_types (tuple): tf.DType of images and labels.
+            output_shapes (tuple): tf.TensorShape of images and labels.
+            prefetch_size (int): The number of batches prefetched on the host.
+            prefetch_to_device (str): Device to prefetch batches to, e.g. "/gpu:0". No device prefetch if None.
+
+        Returns:
+            tf.data.Dataset: The dataset. When `prefetch_to_device` is set, it must be consumed by
+                an initializable iterator.
+        """
+        dataset = tf.data.Dataset.from_generator(self._generate_batches, output_types, output_shapes)
+        dataset = dataset.prefetch(prefetch_size)
+        if prefetch_to_device:
+            dataset = dataset.apply(tf.data.experimental.prefetch_to_device(prefetch_to_device, prefetch_size))
+        return dataset
+
     def update_dataset(self, indices):
         """Update own dataset by indices."""
         # do nothing so far
@@ -306,11 +601,16 @@ class DatasetIterator:
         self.seed += 1
         return random_indices
 
+    def prefetch_stats(self):
+        """Return throughput counters of the prefetcher as a dict, or None when prefetch is disabled."""
+        if not self.enable_prefetch:
+            return None
+        return self.prefetcher.stats.summary(queue_depth=self.prefetch_result_queue.qsize())
+
     def close(self):
         if self.enable_prefetch:
             self.prefetcher.terminate = True
-            self.prefetcher.pool.close()
-            self.prefetcher.pool.join()
+            self.prefetcher.join()
 
 
 if __name__ == '__main__':
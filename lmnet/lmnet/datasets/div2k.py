@@ -18,7 +18,6 @@ import os
 from glob import glob
 
 from lmnet.datasets.base import Base
-from lmnet.utils.image import load_image
 
 
 class Div2k(Base):
@@ -43,7 +42,7 @@ class Div2k(Base):
 
     def __getitem__(self, i, type=None):
         target_file = self.files[i]
-        image = load_image(target_file)
+        image = self._load_image(target_file)
 
         return image, None
 
@@ -21,7 +21,6 @@ import numpy as np
 import pandas as pd
 
 from lmnet import data_processor
-from lmnet.utils.image import load_image
 from lmnet.datasets.base import Base
 
 
@@ -88,7 +87,7 @@ class Ilsvrc2012(Base):
     def __getitem__(self, i, type=None):
         filename = self.files[i]
 
-        image = load_image(filename)
+        image = self._load_image(filename)
 
         label = data_processor.binarize(self.annotations[i], self.num_classes)
         label = np.reshape(label, (self.num_classes))
@@ -22,7 +22,6 @@ from glob import glob
 import numpy as np
 
 from lmnet import data_processor
-from lmnet.utils.image import load_image
 from lmnet.datasets.base import Base, StoragePathCustomizable
 from lmnet.utils.random import train_test_split
 
@@ -110,7 +109,7 @@ class ImageFolderBase(StoragePathCustomizable, Base):
     def __getitem__(self, i, type=None):
         target_file = self.files[i]
 
-        image = load_image(target_file)
+        image = self._load_image(target_file)
         label = self.get_label(target_file)
 
         label = data_processor.binarize(label, self.num_classes)
@@ -19,7 +19,7 @@ import os.path
 import numpy as np
 from pycocotools.coco import COCO
 
-from lmnet.utils.image import load_image
+from lmnet.datasets.annotation_cache import cached_annotation_index
 from lmnet.datasets.base import ObjectDetectionBase, SegmentationBase
 
 DEFAULT_CLASSES = [
@@ -119,7 +119,7 @@ class MscocoSegmentation(SegmentationBase):
     def __getitem__(self, i, type=None):
         image_id = self._image_ids[i]
         image_file = self._image_file_from_image_id(image_id)
-        image = load_image(image_file)
+        image = self._load_image(image_file)
 
         label = self._label_from_image_id(image_id)
 
@@ -171,8 +171,7 @@ class MscocoObjectDetection(ObjectDetectionBase):
 
         for subset in cls.available_subsets:
             obj = cls(subset=subset)
-            gt_boxes_list = obj.annotations
-            subset_max = max([len(gt_boxes) for gt_boxes in gt_boxes_list])
+            subset_max = obj._annotation_index.num_max_boxes
             if subset_max >= num_max_boxes:
                 num_max_boxes = subset_max
 
@@ -219,7 +218,7 @@ class MscocoObjectDetection(ObjectDetectionBase):
     @functools.lru_cache(maxsize=None)
     def coco_category_id_to_lmnet_class_id(self, cat_id):
         target_class = self.coco.loadCats(cat_id)[0]['name']
-        class_id = self.classes.index(target_class)
+        class_id = self._class_ids[target_class]
         return class_id
 
     @functools.lru_cache(maxsize=None)
@@ -250,12 +249,20 @@ class MscocoObjectDetection(ObjectDetectionBase):
 
         return files, gt_boxes_list
 
+    def _annotation_cache_key(self):
+        """Return string of the settings which affect the annotations."""
+        cls = type(self)
+        return "{}.{}:{}{}{}".format(cls.__module__, cls.__name__, self.subset, self.data_dir, self.classes)
+
     def _init_files_and_annotations(self):
-        self.files, self.annotations = self._files_and_annotations()
+        """Init files and gt_boxes list from annotation json, through persistent annotation cache."""
+        self._annotation_index = cached_annotation_index(
+            self._annotation_cache_key(), [self.json], self._files_and_annotations)
+        self.files, self.annotations = self._annotation_index.files, self._annotation_index.annotations
 
     def __getitem__(self, i, type=None):
         target_file = self.files[i]
-        image = load_image(target_file)
+        image = self._load_image(target_file)
 
         gt_boxes = self.annotations[i]
         gt_boxes = np.array(gt_boxes)
@@ -290,6 +297,9 @@ class MscocoObjectDetectionPerson(MscocoObjectDetection):
             **kwargs,
         )
 
+    def _annotation_cache_key(self):
+        return super()._annotation_cache_key() + str(self.threshold_size)
+
     @functools.lru_cache(maxsize=None)
     def _gt_boxes_from_image_id(self, image_id):
         """Return gt boxes list ([[x, y, w, h, class_id]]) of a image."""
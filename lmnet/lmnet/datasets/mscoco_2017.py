@@ -18,7 +18,6 @@ import os.path
 import numpy as np
 from pycocotools.coco import COCO
 
-from lmnet.utils.image import load_image
 from lmnet.datasets.base import KeypointDetectionBase
 
 
@@ -151,7 +150,7 @@ class MscocoSinglePersonKeypoints(KeypointDetectionBase):
             cropped_image: a numpy array of shape (height, width, 3).
             joints: a numpy array of shape (17, 3), which has local coordinates in cropped_image.
         """
-        full_image = load_image(self.files[item])
+        full_image = self._load_image(self.files[item])
         box = self.box_list[item]
         joints = self.joints_list[item]
 
@@ -24,8 +24,8 @@ from collections import OrderedDict
 import numpy as np
 
 from lmnet import data_processor
+from lmnet.datasets.annotation_cache import cached_annotation_index
 from lmnet.datasets.base import Base, ObjectDetectionBase, StoragePathCustomizable
-from lmnet.utils.image import load_image
 from lmnet.utils.random import train_test_split
 
 
@@ -108,8 +108,9 @@ class OpenImagesV4BoundingBox(OpenImagesV4, ObjectDetectionBase):
     @property
     @functools.lru_cache(maxsize=None)
     def classes(self):
+        # keep the hierarchy order, set order changes in each process and so class ids and annotation cache do.
         classes = [self._classes_meta[label_name] for label_name in
-                   set([v for k, v in self._target_labels.items()])]
+                   OrderedDict.fromkeys(self._target_labels.values())]
 
         return classes
 
@@ -154,10 +155,27 @@ class OpenImagesV4BoundingBox(OpenImagesV4, ObjectDetectionBase):
 
         return bboxes
 
+    @property
+    def _annotation_source_files(self):
+        return [
+            self.annotations_csv,
+            self.class_descriptions_csv,
+            os.path.join(self.data_dir, 'bbox_labels_600_hierarchy.json'),
+        ]
+
+    @property
+    @functools.lru_cache(maxsize=None)
+    def _annotation_index(self):
+        """Files and gt boxes index, which is cached on disk not to parse the large annotation csv every time."""
+        cls = type(self)
+        cache_key = "{}.{}:{}{}{}{}".format(
+            cls.__module__, cls.__name__, self.subset, self.data_dir, self._class_level, self.classes)
+        return cached_annotation_index(cache_key, self._annotation_source_files, self._files_and_annotations)
+
     @property
     @functools.lru_cache(maxsize=None)
     def files_and_annotations(self):
-        return self._files_and_annotations()
+        return self._annotation_index.files, self._annotation_index.annotations
 
     def _files_and_annotations(self):
         files = []
@@ -167,7 +185,7 @@ class OpenImagesV4BoundingBox(OpenImagesV4, ObjectDetectionBase):
             files.append(os.path.join(self.images_dir, "{}.jpg".format(k)))
             for b in v:
                 class_name = self._classes_meta[self._target_labels[b[4]]]
-                b[4] = self.classes.index(class_name)
+                b[4] = self._class_ids[class_name]
             annotations.append(v)
 
         return files, annotations
@@ -180,9 +198,8 @@ class OpenImagesV4BoundingBox(OpenImagesV4, ObjectDetectionBase):
 
         for subset in cls.available_subsets:
             obj = cls(subset=subset, is_shuffle=False)
-            _, gt_boxes_list = obj.files_and_annotations
 
-            subset_max = max([len(gt_boxes) for gt_boxes in gt_boxes_list])
+            subset_max = obj._annotation_index.num_max_boxes
             if subset_max >= num_max_boxes:
                 num_max_boxes = subset_max
 
@@ -197,7 +214,7 @@ class OpenImagesV4BoundingBox(OpenImagesV4, ObjectDetectionBase):
         target_file = files[i]
         gt_boxes = gt_boxes_list[i]
 
-        image = load_image(target_file)
+        image = self._load_image(target_file)
         height = image.shape[0]
         width = image.shape[1]
 
@@ -265,7 +282,7 @@ class OpenImagesV4Classification(OpenImagesV4):
 
         filename = files[i]
 
-        image = load_image(filename)
+        image = self._load_image(filename)
 
         label = data_processor.binarize(labels[i], self.num_classes)
         label = np.reshape(label, (self.num_classes))
@@ -330,10 +347,14 @@ class OpenImagesV4BoundingBoxBase(StoragePathCustomizable, OpenImagesV4BoundingB
     def classes(self):
         return list(self._classes_meta.values())
 
+    @property
+    def _annotation_source_files(self):
+        return [self.annotations_csv, self.class_descriptions_csv]
+
     @property
     @functools.lru_cache(maxsize=None)
     def files_and_annotations(self):
-        files, annotations = self._files_and_annotations()
+        files, annotations = self._annotation_index.files, self._annotation_index.annotations
         if self.validation_size > 0:
             train_files, test_files, train_annotations, test_annotations = train_test_split(
                 files, annotations, test_size=self.validation_size, seed=1)
@@ -357,7 +378,7 @@ class OpenImagesV4BoundingBoxBase(StoragePathCustomizable, OpenImagesV4BoundingB
         for k, v in bboxes.items():
             files.append(os.path.join(self.images_dir, "{}.jpg".format(k)))
             for b in v:
-                b[4] = self.classes.index(self._classes_meta[b[4]])
+                b[4] = self._class_ids[self._classes_meta[b[4]]]
             annotations.append(v)
 
         return files, annotations
@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 The Blueoil Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+"""Pack-once binary dataset format.
+
+A dataset is packed by `executor/pack_dataset.py` into `<data_dir>/<name>/<subset>/`:
+
+    meta.json          classes, task, the number of examples, image format and label store.
+    index.npy          int64 array of [num_examples, 6(shard, offset, length, height, width, channels)].
+    images-00000.bin   image bytes, raw uint8 arrays or JPEG files, concatenated into shards.
+    labels.npy         labels as one array, when all labels have the same shape.
+    labels_index.npy   int64 array of [num_examples, 3 + label ndim(shard, offset, length, shape...)]
+    labels-00000.bin   raw label bytes, when labels have different shapes e.g. segmentation masks.
+
+Packed datasets are read through `np.memmap`, so opening a dataset is O(1)
+and random access needs no directory scan nor annotation parsing.
+"""
+import io
+import json
+import os
+import shutil
+
+import numpy as np
+import PIL.Image
+
+from lmnet.datasets.base import Base, KeypointDetectionBase, ObjectDetectionBase, SegmentationBase
+
+IMAGE_FORMATS = ["raw", "jpeg"]
+
+_META_FILE = "meta.json"
+_INDEX_FILE = "index.npy"
+_LABELS_FILE = "labels.npy"
+_LABELS_INDEX_FILE = "labels_index.npy"
+
+
+def _task_of(dataset_class):
+    if issubclass(dataset_class, SegmentationBase):
+        return "segmentation"
+    if issubclass(dataset_class, ObjectDetectionBase):
+        return "object_detection"
+    if issubclass(dataset_class, KeypointDetectionBase):
+        return "keypoint_detection"
+    return "classification"
+
+
+def _shard_path(subset_dir, prefix, shard):
+    return os.path.join(subset_dir, "{}-{:05d}.bin".format(prefix, shard))
+
+
+class _ShardWriter:
+    """Append byte strings into shard files which are no larger than `shard_size` except a single large item."""
+
+    def __init__(self, subset_dir, prefix, shard_size):
+        self.subset_dir = subset_dir
+        self.prefix = prefix
+        self.shard_size = shard_size
+        self.shard = -1
+        self.offset = 0
+        self.file = None
+
+    def _next_shard(self):
+        if self.file:
+            self.file.close()
+        self.shard += 1
+        self.offset = 0
+        self.file = open(_shard_path(self.subset_dir, self.prefix, self.shard), "wb")
+
+    def write(self, data):
+        if self.file is None or (self.offset > 0 and self.offset + len(data) > self.shard_size):
+            self._next_shard()
+        position = (self.shard, self.offset, len(data))
+        self.file.write(data)
+        self.offset += len(data)
+        return position
+
+    def close(self):
+        if self.file:
+            self.file.close()
+        return self.shard + 1
+
+
+class _ShardReader:
+    """Read byte ranges of shard files through lazily opened memory maps."""
+
+    def __init__(self, subset_dir, prefix):
+        self.subset_dir = subset_dir
+        self.prefix = prefix
+        self._shards = {}
+
+    def read(self, shard, offset, length):
+        if shard not in self._shards:
+            self._shards[shard] = np.memmap(_shard_path(self.subset_dir, self.prefix, shard), dtype=np.uint8, mode="r")
+        return self._shards[shard][offset:offset + length]
+
+    def __getstate__(self):
+        # memory maps are reopened in each process.
+        state = self.__dict__.copy()
+        state["_shards"] = {}
+        return state
+
+
+def _encode_image(image, image_format):
+    image = np.ascontiguousarray(image, dtype=np.uint8)
+    if image_format == "raw":
+        return image.tobytes()
+
+    buffer = io.BytesIO()
+    PIL.Image.fromarray(image).save(buffer, format="JPEG", quality=95)
+    return buffer.getvalue()
+
+
+def write_packed_subset(dataset, subset_dir, image_format="raw", shard_size=1024 ** 3):
+    """Write all items of a dataset instance into `subset_dir`.
+
+    Args:
+        dataset: An instance of `lmnet.datasets.base.Base` subclass which supports `__getitem__`.
+        subset_dir (str): Output directory.
+        image_format (str): "raw" stores uint8 arrays as is, "jpeg" stores JPEG encoded images.
+        shard_size (int): Max bytes of a shard file.
+    """
+    if image_format not in IMAGE_FORMATS:
+        raise ValueError("image_format should be one of {}, but got {}.".format(IMAGE_FORMATS, image_format))
+
+    if os.path.exists(subset_dir):
+        shutil.rmtree(subset_dir)
+    os.makedirs(subset_dir)
+
+    num_examples = len(dataset)
+    index = np.zeros((num_examples, 6), dtype=np.int64)
+    labels = []
+    image_writer = _ShardWriter(subset_dir, "images", shard_size)
+
+    for i in range(num_examples):
+        image, label = dataset[i]
+        image = np.asarray(image)
+        if image.ndim == 2:
+            image = image[:, :, np.newaxis]
+
+        shard, offset, length = image_writer.write(_encode_image(image, image_format))
+        index[i] = [shard, offset, length, image.shape[0], image.shape[1], image.shape[2]]
+        labels.append(np.asarray(label))
+
+    num_image_shards = image_writer.close()
+    np.save(os.path.join(subset_dir, _INDEX_FILE), index)
+
+    meta = {
+        "task": _task_of(dataset.__class__),
+        "subset": dataset.subset,
+        "classes": list(dataset.classes),
+        "num_examples": num_examples,
+        "image_format": image_format,
+        "num_image_shards": num_image_shards,
+    }
+
+    if len({label.shape for label in labels}) <= 1:
+        meta["label_store"] = "array"
+        np.save(os.path.join(subset_dir, _LABELS_FILE), np.array(labels))
+    else:
+        meta["label_store"] = "shards"
+        meta["label_dtype"] = np.result_type(*labels).str
+        label_ndim = labels[0].ndim
+        labels_index = np.zeros((num_examples, 3 + label_ndim), dtype=np.int64)
+        label_writer = _ShardWriter(subset_dir, "labels", shard_size)
+        for i, label in enumerate(labels):
+            if label.ndim != label_ndim:
+                raise ValueError("All labels should have the same number of dimensions.")
+            label = np.ascontiguousarray(label, dtype=meta["label_dtype"])
+            labels_index[i] = list(label_writer.write(label.tobytes())) + list(label.shape)
+        meta["num_label_shards"] = label_writer.close()
+        np.save(os.path.join(subset_dir, _LABELS_INDEX_FILE), labels_index)
+
+    if meta["task"] == "object_detection":
+        meta["num_max_boxes"] = int(dataset.num_max_boxes)
+
+    if meta["task"] == "segmentation":
+        meta["label_colors"] = np.asarray(dataset.label_colors).tolist()
+
+    with open(os.path.join(subset_dir, _META_FILE), "w") as f:
+        json.dump(meta, f, indent=2)
+
+    return meta
+
+
+def packed_dataset_class(dataset_class):
+    """Return the packed dataset class which has the same task as `dataset_class`."""
+    return {
+        "classification": PackedClassification,
+        "object_detection": PackedObjectDetection,
+        "segmentation": PackedSegmentation,
+        "keypoint_detection": PackedKeypointDetection,
+    }[_task_of(dataset_class)]
+
+
+class PackedMixin:
+    """A Mixin to compose dataset classes which read datasets packed by `executor/pack_dataset.py`.
+
+    Args:
+        name (str): Name of the packed dataset.
+        data_dir (str): Directory which has the packed dataset.
+    """
+    available_subsets = ["train", "validation", "train_validation_saving", "test"]
+    extend_dir = None
+
+    def __init__(
+            self,
+            name,
+            data_dir,
+            *args,
+            **kwargs
+    ):
+        super().__init__(
+            *args,
+            **kwargs,
+        )
+
+        self.subset_dir = os.path.join(os.path.expanduser(data_dir), name, self.subset)
+        meta_file = os.path.join(self.subset_dir, _META_FILE)
+        if not os.path.exists(meta_file):
+            raise ValueError("Packed dataset does not exist: {}\n"
+                             "Please run `python executor/pack_dataset.py -c <config file>` before training."
+                             .format(self.subset_dir))
+
+        with open(meta_file) as f:
+            self.meta = json.load(f)
+
+        self._index = np.load(os.path.join(self.subset_dir, _INDEX_FILE), mmap_mode="r")
+        self._images = _ShardReader(self.subset_dir, "images")
+
+        if self.meta["label_store"] == "array":
+            self._labels = np.load(os.path.join(self.subset_dir, _LABELS_FILE), mmap_mode="r")
+        else:
+            self._labels_index = np.load(os.path.join(self.subset_dir, _LABELS_INDEX_FILE), mmap_mode="r")
+            self._label_shards = _ShardReader(self.subset_dir, "labels")
+
+    @property
+    def classes(self):
+        return self.meta["classes"]
+
+    @property
+    def num_classes(self):
+        return len(self.classes)
+
+    @property
+    def num_per_epoch(self):
+        return self.meta["num_examples"]
+
+    def __len__(self):
+        return self.num_per_epoch
+
+    def _read_image(self, i):
+        shard, offset, length, height, width, channels = self._index[i]
+        data = self._images.read(shard, offset, length)
+
+        if self.meta["image_format"] == "raw":
+            image = np.array(data).reshape(height, width, channels)
+        else:
+            image = np.array(PIL.Image.open(io.BytesIO(data.tobytes())))
+
+        if image.ndim == 3 and image.shape[2] == 1:
+            image = image[:, :, 0]
+        return image
+
+    def _read_label(self, i):
+        if self.meta["label_store"] == "array":
+            return np.array(self._labels[i])
+
+        shard, offset, length = self._labels_index[i, :3]
+        shape = tuple(self._labels_index[i, 3:])
+        data = self._label_shards.read(shard, offset, length)
+        return np.frombuffer(data.tobytes(), dtype=self.meta["label_dtype"]).reshape(shape)
+
+    def __getitem__(self, i, type=None):
+        return (self._read_image(i), self._read_label(i))
+
+
+class PackedClassification(PackedMixin, Base):
+    """A dataset class for loading packed datasets for classification."""
+    pass
+
+
+class PackedObjectDetection(PackedMixin, ObjectDetectionBase):
+    """A dataset class for loading packed datasets for object detection."""
+
+    def count_max_boxes(self):
+        """Count max boxes size over all packed subsets of the packed dataset.
+
+        It has the signature of `ObjectDetectionBase.count_max_boxes`, but it is called on an instance,
+        as the packed dataset directory is given to the instance.
+        """
+        packed_dir = os.path.dirname(self.subset_dir)
+        max_boxes = 0
+        for subset in os.listdir(packed_dir):
+            meta_file = os.path.join(packed_dir, subset, _META_FILE)
+            if os.path.exists(meta_file):
+                with open(meta_file) as f:
+                    max_boxes = max(max_boxes, json.load(f)["num_max_boxes"])
+        return max_boxes
+
+    @property
+    def num_max_boxes(self):
+        return self.meta["num_max_boxes"]
+
+
+class PackedSegmentation(PackedMixin, SegmentationBase):
+    """A dataset class for loading packed datasets for segmentation."""
+
+    @property
+    def label_colors(self):
+        if self._label_colors:
+            return self._label_colors
+        return np.array(self.meta["label_colors"])
+
+
+class PackedKeypointDetection(PackedMixin, KeypointDetectionBase):
+    """A dataset class for loading packed datasets for keypoint detection."""
+    pass
@@ -21,7 +21,7 @@ import xml.etree.ElementTree as ET
 import numpy as np
 import pandas as pd
 
-from lmnet.utils.image import load_image
+from lmnet.datasets.annotation_cache import cached_annotation_index
 from lmnet.datasets.base import ObjectDetectionBase
 
 
@@ -36,9 +36,8 @@ class PascalvocBase(ObjectDetectionBase):
 
         for subset in cls.available_subsets:
             obj = cls(subset=subset, skip_difficult=skip_difficult)
-            gt_boxes_list = obj.annotations
 
-            subset_max = max([len(gt_boxes) for gt_boxes in gt_boxes_list])
+            subset_max = obj._annotation_index.num_max_boxes
             if subset_max >= num_max_boxes:
                 num_max_boxes = subset_max
 
@@ -123,10 +122,10 @@ class PascalvocBase(ObjectDetectionBase):
                 continue
 
             class_name = obj.find('name').text
-            if class_name not in self.classes:
+            if class_name not in self._class_ids:
                 continue
 
-            class_index = self.classes.index(class_name)
+            class_index = self._class_ids[class_name]
 
             for e in list(obj):
                 if e.tag == "bndbox":
@@ -199,21 +198,32 @@ class PascalvocBase(ObjectDetectionBase):
         raise NotImplemented()
 
     def _init_files_and_annotations(self):
-        """Init files and gt_boxes list, Cache these."""
+        """Init files and gt_boxes list, Cache these.
+
+        Parsed annotations are also cached on disk by `cached_annotation_index`, which is invalidated by
+        mtime and size of the files in `Annotations` and `ImageSets/Main` directories,
+        i.e. when annotation files are added, removed or edited.
+        """
 
         cache_key = self.subset + self.data_dir + str(self.classes) + str(self.skip_difficult)
         cls = self.__class__
 
         if cache_key in cls._cache:
             cached_obj = cls._cache[cache_key]
+            self._annotation_index = cached_obj._annotation_index
             self.files, self.annotations = cached_obj.files, cached_obj.annotations
         else:
-            self.files, self.annotations = self._files_and_annotations()
+            self._annotation_index = cached_annotation_index(
+                "{}.{}:{}".format(cls.__module__, cls.__name__, cache_key),
+                [self.annotations_dir, self.imagesets_dir],
+                self._files_and_annotations,
+            )
+            self.files, self.annotations = self._annotation_index.files, self._annotation_index.annotations
             cls._cache[cache_key] = self
 
     def __getitem__(self, i, type=None):
         target_file = self.files[i]
-        image = load_image(target_file)
+        image = self._load_image(target_file)
 
         gt_boxes = self.annotations[i]
         gt_boxes = np.array(gt_boxes)
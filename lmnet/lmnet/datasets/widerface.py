@@ -13,12 +13,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # =============================================================================
+import collections
 import functools
 import os
 
 import numpy as np
 
-from lmnet.utils.image import load_image
+from lmnet.datasets.annotation_cache import cached_annotation_index
 from lmnet.datasets.base import ObjectDetectionBase
 
 
@@ -35,9 +36,8 @@ class WiderFace(ObjectDetectionBase):
 
         for subset in cls.available_subsets:
             obj = cls(subset=subset, base_path=base_path)
-            gt_boxes_list = obj.bboxs
 
-            subset_max = max([len(gt_boxes) for gt_boxes in gt_boxes_list])
+            subset_max = obj._annotation_index.num_max_boxes
             if subset_max >= num_max_boxes:
                 num_max_boxes = subset_max
 
@@ -78,36 +78,58 @@ class WiderFace(ObjectDetectionBase):
         self.img_dir = self.img_dirs[subset]
         self._init_files_and_annotations()
 
-    def _init_files_and_annotations(self):
-
+    @property
+    def annotation_file(self):
         base_dir = os.path.join(self.data_dir, "wider_face_split")
 
         if self.subset == "train":
-            file_name = os.path.join(base_dir, "wider_face_train_bbx_gt.txt")
+            return os.path.join(base_dir, "wider_face_train_bbx_gt.txt")
 
         if self.subset == "validation":
-            file_name = os.path.join(base_dir, "wider_face_val_bbx_gt.txt")
+            return os.path.join(base_dir, "wider_face_val_bbx_gt.txt")
+
+    def _init_files_and_annotations(self):
+        """Init paths and gt boxes list through persistent annotation cache."""
+        cls = type(self)
+        cache_key = "{}.{}:{}{}{}".format(cls.__module__, cls.__name__, self.subset, self.data_dir, self.max_boxes)
+
+        def files_and_annotations():
+            paths, bboxs, _ = self._parse_annotations()
+            return paths, bboxs
+
+        self._annotation_index = cached_annotation_index(cache_key, [self.annotation_file], files_and_annotations)
+        self.paths = self._annotation_index.files
+        self.bboxs = self._annotation_index.annotations
+
+    @property
+    @functools.lru_cache(maxsize=None)
+    def labels(self):
+        """Attributes (blur, expression, ...) of each image. They are not cached, parse annotation on demand."""
+        _, _, labels = self._parse_annotations()
+        return labels
 
+    def _parse_annotations(self):
         paths = []
         bboxs = []
         labels = []
 
-        with open(file_name) as f:
-            lines = f.readlines()
+        with open(self.annotation_file) as f:
+            lines = collections.deque(f.readlines())
         while True:
             if len(lines) == 0:
                 break
-            path = lines.pop(0)[:-1]
-            num_boxes = int(lines.pop(0)[:-1])
+            path = lines.popleft()[:-1]
+            num_boxes = int(lines.popleft()[:-1])
             bbox = []
             label = {}
             skip_image = False
             if num_boxes > self.num_max_boxes:
-                lines = lines[num_boxes:]
+                for _ in range(num_boxes):
+                    lines.popleft()
                 continue
             else:
                 for i in range(num_boxes):
-                    line = lines.pop(0)[:-1]
+                    line = lines.popleft()[:-1]
                     x, y, w, h, blur, expression, illumination, invalid, occlusion, pose, _ = line.split(" ")
                     temp = [int(x), int(y), int(w), int(h), 0]
 
@@ -133,15 +155,13 @@ class WiderFace(ObjectDetectionBase):
                 bboxs.append(bbox)
                 labels.append(label)
 
-        self.paths = paths
-        self.bboxs = bboxs
         # Keep labels here in case of future use
-        self.labels = labels
+        return paths, bboxs, labels
 
     def __getitem__(self, i, type=None):
         target_file = os.path.join(self.img_dir, self.paths[i])
 
-        image = load_image(target_file)
+        image = self._load_image(target_file)
 
         gt_boxes = self.bboxs[i]
         gt_boxes = np.array(gt_boxes)
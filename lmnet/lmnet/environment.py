@@ -18,6 +18,9 @@ import os.path
 TMP_DIR = "tmp"
 LOG_DIR = os.path.join(TMP_DIR, "log")
 
+# directory to cache parsed annotations of datasets. empty string disables the cache.
+ANNOTATION_CACHE_DIR = os.getenv("ANNOTATION_CACHE_DIR", os.path.join(TMP_DIR, "annotation_cache"))
+
 default_data_dir = "dataset"
 # DATA_DIR = os.getenv("DATA_DIR", default_data_dir)
 DATA_DIR = os.getenv("DATA_DIR", os.path.join(os.getcwd(), default_data_dir))
@@ -60,13 +63,15 @@ def init(experiment_id):
 
 
 def setup_test_environment():
-    """Override `OUTPUT_DIR` and `DATA_DIR` for test."""
-    global _init_flag, DATA_DIR, _EXPERIMENT_DIR, _TENSORBOARD_DIR, _CHECKPOINTS_DIR
+    """Override `OUTPUT_DIR`, `DATA_DIR` and `ANNOTATION_CACHE_DIR` for test."""
+    global _init_flag, DATA_DIR, ANNOTATION_CACHE_DIR, _EXPERIMENT_DIR, _TENSORBOARD_DIR, _CHECKPOINTS_DIR
 
     _init_flag = False
 
     DATA_DIR = "tests/fixtures/datasets"
 
+    ANNOTATION_CACHE_DIR = "tmp/tests/annotation_cache"
+
     OUTPUT_DIR = "tmp/tests/saved"
 
     _EXPERIMENT_DIR = os.path.join(OUTPUT_DIR, "{experiment_id}")
@@ -76,13 +81,15 @@ def setup_test_environment():
 
 def teardown_test_environment():
     """Reset test environment."""
-    global _init_flag, DATA_DIR, _EXPERIMENT_DIR, _TENSORBOARD_DIR, _CHECKPOINTS_DIR
+    global _init_flag, DATA_DIR, ANNOTATION_CACHE_DIR, _EXPERIMENT_DIR, _TENSORBOARD_DIR, _CHECKPOINTS_DIR
 
     _init_flag = False
 
     default_data_dir = "dataset"
     DATA_DIR = os.getenv("DATA_DIR", default_data_dir)
 
+    ANNOTATION_CACHE_DIR = os.getenv("ANNOTATION_CACHE_DIR", os.path.join(TMP_DIR, "annotation_cache"))
+
     default_output_dir = "saved"
     OUTPUT_DIR = os.getenv("OUTPUT_DIR", default_output_dir)
 
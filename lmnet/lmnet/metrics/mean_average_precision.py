@@ -261,6 +261,115 @@ def _cummax(x, reverse=False, name=None):
 # ===========================================================================
 # Mean average precision computations on numpy
 # ===========================================================================
+class MeanAveragePrecision:
+    """Streaming mean average precision on numpy.
+
+    The boxes of each image are grouped by class once, and the overlaps of the predicted boxes with the
+    ground truth boxes are computed as one matrix of the image. Only a tp flag and a score
+    of each predicted box are kept over the batches, so the boxes of a batch can be released after `update`.
+    The results are identical to evaluating all the images at once.
+
+    Args:
+        classes(list): classes list.
+        overlap_thresh(float): threshold of overlap.
+    """
+
+    def __init__(self, classes, overlap_thresh=0.5):
+        self.classes = classes
+        self.overlap_thresh = overlap_thresh
+        self.reset()
+
+    def reset(self):
+        num_classes = len(self.classes)
+        self._tps = [[] for _ in range(num_classes)]
+        self._scores = [[] for _ in range(num_classes)]
+        self._num_gt_boxes = np.zeros(num_classes, dtype=np.int64)
+
+    def update(self, predict_boxes, gt_boxes):
+        """Accumulate tp and score of the predicted boxes of a batch.
+
+        Args:
+            predict_boxes(list): python list of numpy.ndarray. predicted boxes of the images in the batch.
+                predict_boxes[image_index] shape is [num_pred_boxes, 6(x, y, w, h, class, scores)]
+            gt_boxes(numpy.ndarray): ground truth boxes of the images in the batch.
+                shape is [batch_size, num_max_gt_boxes, 5(x, y, w, h, class)]
+        """
+        assert len(predict_boxes) == len(gt_boxes)
+        num_classes = len(self.classes)
+
+        tps = [[] for _ in range(num_classes)]
+        scores = [[] for _ in range(num_classes)]
+
+        for pred_boxes_in_image, gt_boxes_in_image in zip(predict_boxes, gt_boxes):
+            pred_boxes_in_image, pred_starts, pred_ends = _group_by_class(pred_boxes_in_image, num_classes)
+            if len(gt_boxes_in_image) == 0:
+                gt_starts = gt_ends = np.zeros(num_classes, dtype=np.int64)
+            else:
+                gt_boxes_in_image, gt_starts, gt_ends = _group_by_class(gt_boxes_in_image, num_classes)
+            self._num_gt_boxes += gt_ends - gt_starts
+
+            # overlaps of all the classes at once, each class is a block of the matrix.
+            overlaps = None
+            if pred_boxes_in_image.size != 0 and np.any(gt_ends > gt_starts):
+                overlaps = _calc_overlaps(gt_boxes_in_image, pred_boxes_in_image)
+
+            for class_index in np.flatnonzero(pred_ends > pred_starts):
+                pred_start, pred_end = pred_starts[class_index], pred_ends[class_index]
+                gt_start, gt_end = gt_starts[class_index], gt_ends[class_index]
+
+                class_scores = pred_boxes_in_image[pred_start:pred_end, 5]
+                sort_index = np.argsort(-class_scores, axis=0)
+                if gt_end > gt_start:
+                    tp = _match(overlaps[pred_start:pred_end, gt_start:gt_end][sort_index], self.overlap_thresh)
+                else:
+                    tp = np.zeros(len(sort_index), dtype=np.float32)
+
+                tps[class_index].append(tp.astype(bool))
+                scores[class_index].append(class_scores[sort_index].astype(np.float32))
+
+        for class_index in range(num_classes):
+            if tps[class_index]:
+                self._tps[class_index].append(np.concatenate(tps[class_index]))
+                self._scores[class_index].append(np.concatenate(scores[class_index]))
+
+    def result(self):
+        """Return dictionary include 'MeanAveragePrecision' 'AveragePrecision', 'Precision', 'Recall',
+        'OrderedPrecision', 'OrderedRecall'.
+        """
+        result = {
+            'MeanAveragePrecision': None,
+            'AveragePrecision': [],
+            'Precision': [],
+            'Recall': [],
+            'OrderedPrecision': [],
+            'OrderedRecall': [],
+        }
+
+        for class_index in range(len(self.classes)):
+            tp = np.concatenate(self._tps[class_index] or [np.empty(0, dtype=bool)])
+            scores = np.concatenate(self._scores[class_index] or [np.empty(0, dtype=np.float32)])
+
+            # all the images are sorted at once, as the order of the boxes of equal scores depends on the array.
+            sort_index = np.argsort(-scores, axis=0)
+            tp = tp[sort_index]
+
+            ordered_precision, ordered_recall, precision, recall = _calc_precision_recall(
+                tp.astype(np.float32), (~tp).astype(np.float32), int(self._num_gt_boxes[class_index]),
+            )
+            average_precision = _calc_average_precision(ordered_precision, ordered_recall)
+
+            result['AveragePrecision'].append(average_precision)
+            result['Precision'].append(precision)
+            result['Recall'].append(recall)
+            result['OrderedPrecision'].append(ordered_precision)
+            result['OrderedRecall'].append(ordered_recall)
+
+        MAP = sum(result['AveragePrecision'])/len(self.classes)
+        result['MeanAveragePrecision'] = MAP
+
+        return result
+
+
 def _mean_average_precision(all_predict_boxes, all_gt_boxes, classes, overlap_thresh=0.5):
     """Calcurate mean average precision.
     Args:
@@ -273,116 +382,30 @@ def _mean_average_precision(all_predict_boxes, all_gt_boxes, classes, overlap_th
 
     Return:
        dictionary include 'MeanAveragePrecision' 'AveragePrecision', 'Precision', 'Recall', 'OrderedPrecision',
-       'OrderedRecall', 'OrderedMaxedPrecision'
+       'OrderedRecall'
     """
-
-    result = {
-        'MeanAveragePrecision': None,
-        'AveragePrecision': [],
-        'Precision': [],
-        'Recall': [],
-        'OrderedPrecision': [],
-        'OrderedRecall': [],
-    }
-
-    for class_index, class_name in enumerate(classes):
-        pred_boxes, gt_boxes = \
-            _boxes_in_the_class(all_predict_boxes, all_gt_boxes, class_index)
-
-        tp, fp, num_gt_boxes = \
-            _tp_and_fp(pred_boxes, gt_boxes, overlap_thresh)
-
-        ordered_precision, ordered_recall, precision, recall = _calc_precision_recall(tp, fp, num_gt_boxes)
-        average_precision = _calc_average_precision(ordered_precision, ordered_recall)
-
-        result['AveragePrecision'].append(average_precision)
-        result['Precision'].append(precision)
-        result['Recall'].append(recall)
-        result['OrderedPrecision'].append(ordered_precision)
-        result['OrderedRecall'].append(ordered_recall)
-
-    MAP = sum(result['AveragePrecision'])/len(classes)
-    result['MeanAveragePrecision'] = MAP
-
-    return result
-
-
-def _boxes_in_the_class(all_predict_boxes, all_gt_boxes, class_index):
-    """Get pred_boxes and gt_boxes in a class to make it easy to be calculated precision, rec all and so on.
-
-    Args:
-        all_predict_boxes(list): python list of numpy.ndarray. all images predicted boxes.
-            all_pred_boxes[image_index] shape is [num_pred_boxes, 6(x, y, w, h, class, scores)]
-        all_gt_boxes(numpy.ndarray): ground truth boxes.
-            shape is [num_images, num_max_gt_boxes, 5(x, y, w, h, class)]
-        class_index(int): index of classes.
-
-    Return:
-        pred_boxes_in_the_class_list(list): predicted boxes in the class.
-            pred_boxes_in_the_class_list[image_index] shape is [num_pred_boxes, 6(x, y, w, h, class, scores)]
-        gt_boxes_in_the_class_list(list): ground truth boxes in the class.
-            gt_boxes_in_the_class_list[image_index] shape is [num_gt_boxes, 5(x, y, w, h, class)]
-   """
-    num_images = len(all_predict_boxes)
-    gt_boxes_in_the_class_list = []
-    pred_boxes_in_the_class_list = []
-
-    assert len(all_predict_boxes) == len(all_gt_boxes)
-
-    for image_index in range(num_images):
-        gt_boxes = all_gt_boxes[image_index]
-        pred_boxes = all_predict_boxes[image_index]
-        if len(gt_boxes) == 0:
-            gt_boxes_in_the_class = np.empty(shape=(0, 5))
-        else:
-            gt_boxes_in_the_class = gt_boxes[gt_boxes[:, 4] == class_index]
-
-        pred_boxes_in_the_class = pred_boxes[pred_boxes[:, 4] == class_index]
-
-        gt_boxes_in_the_class_list.append(gt_boxes_in_the_class)
-        pred_boxes_in_the_class_list.append(pred_boxes_in_the_class)
-    return pred_boxes_in_the_class_list, gt_boxes_in_the_class_list
+    mean_average_precision = MeanAveragePrecision(classes, overlap_thresh)
+    mean_average_precision.update(all_predict_boxes, all_gt_boxes)
+    return mean_average_precision.result()
 
 
-def _tp_and_fp(class_pred_boxes, class_gt_boxes, overlap_thresh):
-    """Calculate tp and fp in the classes.
+def _group_by_class(boxes, num_classes):
+    """Sort boxes by class index, keeping the order of the boxes in each class.
 
     Args:
-        pred_boxes_in_the_class_list(list): predicted boxes in the class.
-            pred_boxes_in_the_class_list[image_index] shape is [num_pred_boxes, 6(x, y, w, h, class, scores)]
-        gt_boxes_in_the_class_list(list): ground truth boxes in the class.
-            gt_boxes_in_the_class_list[image_index] shape is [num_gt_boxes, 5(x, y, w, h, class)]
+        boxes(numpy.ndarray): boxes in the image. shape is [num_boxes, 5 or 6(x, y, w, h, class, ...)]
+        num_classes(int): number of classes. boxes of the other class indices are out of the ranges.
 
     Return:
-        tps(np.ndarray): prediction boxes length vector of tp sorted by score.
-        fps(np.ndarray): prediction boxes length vector of fp sorted by score.
-        num_gt_boxes(int): number of gt boxes.
+        sorted_boxes(numpy.ndarray): boxes sorted by class index.
+        starts(numpy.ndarray): starts[class_index] is the first index of the class in sorted_boxes.
+        ends(numpy.ndarray): ends[class_index] is the end index of the class in sorted_boxes.
     """
-    assert len(class_pred_boxes) == len(class_gt_boxes)
-
-    num_gt_boxes = 0
-
-    tps = []
-    fps = []
-    scores = []
-
-    for image_index in range(len(class_pred_boxes)):
-        pred_boxes_in_image = class_pred_boxes[image_index]
-        gt_boxes_in_image = class_gt_boxes[image_index]
-
-        num_gt_boxes += len(gt_boxes_in_image)
-        tp, fp, score = tp_fp_in_the_image(pred_boxes_in_image, gt_boxes_in_image, overlap_thresh)
-        tps.append(tp)
-        fps.append(fp)
-        scores.append(score)
-
-    tps = np.concatenate(tps)
-    fps = np.concatenate(fps)
-    scores = np.concatenate(scores)
-
-    sort_index = np.argsort(-scores, axis=0)
-
-    return tps[sort_index], fps[sort_index], num_gt_boxes
+    sorted_boxes = boxes[np.argsort(boxes[:, 4], kind="stable")]
+    class_indices = np.arange(num_classes)
+    starts = np.searchsorted(sorted_boxes[:, 4], class_indices, side="left")
+    ends = np.searchsorted(sorted_boxes[:, 4], class_indices, side="right")
+    return sorted_boxes, starts, ends
 
 
 def tp_fp_in_the_image(pred_boxes, gt_boxes, overlap_thresh):
@@ -402,34 +425,38 @@ def tp_fp_in_the_image(pred_boxes, gt_boxes, overlap_thresh):
     sort_index = np.argsort(-pred_boxes[:, 5], axis=0)
     sorted_pred_boxes = pred_boxes[sort_index]
 
-    tp = np.zeros(len(pred_boxes), dtype=np.float32)
-    fp = np.zeros(len(pred_boxes), dtype=np.float32)
-    score = np.empty(len(pred_boxes), dtype=np.float32)
-    is_gt_boxes_used = [False] * len(gt_boxes)
+    score = sorted_pred_boxes[:, 5].astype(np.float32)
 
-    for box in range(len(pred_boxes)):
-        pred_box = sorted_pred_boxes[box]
-        score[box] = pred_box[5]
+    # when ground truth boxes is zero, all predicted boxes mark false positive.
+    if gt_boxes.size == 0:
+        return np.zeros(len(pred_boxes), dtype=np.float32), np.ones(len(pred_boxes), dtype=np.float32), score
 
-        # when ground truth boxes is zero, all predicted boxes mark false positive.
-        if gt_boxes.size == 0:
-            fp[box] = 1.
-            continue
+    tp = _match(_calc_overlaps(gt_boxes, sorted_pred_boxes), overlap_thresh)
+    return tp, 1. - tp, score
 
-        overlaps = _calc_overlap(gt_boxes, pred_box)
-        ovmax = np.max(overlaps)
-        jmax = np.argmax(overlaps)
 
-        if ovmax > overlap_thresh:
-            if not is_gt_boxes_used[jmax]:
-                tp[box] = 1.
-                is_gt_boxes_used[jmax] = True
-            else:
-                fp[box] = 1.
-        else:
-            fp[box] = 1.
+def _match(overlaps, overlap_thresh):
+    """Match predicted boxes sorted by score to ground truth boxes.
 
-    return tp, fp, score
+    Args:
+        overlaps(numpy.ndarray): shape is [num_pred_boxes, num_gt_boxes]
+        overlap_thresh: threshold of overlap.
+
+    Return:
+       tp(numpy.ndarray): prediction boxes length vector of tp.
+    """
+    ovmax = np.max(overlaps, axis=1)
+    jmax = np.argmax(overlaps, axis=1)
+    tp = np.zeros(len(overlaps), dtype=np.float32)
+    is_gt_boxes_used = [False] * overlaps.shape[1]
+
+    # a ground truth box is matched to the predicted box of the highest score, so this loop is sequential.
+    for box in range(len(overlaps)):
+        if ovmax[box] > overlap_thresh and not is_gt_boxes_used[jmax[box]]:
+            tp[box] = 1.
+            is_gt_boxes_used[jmax[box]] = True
+
+    return tp
 
 
 def _calc_precision_recall(tp, fp, num_gt_boxes):
@@ -472,8 +499,7 @@ def _calc_average_precision(precision, recall):
     precision = np.concatenate(([0.], precision, [0.]))
 
     # compute the precision envelope
-    for i in range(precision.size - 1, 0, -1):
-        precision[i - 1] = np.maximum(precision[i - 1], precision[i])
+    precision = np.maximum.accumulate(precision[::-1])[::-1]
 
     # to calculate area under PR curve, look for points
     # where X axis (recall) changes value
@@ -487,12 +513,13 @@ def _calc_average_precision(precision, recall):
     return average_precision
 
 
-def _calc_overlap(gt_boxes, pred_box):
-    """Calcurate overlap
+def _calc_overlaps(gt_boxes, pred_boxes):
+    """Calcurate overlaps of each predicted box with the ground truth boxes.
     Args:
-        gt_boxes: ground truth boxes in the image. shape is [num_boxes, 5(x, y, w, h, class)]
-        pred_box: a predict box in the image. shape is [6(x, y, w, h, class, prob)]
+        gt_boxes: ground truth boxes in the image. shape is [num_gt_boxes, 5(x, y, w, h, class)]
+        pred_boxes: predicted boxes in the image. shape is [num_pred_boxes, 6(x, y, w, h, class, prob)]
     Return:
+        overlaps: shape is [num_pred_boxes, num_gt_boxes]
     """
     assert gt_boxes.size != 0, "Cannot clculate if ground truth boxes is zero"
 
@@ -502,27 +529,34 @@ def _calc_overlap(gt_boxes, pred_box):
     gt_boxes_xmax = gt_boxes[:, 0] + gt_boxes[:, 2]
     gt_boxes_ymax = gt_boxes[:, 1] + gt_boxes[:, 3]
 
-    pred_box_xmin = pred_box[0]
-    pred_box_ymin = pred_box[1]
-    pred_box_xmax = pred_box[0] + pred_box[2]
-    pred_box_ymax = pred_box[1] + pred_box[3]
+    pred_boxes_xmin = pred_boxes[:, 0]
+    pred_boxes_ymin = pred_boxes[:, 1]
+    pred_boxes_xmax = pred_boxes[:, 0] + pred_boxes[:, 2]
+    pred_boxes_ymax = pred_boxes[:, 1] + pred_boxes[:, 3]
 
     # If border pixels are supposed to expand the bounding boxes each 0.5 pixel,
     # we have to add 1 pixel to any difference `xmax - xmin` or `ymax - ymin`.
     d = 1.
 
+    # The overlaps were computed for a predicted box at a time, on numpy scalars of the box.
+    # Cast as the scalars are promoted, so that the overlaps are identical.
+    pred_box_dtype = np.result_type(pred_boxes.dtype.type(0), gt_boxes)
+    pred_area_dtype = type(pred_boxes.dtype.type(0) + d)
+
     # intersection
-    inter_xmin = np.maximum(gt_boxes_xmin, pred_box_xmin)
-    inter_ymin = np.maximum(gt_boxes_ymin, pred_box_ymin)
-    inter_xmax = np.minimum(gt_boxes_xmax, pred_box_xmax)
-    inter_ymax = np.minimum(gt_boxes_ymax, pred_box_ymax)
+    inter_xmin = np.maximum(gt_boxes_xmin, pred_boxes_xmin.astype(pred_box_dtype)[:, np.newaxis])
+    inter_ymin = np.maximum(gt_boxes_ymin, pred_boxes_ymin.astype(pred_box_dtype)[:, np.newaxis])
+    inter_xmax = np.minimum(gt_boxes_xmax, pred_boxes_xmax.astype(pred_box_dtype)[:, np.newaxis])
+    inter_ymax = np.minimum(gt_boxes_ymax, pred_boxes_ymax.astype(pred_box_dtype)[:, np.newaxis])
     inter_w = np.maximum(inter_xmax - inter_xmin + d, 0.)
     inter_h = np.maximum(inter_ymax - inter_ymin + d, 0.)
     inters = inter_w * inter_h
 
     # union
-    union = (pred_box_xmax - pred_box_xmin + d) * (pred_box_ymax - pred_box_ymin + d) \
-        + (gt_boxes_xmax - gt_boxes_xmin + d) * (gt_boxes_ymax - gt_boxes_ymin + d) \
-        - inters
+    pred_boxes_area = ((pred_boxes_xmax - pred_boxes_xmin).astype(pred_area_dtype) + d) \
+        * ((pred_boxes_ymax - pred_boxes_ymin).astype(pred_area_dtype) + d)
+    gt_boxes_area = (gt_boxes_xmax - gt_boxes_xmin + d) * (gt_boxes_ymax - gt_boxes_ymin + d)
+    union = pred_boxes_area.astype(np.result_type(pred_area_dtype(0), gt_boxes_area))[:, np.newaxis] \
+        + gt_boxes_area - inters
 
     return inters / union
@@ -233,21 +233,31 @@ class ExcludeLowScoreBox(Processor):
 class NMS(Processor):
     """Non Maximum Suppression"""
 
-    def __init__(self, classes, iou_threshold, max_output_size=100, per_class=True):
+    # max number of boxes to precompute the pairwise IoU matrix. IoU is computed row by row for larger blocks.
+    _IOU_MATRIX_MAX_BOXES = 1024
+    _MAX_FIXED_POINT_ITERATIONS = 16
+
+    # default of attributes added later, as `build_post_process()` of output_template fills only the given attributes.
+    score_threshold = None
+
+    def __init__(self, classes, iou_threshold, max_output_size=100, per_class=True, score_threshold=None):
         """
         Args:
             classes (list): List of class names.
             iou_threshold (float): The threshold for deciding whether boxes overlap with respect to IOU.
             max_output_size (int): The maximum number of boxes to be selected
             per_class (boolean): Whether or not, NMS respect to per class.
+            score_threshold (float): Boxes with score less than the threshold are removed before NMS if it is given.
         """
 
         self.classes = classes
         self.iou_threshold = iou_threshold
         self.max_output_size = max_output_size
         self.per_class = per_class
+        self.score_threshold = score_threshold
 
     def _nms(self, boxes):
+        """Reference implementation of NMS for boxes of a class, kept to compare with `_nms_block`."""
         scores = boxes[:, 5]
 
         order_indices = np.argsort(-scores)
@@ -270,6 +280,83 @@ class NMS(Processor):
             nms_boxes = nms_boxes[:self.max_output_size, :]
         return nms_boxes
 
+    @staticmethod
+    def _pairwise_iou(ltrb, areas, rows):
+        """IoU of `ltrb[rows]` and all boxes, in the same formula as `iou`. shape is [len(rows), num_boxes]."""
+        left, top, right, bottom = ltrb.T
+        row_left, row_top, row_right, row_bottom = ltrb[rows].T[:, :, np.newaxis]
+        width = np.maximum(np.minimum(row_right, right) - np.maximum(row_left, left), 0)
+        height = np.maximum(np.minimum(row_bottom, bottom) - np.maximum(row_top, top), 0)
+        intersection = width * height
+
+        epsilon = 1e-10
+        union = areas[rows, np.newaxis] + areas[np.newaxis, :] - intersection
+        return intersection / (union + epsilon)
+
+    def _greedy_nms(self, ltrb, areas, overlaps=None):
+        """Greedy selection which visits only selected boxes and stops at `max_output_size`.
+
+        IoU rows of selected boxes are computed lazily unless the `overlaps` matrix is given.
+        """
+        num_boxes = len(ltrb)
+        suppressed = np.zeros(num_boxes, dtype=np.bool_)
+        keep = []
+        i = 0
+        while True:
+            keep.append(i)
+            if len(keep) >= self.max_output_size or i + 1 == num_boxes:
+                break
+
+            if overlaps is not None:
+                suppressed[i + 1:] |= overlaps[i, i + 1:]
+            else:
+                row = self._pairwise_iou(ltrb[i:], areas[i:], [0])[0, 1:]
+                # `not (iou < threshold)` to remove NaN IoU boxes as same as `_nms`.
+                suppressed[i + 1:] |= ~(row < self.iou_threshold)
+
+            remaining = np.flatnonzero(~suppressed[i + 1:])
+            if remaining.size == 0:
+                break
+            i = i + 1 + remaining[0]
+
+        return np.array(keep, dtype=np.int64)
+
+    def _nms_block(self, boxes):
+        """Return indices of selected boxes of a block, which is sorted by score in descending order.
+
+        For small blocks the pairwise IoU matrix is computed at once, and the greedy selection is solved as
+        the fixed point of `keep[j] = not any(keep[i] and overlaps[i, j] for i < j)`.
+        The first k boxes are settled after k iterations, and it usually converges in a few iterations.
+
+        Args:
+            boxes: np.ndarray of [num_boxes, 6(x(left), y(top), w, h, class_id, score)].
+        """
+        ltrb = np.stack([
+            boxes[:, 0],
+            boxes[:, 1],
+            boxes[:, 0] + boxes[:, 2],
+            boxes[:, 1] + boxes[:, 3],
+        ], axis=1).astype(np.float64)
+        areas = (ltrb[:, 2] - ltrb[:, 0]) * (ltrb[:, 3] - ltrb[:, 1])
+
+        num_boxes = len(boxes)
+        if num_boxes > self._IOU_MATRIX_MAX_BOXES:
+            return self._greedy_nms(ltrb, areas)
+
+        ious = self._pairwise_iou(ltrb, areas, np.arange(num_boxes))
+        # `not (iou < threshold)` to remove NaN IoU boxes as same as `_nms`. only higher score boxes suppress.
+        overlaps = np.triu(~(ious < self.iou_threshold), k=1)
+
+        keep = np.ones(num_boxes, dtype=np.bool_)
+        for _ in range(self._MAX_FIXED_POINT_ITERATIONS):
+            new_keep = ~np.any(overlaps[keep], axis=0)
+            if np.array_equal(new_keep, keep):
+                return np.flatnonzero(keep)[:self.max_output_size]
+            keep = new_keep
+
+        # long chain of suppression.
+        return self._greedy_nms(ltrb, areas, overlaps)
+
     def __call__(self, outputs, **kwargs):
         """
         Args:
@@ -286,20 +373,31 @@ class NMS(Processor):
         results = []
         batch_size = len(outputs)
         for i in range(batch_size):
-            boxes_per_batch = outputs[i]
-            result_per_batch = []
+            boxes_per_batch = np.asarray(outputs[i])
+
+            if self.score_threshold is not None:
+                boxes_per_batch = boxes_per_batch[boxes_per_batch[:, 5] >= self.score_threshold]
 
             if self.per_class:
-                for class_id in range(len(self.classes)):
-                    class_masked = boxes_per_batch[boxes_per_batch[:, 4] == class_id]
-                    nms_boxes = self._nms(class_masked)
-                    result_per_batch.append(nms_boxes)
+                # ignore boxes out of classes as same as masking each class id.
+                boxes_per_batch = boxes_per_batch[np.isin(boxes_per_batch[:, 4], np.arange(len(self.classes)))]
+                # group once by class id, keeping the input order of the boxes in each class.
+                class_order = np.argsort(boxes_per_batch[:, 4], kind="stable")
+                _, starts = np.unique(boxes_per_batch[class_order, 4], return_index=True)
             else:
-                nms_boxes = self._nms(boxes_per_batch)
-                result_per_batch.append(nms_boxes)
-
-            result_per_batch = np.concatenate(result_per_batch)
-            results.append(result_per_batch)
+                class_order = np.arange(len(boxes_per_batch))
+                starts = np.zeros(min(len(boxes_per_batch), 1), dtype=np.int64)
+
+            grouped_boxes = boxes_per_batch[class_order]
+            ends = np.append(starts[1:], len(grouped_boxes))
+            nms_boxes = []
+            for start, end in zip(starts, ends):
+                block = grouped_boxes[start:end]
+                # sort with the same argsort as `_nms`, which is not stable, to keep the same boxes of tied scores.
+                block = block[np.argsort(-block[:, 5])]
+                nms_boxes.append(block[self._nms_block(block)])
+
+            results.append(np.concatenate(nms_boxes) if nms_boxes else boxes_per_batch[:0])
 
         return dict({"outputs": results}, **kwargs)
 
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 The Blueoil Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+"""Evaluate snapshots of the training variables in a second session on a background thread.
+
+The validation graph is built from the same model class in its own graph. A validation job loads
+a `Snapshot` taken by `BackgroundWriter` into the variables of the validation graph and runs the whole
+validation loop, while the training thread continues. Both sessions are in the same process,
+so they share the device memory allocator.
+"""
+import math
+import queue
+import threading
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from lmnet.datasets.base import ObjectDetectionBase
+from lmnet.utils import executor
+
+
+def stratum_labels(dataset):
+    """Return a class id of each sample to stratify a subsample, or None if the labels are unknown.
+
+    The labels are taken from the annotations which the dataset already holds, without loading the samples.
+    For object detection, the label of an image is the most frequent class of the boxes, -1 if no box.
+    """
+    if isinstance(dataset, ObjectDetectionBase):
+        annotations = getattr(dataset, "annotations", None)
+        if annotations is None:
+            return None
+        labels = [
+            int(np.bincount(np.asarray(gt_boxes)[:, 4].astype(np.int64)).argmax()) if len(gt_boxes) > 0 else -1
+            for gt_boxes in annotations
+        ]
+    elif hasattr(dataset, "get_label") and hasattr(dataset, "files"):
+        labels = [dataset.get_label(f) for f in dataset.files]
+    else:
+        labels = getattr(dataset, "labels", getattr(dataset, "annotations", None))
+        if labels is None or not all(np.isscalar(label) for label in labels):
+            return None
+
+    if len(labels) != dataset.num_per_epoch:
+        return None
+    return labels
+
+
+class BackgroundValidator:
+    """Run validation loops of snapshots in a second session on a background thread.
+
+    Args:
+        create_model (callable): Return the model. It is called in the graph of the validator.
+        var_names (list): Names of the variables in the snapshots.
+        batch_size (int): Batch size.
+        summarise_steps (int): Write the summaries of the batches every this number of validation steps.
+        session_config (tf.ConfigProto): Config of the second session.
+        max_queue_size (int): The number of validations waiting for the background thread.
+            When the queue is full, the training thread waits.
+    """
+
+    def __init__(self, create_model, var_names, batch_size, summarise_steps, session_config=None, max_queue_size=1):
+        self.batch_size = batch_size
+        self.summarise_steps = summarise_steps
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.error = None
+
+        # time the training thread waited for the queue, and the time of the validations in background.
+        self.stall_time = 0.0
+        self.background_time = 0.0
+        self.num_jobs = 0
+
+        self.graph = tf.Graph()
+        with self.graph.as_default():
+            model = create_model()
+            is_training = tf.constant(False, name="is_training")
+            self.images_placeholder, self.labels_placeholder = model.placeholders()
+            output = model.inference(self.images_placeholder, is_training)
+
+            self.metrics_ops_dict, self.metrics_update_op = model.metrics(output, self.labels_placeholder)
+            model.summary(output, self.labels_placeholder)
+            self.summary_op = tf.compat.v1.summary.merge_all()
+            self.metrics_summary_op, self.metrics_placeholders = executor.prepare_metrics(self.metrics_ops_dict)
+            self.reset_metrics_op = tf.local_variables_initializer()
+
+            variables = tf.global_variables()
+            var_names = set(var_names)
+            missing = [var.op.name for var in variables if var.op.name not in var_names]
+            if missing:
+                raise ValueError("variables of the validation graph are not in the snapshots: {}".format(missing))
+            # feeding the initial value of the initializer loads a value, like `tf.Variable.load`.
+            self._initial_values = {var.op.name: var.initializer.inputs[1] for var in variables}
+            self._load_op = tf.group(*[var.initializer for var in variables])
+
+        self.sess = tf.Session(graph=self.graph, config=session_config)
+        self.sess.run(self.reset_metrics_op)
+
+        self._thread = threading.Thread(target=self._run, name="background_validator", daemon=True)
+        self._thread.start()
+
+    def submit(self, snapshot, dataset, summary_writer, global_step, callback=None):
+        """Queue a validation of the snapshot.
+
+        Args:
+            snapshot (Snapshot): Values of the variables to validate.
+            dataset (DatasetIterator): Validation dataset. One epoch of it is validated.
+            summary_writer (tf.summary.FileWriter): Writer of the summaries and the metrics.
+            global_step (int): Step of the summaries.
+            callback (callable): Called with the dict of metrics values and the snapshot on the background thread.
+        """
+        if self.error is not None:
+            raise RuntimeError("background validator failed") from self.error
+        start = time.time()
+        self.queue.put((snapshot, dataset, summary_writer, global_step, callback))
+        self.stall_time += time.time() - start
+        self.num_jobs += 1
+
+    def _run(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                self.queue.task_done()
+                break
+            start = time.time()
+            try:
+                if self.error is None:
+                    self._validate(*job)
+            except Exception as e:
+                self.error = e
+            self.background_time += time.time() - start
+            self.queue.task_done()
+
+    def _validate(self, snapshot, dataset, summary_writer, global_step, callback):
+        self.sess.run(self._load_op, feed_dict={
+            initial_value: snapshot.values[name] for name, initial_value in self._initial_values.items()
+        })
+        self.sess.run(self.reset_metrics_op)
+
+        test_step_size = int(math.ceil(dataset.num_per_epoch / self.batch_size))
+        for test_step in range(test_step_size):
+            images, labels = dataset.feed()
+            feed_dict = {
+                self.images_placeholder: images,
+                self.labels_placeholder: labels,
+            }
+            if test_step % self.summarise_steps == 0:
+                summary, _ = self.sess.run([self.summary_op, self.metrics_update_op], feed_dict=feed_dict)
+                summary_writer.add_summary(summary, global_step)
+            else:
+                self.sess.run([self.metrics_update_op], feed_dict=feed_dict)
+
+        metrics_values = self.sess.run(list(self.metrics_ops_dict.values()))
+        metrics_feed_dict = {
+            placeholder: value for placeholder, value in zip(self.metrics_placeholders, metrics_values)
+        }
+        metrics_summary, = self.sess.run([self.metrics_summary_op], feed_dict=metrics_feed_dict)
+        summary_writer.add_summary(metrics_summary, global_step)
+        summary_writer.flush()
+
+        if callback is not None:
+            callback(dict(zip(self.metrics_ops_dict.keys(), metrics_values)), snapshot)
+
+    def flush(self):
+        """Wait until all the queued validations are done."""
+        self.queue.join()
+        if self.error is not None:
+            raise RuntimeError("background validator failed") from self.error
+
+    def close(self):
+        """Finish all the queued validations and stop the background thread."""
+        if self._thread.is_alive():
+            self.queue.put(None)
+            self._thread.join()
+        self.sess.close()
+        if self.error is not None:
+            raise RuntimeError("background validator failed") from self.error
+
+    def report(self):
+        return "background validator: {} validations took {:.2f} s in background, " \
+               "the training thread waited {:.2f} s".format(self.num_jobs, self.background_time, self.stall_time)
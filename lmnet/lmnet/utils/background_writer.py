@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 The Blueoil Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+"""Write checkpoints, graph exports and summaries on a background thread.
+
+The training thread takes a snapshot of the variable values with one `sess.run` and queues it.
+The background thread loads the snapshot into a mirror of the variables in its own graph and session,
+and saves the checkpoint from there, so that the saved values are consistent and the training
+continues meanwhile.
+"""
+import queue
+import threading
+import time
+
+import tensorflow as tf
+
+from lmnet.utils import executor
+
+
+class _SnapshotSession:
+    """Session-like object which returns the snapshot values of the variables, for graph_util."""
+
+    def __init__(self, graph, values):
+        self.graph = graph
+        self.values = values
+
+    def run(self, fetches):
+        # graph_util fetches `<variable>:0`, or `<variable>/Read/ReadVariableOp:0` of resource variables.
+        return [self.values[name.split(":")[0].replace("/Read/ReadVariableOp", "")] for name in fetches]
+
+
+class Snapshot:
+    """Values of the variables at a global step.
+
+    Args:
+        global_step (int): The global step.
+        values (dict): Variable name to value.
+    """
+
+    def __init__(self, global_step, values):
+        self.global_step = global_step
+        self.values = values
+
+
+class BackgroundWriter:
+    """Write checkpoints, graph exports and summaries in order on a background thread.
+
+    Args:
+        sess (tf.Session): The training session.
+        global_step (tf.Variable): The global step.
+        var_list (list): Variables to checkpoint, with the same names as the training saver.
+        saver_def (SaverDef): SaverDef of the training saver, written in the meta graphs of the checkpoints.
+        max_to_keep (int): The number of checkpoints to keep.
+        max_queue_size (int): The number of jobs waiting for the background thread. When the queue is full,
+            the training thread waits, so that at most this number of snapshots are kept in memory.
+    """
+
+    def __init__(self, sess, global_step, var_list, saver_def=None, max_to_keep=5, max_queue_size=2):
+        self.sess = sess
+        self.global_step = global_step
+        self.variables = {var.op.name: var for var in var_list}
+        self.saver_def = saver_def
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.error = None
+
+        # time the training thread spent to snapshot and to queue, and the time of the jobs in background,
+        # which the training thread would have stalled for without this writer.
+        self.stall_time = 0.0
+        self.background_time = 0.0
+        self.num_jobs = 0
+        # jobs are also queued from other threads than the training thread, e.g. by the callbacks of
+        # `BackgroundValidator`.
+        self._counter_lock = threading.Lock()
+
+        self._mirror_graph = tf.Graph()
+        with self._mirror_graph.as_default():
+            self._placeholders = {}
+            mirrors = {}
+            for i, (name, var) in enumerate(sorted(self.variables.items())):
+                placeholder = tf.compat.v1.placeholder(var.dtype.base_dtype, var.shape)
+                mirrors[name] = tf.compat.v1.Variable(placeholder, name="mirror_{}".format(i), trainable=False)
+                self._placeholders[name] = placeholder
+            self._load_op = tf.group(*[mirror.initializer for mirror in mirrors.values()])
+            self._mirror_saver = tf.compat.v1.train.Saver(mirrors, max_to_keep=max_to_keep)
+        self._mirror_sess = tf.Session(graph=self._mirror_graph, config=tf.ConfigProto(device_count={"GPU": 0}))
+
+        self._thread = threading.Thread(target=self._run, name="background_writer", daemon=True)
+        self._thread.start()
+
+    def snapshot(self):
+        """Return `Snapshot` of the current values, fetched with one `sess.run`."""
+        start = time.time()
+        global_step, values = self.sess.run([self.global_step, self.variables])
+        with self._counter_lock:
+            self.stall_time += time.time() - start
+        return Snapshot(int(global_step), values)
+
+    def _put(self, job, *args):
+        if self.error is not None:
+            raise RuntimeError("background writer failed") from self.error
+        start = time.time()
+        self.queue.put((job, args))
+        with self._counter_lock:
+            self.stall_time += time.time() - start
+            self.num_jobs += 1
+
+    def _run(self):
+        while True:
+            job, args = self.queue.get()
+            if job is None:
+                self.queue.task_done()
+                break
+            start = time.time()
+            try:
+                if self.error is None:
+                    job(*args)
+            except Exception as e:
+                self.error = e
+            self.background_time += time.time() - start
+            self.queue.task_done()
+
+    def save(self, save_path, snapshot=None):
+        """Save a checkpoint in background, like `tf.train.Saver.save(sess, save_path, global_step)`.
+
+        Returns:
+            Snapshot: The saved snapshot.
+        """
+        snapshot = snapshot or self.snapshot()
+        self._put(self._save, save_path, snapshot)
+        return snapshot
+
+    def _save(self, save_path, snapshot):
+        self._mirror_sess.run(self._load_op, feed_dict={
+            placeholder: snapshot.values[name] for name, placeholder in self._placeholders.items()
+        })
+        prefix = self._mirror_saver.save(
+            self._mirror_sess, save_path, global_step=snapshot.global_step, write_meta_graph=False,
+        )
+        # the meta graph of the training graph, as the training saver writes.
+        tf.compat.v1.train.export_meta_graph(
+            filename="{}.meta".format(prefix), graph=self.sess.graph, saver_def=self.saver_def,
+        )
+
+    def export_graph(self, output_dir, pb_name, pbtxt_name=None, output_node_names=["output"], snapshot=None,
+                     graph=None):
+        """Write the graph with the variables converted to constants in background.
+
+        `graph` is exported instead of the training graph if given. Its variables must have the same names as
+        the training variables.
+
+        Returns:
+            Snapshot: The exported snapshot.
+        """
+        snapshot = snapshot or self.snapshot()
+        self._put(self._export_graph, output_dir, pb_name, pbtxt_name, output_node_names, snapshot, graph)
+        return snapshot
+
+    def _export_graph(self, output_dir, pb_name, pbtxt_name, output_node_names, snapshot, graph):
+        minimal_graph_def = executor.convert_variables_to_constants(
+            _SnapshotSession(graph or self.sess.graph, snapshot.values), output_node_names,
+        )
+        tf.io.write_graph(minimal_graph_def, output_dir, pb_name, as_text=False)
+        if pbtxt_name:
+            tf.io.write_graph(minimal_graph_def, output_dir, pbtxt_name, as_text=True)
+
+    def add_summary(self, summary_writer, summary, global_step):
+        """Add a summary to the `tf.summary.FileWriter` in background."""
+        self._put(summary_writer.add_summary, summary, global_step)
+
+    def flush_summary(self, summary_writer):
+        """Flush the `tf.summary.FileWriter` in background."""
+        self._put(summary_writer.flush)
+
+    def flush(self):
+        """Wait until all the queued jobs are done."""
+        self.queue.join()
+        if self.error is not None:
+            raise RuntimeError("background writer failed") from self.error
+
+    def close(self):
+        """Finish all the queued jobs and stop the background thread."""
+        if self._thread.is_alive():
+            self.queue.put((None, ()))
+            self._thread.join()
+        self._mirror_sess.close()
+        if self.error is not None:
+            raise RuntimeError("background writer failed") from self.error
+
+    def report(self):
+        return "background writer: {} jobs took {:.2f} s in background, the training thread waited {:.2f} s".format(
+            self.num_jobs, self.background_time, self.stall_time,
+        )
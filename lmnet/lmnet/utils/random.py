@@ -103,3 +103,35 @@ def train_test_split(*arrays, test_size=0.25, seed=None):
     splitted = list(chain.from_iterable(list_of_tuple))
 
     return splitted
+
+
+def stratified_sample(labels, size, seed=None):
+    """Sample indices with the same proportion of each label as `labels`.
+
+    Args:
+        labels (list): Label of each sample, e.g. class id.
+        size (int): The number of samples. Each label gets `size` times its proportion, rounded by
+            the largest remainder, so that the number of samples is exactly `size`.
+        seed (int, optional): The seed of random generator.
+
+    Returns:
+        np.ndarray: Sorted indices of the samples.
+
+    """
+    random_state = np.random.RandomState(seed)
+    labels = np.asarray(labels)
+    num_samples = len(labels)
+    size = min(size, num_samples)
+
+    unique_labels, inverse = np.unique(labels, return_inverse=True)
+    counts = np.bincount(inverse, minlength=len(unique_labels))
+    quotas = counts * size / num_samples
+    num_per_label = np.floor(quotas).astype(np.int64)
+    remainders = np.argsort(-(quotas - num_per_label), kind="stable")
+    num_per_label[remainders[:size - num_per_label.sum()]] += 1
+
+    indices = [
+        random_state.choice(np.flatnonzero(inverse == i), num, replace=False)
+        for i, num in enumerate(num_per_label)
+    ]
+    return np.sort(np.concatenate(indices)) if indices else np.array([], dtype=np.int64)
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 The Blueoil Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+import numpy as np
+import pytest
+
+from executor.pack_dataset import run
+from executor.train import run as train_run
+from lmnet import environment
+from lmnet.datasets.dataset_iterator import DatasetIterator
+from lmnet.datasets.packed import PackedClassification
+from lmnet.utils import config as config_util
+
+
+# Apply reset_default_graph() in conftest.py to all tests in this file.
+# Set test environment
+pytestmark = pytest.mark.usefixtures("reset_default_graph", "set_test_environment")
+
+
+def setup_dataset(dataset_class, subset, **kwargs):
+    dataset = dataset_class(subset=subset, **kwargs)
+    return DatasetIterator(dataset, seed=0)
+
+
+def test_pack_dataset_classification():
+    environment.setup_test_environment()
+
+    # Pack Dataset
+    config_file = "tests/fixtures/configs/for_pack_dataset_classification.py"
+    run(config_file, overwrite=True)
+
+    with pytest.raises(ValueError):
+        run(config_file, overwrite=False)
+
+    # Check if the packed dataset can be loaded with the same config file
+    expriment_id = "packed_classification"
+    train_run(None, None, config_file, expriment_id, recreate=True)
+
+    # Check if the dataset was packed correctly
+    train_data_num = 3
+    validation_data_num = 2
+    config = config_util.load(config_file)
+
+    train_dataset = setup_dataset(PackedClassification,
+                                  subset="train",
+                                  batch_size=config.BATCH_SIZE,
+                                  pre_processor=config.PRE_PROCESSOR,
+                                  **config.DATASET.PACKED_KWARGS)
+
+    validation_dataset = setup_dataset(PackedClassification,
+                                       subset="validation",
+                                       batch_size=config.BATCH_SIZE,
+                                       pre_processor=config.PRE_PROCESSOR,
+                                       **config.DATASET.PACKED_KWARGS)
+
+    assert train_dataset.num_per_epoch == train_data_num
+    assert validation_dataset.num_per_epoch == validation_data_num
+
+    for _ in range(train_data_num):
+        images, labels = train_dataset.feed()
+
+        assert isinstance(images, np.ndarray)
+        assert images.shape[0] == config.BATCH_SIZE
+        assert images.shape[1] == config.IMAGE_SIZE[0]
+        assert images.shape[2] == config.IMAGE_SIZE[1]
+        assert images.shape[3] == 3
+
+        assert isinstance(labels, np.ndarray)
+        assert labels.shape[0] == config.BATCH_SIZE
+        assert labels.shape[1] == train_dataset.num_classes
@@ -13,9 +13,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # =============================================================================
+from types import SimpleNamespace
+
 import pytest
 
-from executor.train import run
+from executor.train import run, setup_quick_validation_dataset
+from lmnet.datasets.tfds import TFDSClassification
 
 # Apply reset_default_graph() in conftest.py to all tests in this file.
 # Set test environment
@@ -30,5 +33,14 @@ def test_train():
     run(None, None, config_file, expriment_id, recreate=True)
 
 
+def test_setup_quick_validation_dataset_tfds(capsys):
+    """TFDS datasets can't be subsampled, so the quick validation is skipped with a warning."""
+    dataset = TFDSClassification.__new__(TFDSClassification)
+    validation_dataset = SimpleNamespace(dataset=dataset)
+
+    assert setup_quick_validation_dataset(validation_dataset, 10) is None
+    assert "quick validation is disabled" in capsys.readouterr().out
+
+
 if __name__ == '__main__':
     test_train()
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 The Blueoil Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+import os
+
+import numpy as np
+import pytest
+
+from lmnet import environment
+from lmnet.datasets.annotation_cache import BoxAnnotationIndex, cached_annotation_index
+from lmnet.datasets.mscoco import MscocoObjectDetection
+
+# Apply set_test_environment() in conftest.py to all tests in this file.
+pytestmark = pytest.mark.usefixtures("set_test_environment")
+
+FILES = ["a.jpg", "b.jpg", "c.jpg"]
+ANNOTATIONS = [
+    [[0, 0, 3, 3, 0], [7, 7, 3, 3, 1]],
+    [],
+    [[1.5, 2.5, 3.25, 4, 2]],
+]
+
+
+def _assert_index(index):
+    assert index.files == FILES
+    assert index.num_max_boxes == 2
+    for gt_boxes, expected in zip(index.annotations, ANNOTATIONS):
+        assert gt_boxes.shape == (len(expected), 5)
+        assert np.array_equal(gt_boxes, np.array(expected).reshape(-1, 5))
+
+
+def test_box_annotation_index(tmpdir):
+    index = BoxAnnotationIndex.from_annotations(FILES, ANNOTATIONS)
+    _assert_index(index)
+
+    path = os.path.join(str(tmpdir), "index.npz")
+    index.save(path)
+    _assert_index(BoxAnnotationIndex.load(path))
+
+
+def test_cached_annotation_index(tmpdir):
+    environment.ANNOTATION_CACHE_DIR = os.path.join(str(tmpdir), "cache")
+    source_file = os.path.join(str(tmpdir), "annotations.txt")
+    with open(source_file, "w") as f:
+        f.write("annotations")
+
+    calls = []
+
+    def files_and_annotations():
+        calls.append(1)
+        return FILES, ANNOTATIONS
+
+    _assert_index(cached_annotation_index("key", [source_file], files_and_annotations))
+    _assert_index(cached_annotation_index("key", [source_file], files_and_annotations))
+    assert len(calls) == 1
+
+    # other settings don't share the cache.
+    cached_annotation_index("other key", [source_file], files_and_annotations)
+    assert len(calls) == 2
+
+    # updating the source file invalidates the cache.
+    stat = os.stat(source_file)
+    os.utime(source_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    cached_annotation_index("key", [source_file], files_and_annotations)
+    assert len(calls) == 3
+
+    # empty cache dir disables the cache.
+    environment.ANNOTATION_CACHE_DIR = ""
+    cached_annotation_index("key", [source_file], files_and_annotations)
+    assert len(calls) == 4
+
+
+def test_cached_annotation_index_directory(tmpdir):
+    environment.ANNOTATION_CACHE_DIR = os.path.join(str(tmpdir), "cache")
+    source_dir = os.path.join(str(tmpdir), "Annotations")
+    os.makedirs(source_dir)
+    source_file = os.path.join(source_dir, "a.xml")
+    with open(source_file, "w") as f:
+        f.write("<annotation/>")
+
+    calls = []
+
+    def files_and_annotations():
+        calls.append(1)
+        return FILES, ANNOTATIONS
+
+    cached_annotation_index("key", [source_dir], files_and_annotations)
+    cached_annotation_index("key", [source_dir], files_and_annotations)
+    assert len(calls) == 1
+
+    # editing a file in place invalidates the cache, though the directory mtime is not changed.
+    dir_stat = os.stat(source_dir)
+    stat = os.stat(source_file)
+    with open(source_file, "w") as f:
+        f.write("<annotation></annotation>")
+    os.utime(source_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    os.utime(source_dir, ns=(dir_stat.st_atime_ns, dir_stat.st_mtime_ns))
+    cached_annotation_index("key", [source_dir], files_and_annotations)
+    assert len(calls) == 2
+
+    # adding a file invalidates the cache.
+    with open(os.path.join(source_dir, "b.xml"), "w") as f:
+        f.write("<annotation/>")
+    os.utime(source_dir, ns=(dir_stat.st_atime_ns, dir_stat.st_mtime_ns))
+    cached_annotation_index("key", [source_dir], files_and_annotations)
+    assert len(calls) == 3
+
+
+def test_mscoco_object_detection_annotation_cache():
+    dataset = MscocoObjectDetection(subset="train")
+    files, annotations = dataset._files_and_annotations()
+
+    # second instance reads annotations from the cache.
+    cached_dataset = MscocoObjectDetection(subset="train")
+    assert cached_dataset.files == files
+    assert [gt_boxes.tolist() for gt_boxes in cached_dataset.annotations] == annotations
+    assert cached_dataset._annotation_index.num_max_boxes == 2
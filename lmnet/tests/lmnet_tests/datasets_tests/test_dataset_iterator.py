@@ -15,9 +15,13 @@
 # =============================================================================
 import numpy as np
 import pytest
+import tensorflow as tf
 
+from lmnet.data_augmentor import Brightness, FlipLeftRight
+from lmnet.data_processor import Sequence
 from lmnet.datasets.dataset_iterator import DatasetIterator
 from lmnet.datasets.image_folder import ImageFolderBase
+from lmnet.pre_processor import Resize
 
 # Apply set_test_environment() in conftest.py to all tests in this file.
 pytestmark = pytest.mark.usefixtures("set_test_environment")
@@ -27,6 +31,13 @@ class Dummy(ImageFolderBase):
     extend_dir = "dummy_classification"
 
 
+class DummyIndex(Dummy):
+    """Dataset which returns the index as the image and the label."""
+
+    def __getitem__(self, i, type=None):
+        return np.array([i]), np.array([i])
+
+
 def test_dataset_iterator_batch_size():
     batch_size = 8
     dataset = Dummy(subset="train", batch_size=batch_size)
@@ -63,8 +74,165 @@ def test_dataset_iterator_batch_order():
         assert np.all(labels == prefetch_labels)
 
 
+def test_dataset_iterator_prefetch_processes():
+    """Assert that prefetch with configured workers returns same batches and counts them."""
+
+    batch_size = 8
+    dataset = Dummy(subset="train", batch_size=batch_size)
+    dataset_iterator = DatasetIterator(dataset, seed=10, enable_prefetch=False)
+    prefetch_dataset_iterator = DatasetIterator(
+        dataset, seed=10, enable_prefetch=True, prefetch_processes=2, prefetch_batches_in_flight=3,
+    )
+
+    for i in range(0, 10):
+        images, labels = next(dataset_iterator)
+        prefetch_images, prefetch_labels = next(prefetch_dataset_iterator)
+
+        assert np.all(images == prefetch_images)
+        assert np.all(labels == prefetch_labels)
+
+    stats = prefetch_dataset_iterator.prefetch_stats()
+    assert stats["batches"] >= 10
+    assert stats["batches_per_sec"] > 0
+    assert stats["consumer_stall_time"] >= 0
+    assert dataset_iterator.prefetch_stats() is None
+
+    prefetch_dataset_iterator.close()
+
+
+def test_dataset_iterator_prefetch_shared_memory():
+    """Assert that batches through shared memory slots are same as batches without prefetch."""
+
+    batch_size = 8
+    dataset = Dummy(subset="train", batch_size=batch_size)
+    dataset_iterator = DatasetIterator(dataset, seed=10, enable_prefetch=False)
+    prefetch_dataset_iterator = DatasetIterator(
+        dataset, seed=10, enable_prefetch=True, prefetch_processes=2, prefetch_shared_memory=True,
+    )
+
+    # iterate more than the number of slots to recycle them.
+    num_slots = prefetch_dataset_iterator.batch_ring.num_slots
+    for i in range(0, num_slots * 2):
+        images, labels = next(dataset_iterator)
+        prefetch_images, prefetch_labels = next(prefetch_dataset_iterator)
+
+        assert prefetch_images.shape[0] == batch_size
+        assert np.all(images == prefetch_images)
+        assert np.all(labels == prefetch_labels)
+
+    prefetch_dataset_iterator.close()
+
+
+def test_dataset_iterator_augment_batch():
+    """Assert that augmentor which supports apply_batch works with and without prefetch."""
+
+    batch_size = 8
+    image_size = [32, 32]
+    augmentor = Sequence([FlipLeftRight(), Brightness()])
+    # all images of the dummy dataset have the same size, so they are augmented as one batch.
+    dataset = Dummy(subset="train", batch_size=batch_size, augmentor=augmentor, pre_processor=Resize(image_size))
+    assert augmentor.support_batch
+
+    for enable_prefetch in [False, True]:
+        dataset_iterator = DatasetIterator(dataset, seed=10, enable_prefetch=enable_prefetch)
+        for i in range(0, 3):
+            images, labels = next(dataset_iterator)
+            assert images.shape == (batch_size, image_size[0], image_size[1], 3)
+            assert labels.shape[0] == batch_size
+        dataset_iterator.close()
+
+
+def test_dataset_iterator_to_tf_dataset():
+    """Assert that batches through tf.data are same as batches of the iterator, with and without prefetch."""
+
+    batch_size = 8
+    image_size = [32, 32]
+    dataset = Dummy(subset="train", batch_size=batch_size, pre_processor=Resize(image_size))
+    output_shapes = (
+        tf.TensorShape([batch_size, image_size[0], image_size[1], 3]),
+        tf.TensorShape([batch_size, dataset.num_classes]),
+    )
+
+    for enable_prefetch in [False, True]:
+        dataset_iterator = DatasetIterator(dataset, seed=10, enable_prefetch=False)
+        tf_data_iterator = DatasetIterator(
+            dataset, seed=10, enable_prefetch=enable_prefetch, prefetch_shared_memory=enable_prefetch,
+        )
+        with tf.Graph().as_default():
+            tf_dataset = tf_data_iterator.to_tf_dataset((tf.float32, tf.int32), output_shapes)
+            next_batch = tf.compat.v1.data.make_one_shot_iterator(tf_dataset).get_next()
+            with tf.compat.v1.Session() as sess:
+                for i in range(0, 10):
+                    images, labels = next(dataset_iterator)
+                    tf_images, tf_labels = sess.run(next_batch)
+
+                    assert np.all(images == tf_images)
+                    assert np.all(labels == tf_labels)
+        tf_data_iterator.close()
+
+
+def test_dataset_iterator_shards():
+    """Assert that the shards of an epoch are disjoint and cover the dataset, with and without prefetch."""
+
+    num_shards = 3
+    dataset = DummyIndex(subset="train", batch_size=1)
+    num_per_epoch = dataset.num_per_epoch
+    assert num_per_epoch > num_shards
+
+    for enable_prefetch in [False, True]:
+        epoch_ids = []
+        for shard_index in range(num_shards):
+            dataset_iterator = DatasetIterator(
+                dataset, seed=10, enable_prefetch=enable_prefetch, num_shards=num_shards, shard_index=shard_index,
+            )
+            num_per_shard = len(range(shard_index, num_per_epoch, num_shards))
+            epoch_ids += [int(next(dataset_iterator)[0][0, 0]) for _ in range(num_per_shard)]
+            dataset_iterator.close()
+
+        assert sorted(epoch_ids) == list(range(num_per_epoch))
+
+    with pytest.raises(ValueError):
+        DatasetIterator(dataset, num_shards=num_shards, shard_index=num_shards)
+
+
+class FeedOnly:
+    """Dataset which is read only through `feed()`, without `__getitem__`."""
+    batch_size = 1
+    num_per_epoch = 4
+
+
+def test_dataset_iterator_shards_feed_only():
+    """Assert that a dataset without `__getitem__` is not read unsharded by every shard."""
+
+    for enable_prefetch in [False, True]:
+        with pytest.raises(ValueError, match="__getitem__"):
+            DatasetIterator(FeedOnly(), enable_prefetch=enable_prefetch, num_shards=2, shard_index=1)
+
+
+def test_dataset_iterator_indices():
+    """Assert that the iterator reads only the given indices, with and without prefetch."""
+
+    indices = [1, 3, 5]
+    dataset = DummyIndex(subset="train", batch_size=1)
+
+    for enable_prefetch in [False, True]:
+        dataset_iterator = DatasetIterator(dataset, seed=10, enable_prefetch=enable_prefetch, indices=indices)
+        assert dataset_iterator.num_per_epoch == len(indices)
+        for epoch in range(2):
+            epoch_ids = [int(next(dataset_iterator)[0][0, 0]) for _ in indices]
+            assert sorted(epoch_ids) == indices
+        dataset_iterator.close()
+
+
 if __name__ == '__main__':
     from lmnet import environment
     environment.setup_test_environment()
     test_dataset_iterator_batch_size()
     test_dataset_iterator_batch_order()
+    test_dataset_iterator_prefetch_processes()
+    test_dataset_iterator_prefetch_shared_memory()
+    test_dataset_iterator_augment_batch()
+    test_dataset_iterator_to_tf_dataset()
+    test_dataset_iterator_shards()
+    test_dataset_iterator_shards_feed_only()
+    test_dataset_iterator_indices()
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 The Blueoil Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+import os
+
+import numpy as np
+import PIL.Image
+import pytest
+
+from lmnet.datasets.base import ImageCache
+from lmnet.datasets.image_folder import ImageFolderBase
+from lmnet.utils.image import load_image
+
+# Apply set_test_environment() in conftest.py to all tests in this file.
+pytestmark = pytest.mark.usefixtures("set_test_environment")
+
+
+IMAGE_FILE = "tests/fixtures/sample_images/cat.jpg"
+
+
+class Dummy(ImageFolderBase):
+    extend_dir = "dummy_classification"
+
+
+def test_image_cache_memory():
+    expected = load_image(IMAGE_FILE)
+    cache = ImageCache(max_bytes=expected.nbytes * 2)
+
+    image = cache.load(IMAGE_FILE)
+    assert np.all(image == expected)
+    assert len(cache._images) == 1
+
+    # returned image is a copy, so modifying it must not break the cache.
+    image[:] = 0
+    assert np.all(cache.load(IMAGE_FILE) == expected)
+
+    gray = cache.load(IMAGE_FILE, convert_rgb=False)
+    assert gray.ndim == 2
+    assert len(cache._images) == 2
+
+    # LRU is bounded by max_bytes.
+    small_cache = ImageCache(max_bytes=expected.nbytes)
+    small_cache.load(IMAGE_FILE, convert_rgb=False)
+    small_cache.load(IMAGE_FILE)
+    assert small_cache._bytes <= small_cache.max_bytes
+    assert len(small_cache._images) == 1
+
+
+def test_image_cache_disk(tmpdir):
+    cache_dir = str(tmpdir.join("image_cache"))
+    expected = load_image(IMAGE_FILE)
+
+    cache = ImageCache(max_bytes=0, cache_dir=cache_dir)
+    assert np.all(cache.load(IMAGE_FILE) == expected)
+    assert len([name for name in os.listdir(cache_dir) if name.endswith(".npy")]) == 1
+
+    # another cache, e.g. another prefetch worker, reads the stored image.
+    other_cache = ImageCache(max_bytes=0, cache_dir=cache_dir)
+    key = other_cache._key(IMAGE_FILE, True)
+    assert np.all(other_cache._get_disk(key) == expected)
+    assert np.all(other_cache.load(IMAGE_FILE) == expected)
+
+    bounded_cache = ImageCache(max_bytes=0, cache_dir=str(tmpdir.join("bounded")), max_disk_bytes=1)
+    assert np.all(bounded_cache.load(IMAGE_FILE) == expected)
+    assert [name for name in os.listdir(bounded_cache.cache_dir) if name.endswith(".npy")] == []
+
+
+def test_image_cache_disk_bound_shared(tmpdir):
+    """The bound of the on-disk store holds for all the caches, e.g. prefetch workers, using the directory."""
+    cache_dir = str(tmpdir.join("image_cache"))
+    image_files = []
+    for i in range(3):
+        image_file = str(tmpdir.join("image_{}.jpg".format(i)))
+        with open(IMAGE_FILE, "rb") as src, open(image_file, "wb") as dst:
+            dst.write(src.read())
+        image_files.append(image_file)
+    nbytes = load_image(IMAGE_FILE).nbytes
+
+    cache = ImageCache(max_bytes=0, cache_dir=cache_dir, max_disk_bytes=int(nbytes * 2.5))
+    other_cache = ImageCache(max_bytes=0, cache_dir=cache_dir, max_disk_bytes=int(nbytes * 2.5))
+    cache.load(image_files[0])
+    other_cache.load(image_files[1])
+    cache.load(image_files[2])
+
+    stored = [name for name in os.listdir(cache_dir) if name.endswith(".npy")]
+    assert len(stored) == 2
+    assert sum(os.path.getsize(os.path.join(cache_dir, name)) for name in stored) <= nbytes * 2.5
+
+
+def test_image_cache_resize():
+    cache = ImageCache(resize=[32, 48])
+    assert cache.load(IMAGE_FILE).shape == (32, 48, 3)
+
+
+def test_image_cache_label_not_resized(tmpdir):
+    mask = np.zeros((40, 60, 3), dtype=np.uint8)
+    mask[:, 30:] = 5
+    mask_file = str(tmpdir.join("mask.png"))
+    PIL.Image.fromarray(mask).save(mask_file)
+
+    cache = ImageCache(resize=[32, 48])
+    dataset = Dummy(subset="train", batch_size=1, image_cache=cache)
+    label = dataset._load_label(mask_file)
+
+    # the class ids are not blended by the resize of the cache.
+    assert np.array_equal(label, mask)
+    assert cache.load(mask_file).shape == (32, 48, 3)
+
+
+def test_dataset_with_image_cache():
+    dataset = Dummy(subset="train", batch_size=1)
+    cached_dataset = Dummy(subset="train", batch_size=1, image_cache=ImageCache())
+
+    for i in range(len(dataset)):
+        image, label = dataset[i]
+        cached_image, cached_label = cached_dataset[i]
+        assert np.all(image == cached_image)
+        assert np.all(label == cached_label)
+
+    assert len(cached_dataset.image_cache._images) == len(dataset)
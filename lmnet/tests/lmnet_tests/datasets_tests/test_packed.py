@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 The Blueoil Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+import os
+
+import numpy as np
+import pytest
+
+from lmnet.datasets.camvid import Camvid
+from lmnet.datasets.dataset_iterator import DatasetIterator
+from lmnet.datasets.image_folder import ImageFolderBase
+from lmnet.datasets.open_images_v4 import OpenImagesV4BoundingBox
+from lmnet.datasets.packed import (
+    PackedClassification,
+    PackedObjectDetection,
+    PackedSegmentation,
+    packed_dataset_class,
+    write_packed_subset,
+)
+from lmnet.pre_processor import Resize, ResizeWithGtBoxes
+
+# Apply set_test_environment() in conftest.py to all tests in this file.
+pytestmark = pytest.mark.usefixtures("set_test_environment")
+
+
+class DummyClassification(ImageFolderBase):
+    extend_dir = "dummy_classification"
+
+
+class DummyObjectDetection(OpenImagesV4BoundingBox):
+    extend_dir = "open_images_v4"
+
+
+class DummyCamvid(Camvid):
+    extend_dir = "camvid"
+
+
+def _pack(dataset, tmpdir, name, **kwargs):
+    data_dir = str(tmpdir)
+    write_packed_subset(dataset, os.path.join(data_dir, name, dataset.subset), **kwargs)
+    return {"name": name, "data_dir": data_dir}
+
+
+def _assert_same_items(dataset, packed_dataset):
+    assert len(dataset) == len(packed_dataset)
+    assert dataset.classes == packed_dataset.classes
+    for i in range(len(dataset)):
+        image, label = dataset[i]
+        packed_image, packed_label = packed_dataset[i]
+        assert np.all(image == packed_image)
+        assert np.all(label == packed_label)
+
+
+def test_packed_dataset_class():
+    assert packed_dataset_class(DummyClassification) is PackedClassification
+    assert packed_dataset_class(DummyObjectDetection) is PackedObjectDetection
+    assert packed_dataset_class(DummyCamvid) is PackedSegmentation
+
+
+def test_packed_classification(tmpdir):
+    dataset = DummyClassification(subset="train")
+    # small shard size to split images into several shards.
+    packed_kwargs = _pack(dataset, tmpdir, "classification", shard_size=4096)
+
+    packed_dataset = PackedClassification(subset="train", **packed_kwargs)
+    assert packed_dataset.meta["num_image_shards"] > 1
+    _assert_same_items(dataset, packed_dataset)
+
+    # packed dataset works with DatasetIterator.
+    packed_dataset = PackedClassification(subset="train", batch_size=2, pre_processor=Resize([32, 32]),
+                                          **packed_kwargs)
+    images, labels = next(DatasetIterator(packed_dataset))
+    assert images.shape == (2, 32, 32, 3)
+    assert labels.shape == (2, packed_dataset.num_classes)
+
+
+def test_packed_classification_jpeg(tmpdir):
+    dataset = DummyClassification(subset="train")
+    packed_kwargs = _pack(dataset, tmpdir, "classification_jpeg", image_format="jpeg")
+
+    packed_dataset = PackedClassification(subset="train", **packed_kwargs)
+    for i in range(len(dataset)):
+        image, label = dataset[i]
+        packed_image, packed_label = packed_dataset[i]
+        assert image.shape == packed_image.shape
+        assert np.all(label == packed_label)
+
+
+def test_packed_object_detection(tmpdir):
+    dataset = DummyObjectDetection(subset="train")
+    packed_kwargs = _pack(dataset, tmpdir, "object_detection")
+
+    packed_dataset = PackedObjectDetection(subset="train", batch_size=2, pre_processor=ResizeWithGtBoxes([32, 32]),
+                                           **packed_kwargs)
+    assert packed_dataset.num_max_boxes == dataset.num_max_boxes
+    assert packed_dataset.count_max_boxes() == dataset.num_max_boxes
+    _assert_same_items(dataset, packed_dataset)
+
+    images, labels = next(DatasetIterator(packed_dataset))
+    assert labels.shape == (2, dataset.num_max_boxes, 5)
+
+
+def test_packed_segmentation(tmpdir):
+    dataset = DummyCamvid(subset="train")
+    packed_kwargs = _pack(dataset, tmpdir, "segmentation")
+
+    packed_dataset = PackedSegmentation(subset="train", **packed_kwargs)
+    assert np.all(packed_dataset.label_colors == np.array(dataset.label_colors))
+    _assert_same_items(dataset, packed_dataset)
+
+
+def test_packed_dataset_not_exists(tmpdir):
+    with pytest.raises(ValueError):
+        PackedClassification(subset="train", name="not_exists", data_dir=str(tmpdir))
@@ -18,6 +18,7 @@ import numpy as np
 import tensorflow as tf
 
 from lmnet.metrics.mean_average_precision import (
+    MeanAveragePrecision,
     _mean_average_precision,
     _calc_average_precision,
     _average_precision,
@@ -518,7 +519,48 @@ def test_average_precision():
     assert np.allclose(average_precision, tf_average_precision.eval())
 
 
+def test_mean_average_precision_streaming():
+    """Accumulating batches gives the identical result to all the images at once."""
+    np.random.seed(0)
+    classes = ["class_1", "class_2", "class_3", ]
+    num_images = 10
+
+    gt_boxes = np.zeros((num_images, 8, 5))
+    gt_boxes[:, :, 4] = -1
+    all_boxes = []
+    for image_index in range(num_images):
+        num_gt_boxes = np.random.randint(0, 8)
+        gt_boxes[image_index, :num_gt_boxes, :2] = np.random.uniform(0, 100, (num_gt_boxes, 2))
+        gt_boxes[image_index, :num_gt_boxes, 2:4] = np.random.uniform(1, 40, (num_gt_boxes, 2))
+        gt_boxes[image_index, :num_gt_boxes, 4] = np.random.randint(0, len(classes), num_gt_boxes)
+
+        num_boxes = np.random.randint(0, 20)
+        boxes = np.empty((num_boxes, 6))
+        boxes[:, :4] = gt_boxes[image_index, np.random.randint(0, 8, num_boxes), :4]
+        boxes[:, :4] += np.random.normal(0, 3, (num_boxes, 4))
+        boxes[:, 4] = np.random.randint(0, len(classes), num_boxes)
+        # equal scores
+        boxes[:, 5] = np.random.choice([0.2, 0.5, 0.9], num_boxes)
+        all_boxes.append(boxes)
+
+    expected = _mean_average_precision(all_boxes, gt_boxes, classes)
+
+    mean_average_precision = MeanAveragePrecision(classes)
+    for start in range(0, num_images, 3):
+        mean_average_precision.update(all_boxes[start:start + 3], gt_boxes[start:start + 3])
+    result = mean_average_precision.result()
+
+    assert result['MeanAveragePrecision'] == expected['MeanAveragePrecision']
+    for key in ['AveragePrecision', 'Precision', 'Recall', 'OrderedPrecision', 'OrderedRecall']:
+        for value, expected_value in zip(result[key], expected[key]):
+            assert np.array_equal(value, expected_value)
+
+    mean_average_precision.reset()
+    assert mean_average_precision.result()['MeanAveragePrecision'] == 0
+
+
 if __name__ == '__main__':
     test_mean_average_precision()
     test_tf_mean_average_precision()
     test_average_precision()
+    test_mean_average_precision_streaming()
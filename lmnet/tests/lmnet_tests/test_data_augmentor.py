@@ -359,6 +359,62 @@ def test_crop_boxes():
         cropped = crop_boxes(boxes, crop_rect)
 
 
+@pytest.mark.parametrize("processor", [
+    Brightness((0.5, 0.5)),
+    Brightness((1.5, 1.5)),
+    Color((0.5, 0.5)),
+    Color((1.5, 1.5)),
+    Contrast((0.5, 0.5)),
+    Contrast((1.5, 1.5)),
+    Hue((-10, -10)),
+    Hue((10, 10)),
+])
+def test_apply_batch_same_as_call(processor):
+    """Assert that apply_batch gives the same images as the per image PIL implementation."""
+    image = _image()
+    images = np.stack([image, image[::-1, ::-1, :]])
+
+    expected = np.stack([processor(image=image)["image"] for image in images])
+    batch = processor.apply_batch(image=images)
+
+    assert batch["image"].dtype == np.uint8
+    assert np.all(batch["image"] == expected)
+
+
+def test_flip_apply_batch():
+    images = np.stack([_image(), _image()])
+    gt_boxes = np.array([[[10, 20, 30, 40, 0]], [[10, 20, 30, 40, 1]]])
+    width = images.shape[2]
+
+    batch = FlipLeftRight(probability=-1).apply_batch(image=images, gt_boxes=gt_boxes)
+    assert np.all(batch["image"] == images[:, :, ::-1, :])
+    assert np.all(batch["gt_boxes"][:, :, 0] == width - 10 - 30)
+
+    batch = FlipTopBottom(probability=1).apply_batch(image=images, gt_boxes=gt_boxes)
+    assert np.all(batch["image"] == images)
+    assert np.all(batch["gt_boxes"] == gt_boxes)
+
+
+def test_blur_apply_batch():
+    images = np.stack([_image(), _image()])
+
+    batch = Blur((0, 0)).apply_batch(image=images)
+    assert np.all(batch["image"] == images)
+
+    batch = Blur((2, 2)).apply_batch(image=images)
+    assert batch["image"].shape == images.shape
+    assert batch["image"].std() < images.std()
+
+
+def test_sequence_support_batch():
+    assert Sequence([FlipLeftRight(), Brightness(), Color(), Contrast(), Hue(), Blur()]).support_batch
+    assert not Sequence([FlipLeftRight(), SSDRandomCrop()]).support_batch
+
+    images = np.stack([_image(), _image()])
+    batch = Sequence([FlipLeftRight(), FlipTopBottom(), Brightness(), Hue()]).apply_batch(image=images)
+    assert batch["image"].shape == images.shape
+
+
 if __name__ == '__main__':
     test_sequence()
     test_blur()
@@ -374,3 +430,6 @@ if __name__ == '__main__':
     test_ssd_random_crop()
     test_iou()
     test_crop_boxes()
+    test_flip_apply_batch()
+    test_blur_apply_batch()
+    test_sequence_support_batch()
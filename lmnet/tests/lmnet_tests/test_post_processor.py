@@ -246,6 +246,91 @@ def test_nms_max_output_size():
         assert np.allclose(expected_y, y), (expected_y, y)
 
 
+def _random_boxes(num_boxes, num_classes, seed=0):
+    """Random boxes like FormatYoloV2 outputs, which overlap a lot."""
+    rng = np.random.RandomState(seed)
+    xy = rng.uniform(0, 400, size=(num_boxes, 2))
+    wh = rng.uniform(10, 100, size=(num_boxes, 2))
+    class_ids = rng.randint(0, num_classes, size=(num_boxes, 1))
+    scores = rng.uniform(0, 1, size=(num_boxes, 1))
+    return np.concatenate([xy, wh, class_ids, scores], axis=1)
+
+
+def _reference_nms(post_process, boxes):
+    """Previous per class loop of `NMS.__call__`."""
+    if not post_process.per_class:
+        return post_process._nms(boxes)
+
+    return np.concatenate([
+        post_process._nms(boxes[boxes[:, 4] == class_id]) for class_id in range(len(post_process.classes))
+    ])
+
+
+@pytest.mark.parametrize("num_boxes", [0, 1, 300, 2000])
+@pytest.mark.parametrize("per_class", [True, False])
+@pytest.mark.parametrize("max_output_size", [3, 100])
+def test_nms_same_as_reference(num_boxes, per_class, max_output_size):
+    classes = range(20)
+    post_process = NMS(
+        classes=classes,
+        iou_threshold=0.5,
+        max_output_size=max_output_size,
+        per_class=per_class,
+    )
+
+    inputs = [_random_boxes(num_boxes, len(classes), seed) for seed in range(2)]
+    ys = post_process(inputs)["outputs"]
+
+    for boxes, y in zip(inputs, ys):
+        expected_y = _reference_nms(post_process, boxes)
+        assert y.shape == expected_y.shape
+        assert np.array_equal(expected_y, y)
+
+
+@pytest.mark.parametrize("per_class", [True, False])
+def test_nms_tied_scores_same_as_reference(per_class):
+    """Quantized outputs have many boxes of the same score, whose order decides the selected boxes."""
+    classes = range(5)
+    post_process = NMS(classes=classes, iou_threshold=0.5, per_class=per_class)
+
+    inputs = []
+    for seed in range(20):
+        boxes = _random_boxes(300, len(classes), seed)
+        boxes[:, 5] = np.round(boxes[:, 5], 1)
+        inputs.append(boxes)
+    ys = post_process(inputs)["outputs"]
+
+    for boxes, y in zip(inputs, ys):
+        expected_y = _reference_nms(post_process, boxes)
+        assert np.array_equal(expected_y, y)
+
+
+def test_nms_score_threshold():
+    inputs = [np.array([
+        [10, 11, 12, 13, 1, 0.1],
+        [80, 81, 22, 23, 2, 0.2],
+        [30, 31, 32, 33, 3, 0.3],
+    ])]
+    post_process = NMS(classes=range(5), iou_threshold=0.4, score_threshold=0.2)
+
+    ys = post_process(inputs)["outputs"]
+
+    assert np.allclose(ys[0], inputs[0][1:])
+
+
+def benchmark_nms(num_boxes=4000, num_classes=80, repeat=10):
+    """Compare `NMS.__call__` with the previous per class loop. `python tests/lmnet_tests/test_post_processor.py`"""
+    import timeit
+
+    post_process = NMS(classes=range(num_classes), iou_threshold=0.5, max_output_size=100)
+    boxes = _random_boxes(num_boxes, num_classes)
+
+    reference = timeit.timeit(lambda: _reference_nms(post_process, boxes), number=repeat) / repeat
+    vectorized = timeit.timeit(lambda: post_process([boxes]), number=repeat) / repeat
+    print("NMS of {} boxes, {} classes: reference {:.2f} msec, vectorized {:.2f} msec ({:.1f}x)".format(
+        num_boxes, num_classes, reference * 1000, vectorized * 1000, reference / vectorized))
+
+
 def test_resize_bilinear():
     """Verify Bilinear post process results are same as tf.image.resize_bilinear()"""
     batch_size = 2
@@ -353,6 +438,8 @@ if __name__ == '__main__':
     test_nms()
     test_nms_not_per_class()
     test_nms_max_output_size()
+    test_nms_score_threshold()
+    benchmark_nms()
     test_resize_bilinear()
     test_resize_bilinear_pillow()
     test_gaussian_heatmap_to_joints()
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 The Blueoil Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+import os
+
+import numpy as np
+import pytest
+import tensorflow as tf
+
+from lmnet.utils.background_validator import BackgroundValidator
+from lmnet.utils.background_writer import Snapshot
+
+BATCH_SIZE = 2
+
+
+class LinearModel:
+
+    def placeholders(self):
+        images_placeholder = tf.compat.v1.placeholder(tf.float32, shape=(BATCH_SIZE, 3), name="images_placeholder")
+        labels_placeholder = tf.compat.v1.placeholder(tf.float32, shape=(BATCH_SIZE,), name="labels_placeholder")
+        return images_placeholder, labels_placeholder
+
+    def inference(self, images, is_training):
+        weight = tf.compat.v1.get_variable("weight", [3], initializer=tf.zeros_initializer())
+        return tf.reduce_sum(images * weight, axis=1, name="output")
+
+    def metrics(self, output, labels):
+        mae, update_op = tf.compat.v1.metrics.mean_absolute_error(labels, output)
+        return {"mae": mae}, update_op
+
+    def summary(self, output, labels=None):
+        tf.compat.v1.summary.scalar("output_mean", tf.reduce_mean(output))
+
+
+class ConstantDataset:
+    """Dataset iterator which returns the same batch."""
+
+    num_per_epoch = 5
+
+    def feed(self):
+        return np.ones((BATCH_SIZE, 3), dtype=np.float32), np.zeros((BATCH_SIZE,), dtype=np.float32)
+
+
+def test_background_validator(tmpdir):
+    summary_writer = tf.summary.FileWriter(os.path.join(str(tmpdir), "validation"))
+    validator = BackgroundValidator(LinearModel, ["weight", "global_step"], BATCH_SIZE, summarise_steps=1)
+
+    results = []
+
+    def callback(metrics, snapshot):
+        results.append((snapshot.global_step, metrics["mae"]))
+
+    for step, weight in [(10, [1, 2, 3]), (20, [0, 0, 1])]:
+        snapshot = Snapshot(step, {"weight": np.array(weight, dtype=np.float32), "global_step": step})
+        validator.submit(snapshot, ConstantDataset(), summary_writer, step, callback=callback)
+    validator.close()
+
+    # the metrics are reset for each validation.
+    assert results == [(10, pytest.approx(6.0)), (20, pytest.approx(1.0))]
+    assert validator.num_jobs == 2
+    assert "2 validations" in validator.report()
+
+
+def test_background_validator_missing_variables():
+    with pytest.raises(ValueError):
+        BackgroundValidator(LinearModel, ["global_step"], BATCH_SIZE, summarise_steps=1)
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 The Blueoil Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+import os
+import threading
+
+import numpy as np
+import tensorflow as tf
+
+from lmnet.utils.background_writer import BackgroundWriter
+
+
+def test_background_writer(tmpdir):
+    checkpoints_dir = str(tmpdir)
+    graph = tf.Graph()
+    with graph.as_default():
+        global_step = tf.Variable(0, name="global_step", trainable=False)
+        weight = tf.Variable(np.arange(6, dtype=np.float32).reshape(2, 3), name="layer/weight")
+        tf.identity(weight * 2, name="output")
+        increment_op = tf.group(tf.compat.v1.assign_add(weight, tf.ones_like(weight)),
+                                tf.compat.v1.assign_add(global_step, 1))
+        summary_op = tf.compat.v1.summary.scalar("weight_sum", tf.reduce_sum(weight))
+        saver = tf.compat.v1.train.Saver(max_to_keep=2)
+        var_list = tf.global_variables()
+
+    sess = tf.Session(graph=graph)
+    sess.run(tf.compat.v1.variables_initializer(var_list))
+    summary_writer = tf.summary.FileWriter(os.path.join(checkpoints_dir, "train"))
+
+    background_writer = BackgroundWriter(sess, global_step, var_list, saver_def=saver.as_saver_def(),
+                                         max_to_keep=2)
+    expected = {}
+    for step in range(3):
+        sess.run(increment_op)
+        snapshot = background_writer.save(os.path.join(checkpoints_dir, "save.ckpt"))
+        expected[snapshot.global_step] = snapshot.values["layer/weight"].copy()
+        background_writer.add_summary(summary_writer, sess.run(summary_op), step + 1)
+    background_writer.export_graph(checkpoints_dir, "minimal_graph.pb", "minimal_graph.pbtxt")
+    background_writer.flush_summary(summary_writer)
+    # the training continues while the values are written.
+    sess.run(increment_op)
+    background_writer.close()
+    assert background_writer.num_jobs == 8
+    assert "8 jobs" in background_writer.report()
+
+    # max_to_keep removes the first checkpoint.
+    assert not os.path.exists(os.path.join(checkpoints_dir, "save.ckpt-1.index"))
+    ckpt = tf.train.get_checkpoint_state(checkpoints_dir)
+    assert ckpt.model_checkpoint_path == os.path.join(checkpoints_dir, "save.ckpt-3")
+    assert os.path.exists(ckpt.model_checkpoint_path + ".meta")
+
+    # the checkpoint is restored by the training saver.
+    saver.restore(sess, ckpt.model_checkpoint_path)
+    weight_value, global_step_value = sess.run([weight, global_step])
+    assert global_step_value == 3
+    assert np.array_equal(weight_value, expected[3])
+
+    # the exported graph has the snapshot values as constants.
+    with tf.Graph().as_default() as minimal_graph:
+        graph_def = tf.compat.v1.GraphDef()
+        with open(os.path.join(checkpoints_dir, "minimal_graph.pb"), "rb") as f:
+            graph_def.ParseFromString(f.read())
+        tf.import_graph_def(graph_def, name="")
+        with tf.Session(graph=minimal_graph) as minimal_sess:
+            output = minimal_sess.run("output:0")
+    assert np.array_equal(output, expected[3] * 2)
+
+
+class SummaryWriterStub:
+
+    def __init__(self):
+        self.summaries = []
+
+    def add_summary(self, summary, global_step):
+        self.summaries.append((summary, global_step))
+
+
+def test_background_writer_jobs_from_threads():
+    graph = tf.Graph()
+    with graph.as_default():
+        global_step = tf.Variable(0, name="global_step", trainable=False)
+    sess = tf.Session(graph=graph)
+    background_writer = BackgroundWriter(sess, global_step, [])
+    summary_writer = SummaryWriterStub()
+
+    # e.g. the training thread and the callbacks of the background validator.
+    def add_summaries(index):
+        for step in range(200):
+            background_writer.add_summary(summary_writer, index, step)
+
+    threads = [threading.Thread(target=add_summaries, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    background_writer.close()
+
+    assert background_writer.num_jobs == 800
+    assert len(summary_writer.summaries) == 800
+
+
+def test_background_writer_export_graph(tmpdir):
+    export_dir = str(tmpdir)
+    graph = tf.Graph()
+    with graph.as_default():
+        global_step = tf.Variable(0, name="global_step", trainable=False)
+        dataset = tf.data.Dataset.from_tensors(np.ones((2, 2), dtype=np.float32)).repeat()
+        iterator = tf.compat.v1.data.make_initializable_iterator(dataset)
+        images = tf.compat.v1.placeholder_with_default(iterator.get_next(), (2, 2), name="images_input")
+        weight = tf.Variable(np.arange(4, dtype=np.float32).reshape(2, 2), name="layer/weight")
+        tf.matmul(images, weight, name="output")
+        var_list = tf.global_variables()
+
+    # the same variable from the plain placeholder.
+    export_graph = tf.Graph()
+    with export_graph.as_default():
+        images_placeholder = tf.compat.v1.placeholder(tf.float32, (2, 2), name="images_placeholder")
+        export_weight = tf.Variable(np.zeros((2, 2), dtype=np.float32), name="layer/weight")
+        tf.matmul(images_placeholder, export_weight, name="output")
+
+    sess = tf.Session(graph=graph)
+    sess.run([tf.compat.v1.variables_initializer(var_list), iterator.initializer])
+    background_writer = BackgroundWriter(sess, global_step, var_list)
+    background_writer.export_graph(export_dir, "minimal_graph.pb", graph=export_graph)
+    background_writer.close()
+
+    graph_def = tf.compat.v1.GraphDef()
+    with open(os.path.join(export_dir, "minimal_graph.pb"), "rb") as f:
+        graph_def.ParseFromString(f.read())
+    node_names = {node.name for node in graph_def.node}
+    assert "images_placeholder" in node_names
+    assert "images_input" not in node_names
+    assert not any(node.op.startswith("Iterator") for node in graph_def.node)
+
+    # the exported graph has the training values as constants.
+    with tf.Graph().as_default() as minimal_graph:
+        tf.import_graph_def(graph_def, name="")
+        with tf.Session(graph=minimal_graph) as minimal_sess:
+            output = minimal_sess.run("output:0", feed_dict={"images_placeholder:0": np.eye(2)})
+    assert np.array_equal(output, np.arange(4).reshape(2, 2))
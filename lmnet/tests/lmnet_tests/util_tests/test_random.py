@@ -18,7 +18,7 @@ import random
 import numpy as np
 import pytest
 
-from lmnet.utils.random import shuffle, train_test_split
+from lmnet.utils.random import shuffle, stratified_sample, train_test_split
 
 
 def test_shuffle():
@@ -128,8 +128,28 @@ def test_train_test_split():
     assert not np.all(test_b == diff_seed_test_b)
 
 
+def test_stratified_sample():
+    labels = [0] * 50 + [1] * 30 + [2] * 20
+    seed = random.randint(1, 100)
+
+    indices = stratified_sample(labels, 10, seed=seed)
+    assert len(indices) == 10
+    assert len(set(indices)) == 10
+    assert np.all(np.diff(indices) > 0)
+    assert np.bincount(np.array(labels)[indices]).tolist() == [5, 3, 2]
+    assert np.all(indices == stratified_sample(labels, 10, seed=seed))
+
+    # the largest remainders are rounded up.
+    indices = stratified_sample(labels, 7, seed=seed)
+    assert np.bincount(np.array(labels)[indices]).tolist() == [4, 2, 1]
+
+    # the size is at most the number of samples.
+    assert np.all(stratified_sample(labels, 200, seed=seed) == np.arange(100))
+
+
 if __name__ == '__main__':
     test_shuffle()
     test_shuffle_diff_length()
     test_shuffle_range()
     test_train_test_split()
+    test_stratified_sample()
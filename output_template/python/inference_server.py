@@ -0,0 +1,463 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 The Blueoil Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+"""Long running inference server.
+
+Each worker process loads the model (`lib_*.so` or `.pb`) once. Requests are queued and grouped into
+micro-batches which are run by a free worker with pre process, inference and post process.
+
+    POST /predict?file=<name>   request body is an encoded image (JPEG, PNG, ...), response is the output json.
+    GET  /stats                 request counts and p50 / p99 latency.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import collections
+import json
+import logging
+import os
+import signal
+import threading
+import time
+import traceback
+from io import BytesIO
+from multiprocessing import Pool
+
+import click
+import numpy as np
+import PIL.Image
+
+from lmnet.common import Tasks
+from lmnet.nnlib import NNLib
+from lmnet.utils.config import (
+    load_yaml,
+    build_pre_process,
+    build_post_process,
+)
+from lmnet.utils.output import JsonOutput
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from Queue import Empty, Full, Queue
+    from SocketServer import ThreadingMixIn, UnixStreamServer
+    from urlparse import parse_qs, urlparse
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from queue import Empty, Full, Queue
+    from socketserver import ThreadingMixIn, UnixStreamServer
+    from urllib.parse import parse_qs, urlparse
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+# global variables of worker process.
+nn = None
+pre_process = None
+post_process = None
+config = None
+
+
+def _load_model(model):
+    filename, file_extension = os.path.splitext(model)
+    supported_files = ['.so', '.pb']
+
+    if file_extension not in supported_files:
+        raise Exception("""
+            Unknown file type. Got %s%s.
+            Please check the model file (-m).
+            Only .pb (protocol buffer) or .so (shared object) file is supported.
+            """ % (filename, file_extension))
+
+    if file_extension == '.so':  # Shared library
+        model_nn = NNLib()
+        model_nn.load(model)
+
+    elif file_extension == '.pb':  # Protocol Buffer file
+        # only load tensorflow if user wants to use GPU
+        from lmnet.tensorflow_graph_runner import TensorflowGraphRunner
+        model_nn = TensorflowGraphRunner(model)
+
+    model_nn.init()
+    return model_nn
+
+
+def _init_worker(model, config_file):
+    global nn, pre_process, post_process, config
+    # ignore SIGINT in pooled process.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    config = load_yaml(config_file)
+    pre_process = build_pre_process(config.PRE_PROCESSOR)
+    post_process = build_post_process(config.POST_PROCESSOR)
+    nn = _load_model(model)
+
+
+def _run_network(images):
+    if hasattr(nn, "run_batch"):
+        return nn.run_batch(images)
+
+    return np.concatenate([nn.run(image[np.newaxis]) for image in images])
+
+
+def _run_batch(requests):
+    """Run a micro-batch in a worker process.
+
+    Args:
+        requests: List of tuple (encoded image bytes, file name).
+
+    Returns:
+        list: Tuple (HTTP status, output json string or error message) of each request.
+    """
+    results = [None] * len(requests)
+    raw_images = []
+    images = []
+    indices = []
+
+    start = time.time()
+    for i, (image_bytes, file_name) in enumerate(requests):
+        try:
+            raw_image = np.array(PIL.Image.open(BytesIO(image_bytes)).convert("RGB"))
+            image = pre_process(image=raw_image)["image"]
+            if config.DATA_FORMAT == "NCHW":
+                image = np.transpose(image, [2, 0, 1])
+        except Exception as e:
+            results[i] = (400, "Failed to read image: {}".format(e))
+            continue
+        raw_images.append(raw_image)
+        images.append(image)
+        indices.append(i)
+
+    if not images:
+        return results
+
+    try:
+        inference_start = time.time()
+        outputs = _run_network(np.stack(images))
+        post_start = time.time()
+        outputs = [post_process(outputs=output[np.newaxis])["outputs"] for output in outputs]
+        end = time.time()
+    except Exception:
+        error = traceback.format_exc()
+        for i in indices:
+            results[i] = (500, error)
+        return results
+
+    num = len(images)
+    bench = {
+        "batch_size": num,
+        "pre": (inference_start - start) / num,
+        "inference": (post_start - inference_start) / num,
+        "post": (end - post_start) / num,
+    }
+    json_output = JsonOutput(
+        task=Tasks(config.TASK),
+        classes=config.CLASSES,
+        image_size=config.IMAGE_SIZE,
+        data_format=config.DATA_FORMAT,
+        bench=bench,
+    )
+    for i, raw_image, output in zip(indices, raw_images, outputs):
+        results[i] = (200, json_output(output, [raw_image], [requests[i][1]]))
+
+    return results
+
+
+class InferenceRequest(object):
+    """A queued request, the handler thread waits `done` until a worker sets `status` and `body`."""
+
+    def __init__(self, image_bytes, file_name):
+        self.image_bytes = image_bytes
+        self.file_name = file_name
+        self.start = time.time()
+        self.done = threading.Event()
+        self.status = None
+        self.body = None
+
+
+class LatencyStats(object):
+    """Request latency of the last `window` requests."""
+
+    def __init__(self, window=10000):
+        self.lock = threading.Lock()
+        self.latencies = collections.deque(maxlen=window)
+        self.num_requests = 0
+        self.num_errors = 0
+        self.num_batches = 0
+
+    def add_batch(self, requests):
+        with self.lock:
+            self.num_batches += 1
+            for request in requests:
+                self.num_requests += 1
+                if request.status != 200:
+                    self.num_errors += 1
+                self.latencies.append(time.time() - request.start)
+
+    def summary(self):
+        with self.lock:
+            latencies = np.array(self.latencies) * 1000
+            summary = {
+                "requests": self.num_requests,
+                "errors": self.num_errors,
+                "batches": self.num_batches,
+                "mean_batch_size": self.num_requests / self.num_batches if self.num_batches else 0.0,
+            }
+
+        if len(latencies):
+            summary["latency_ms"] = {
+                "p50": float(np.percentile(latencies, 50)),
+                "p99": float(np.percentile(latencies, 99)),
+                "mean": float(latencies.mean()),
+                "max": float(latencies.max()),
+            }
+        return summary
+
+
+class MicroBatcher(object):
+    """Group queued requests into micro-batches and dispatch them to the worker pool.
+
+    A batch is dispatched when a worker is free, with the requests queued until then, up to `max_batch_size`.
+    After the first request of a batch, it waits at most `batch_timeout` seconds for following requests.
+
+    Args:
+        pool: `multiprocessing.Pool` whose workers are initialized by `_init_worker`.
+        num_workers(int): Number of batches in flight.
+        max_batch_size(int): Max number of requests in a batch.
+        batch_timeout(float): Seconds to wait for filling a batch.
+        max_queue_size(int): Max number of queued requests. 0 is unlimited.
+        report_interval(float): Seconds between latency logs. 0 disables logs.
+    """
+
+    def __init__(self, pool, num_workers, max_batch_size=8, batch_timeout=0.002, max_queue_size=256,
+                 report_interval=60):
+        self.pool = pool
+        self.max_batch_size = max_batch_size
+        self.batch_timeout = batch_timeout
+        self.report_interval = report_interval
+        self.queue = Queue(maxsize=max_queue_size)
+        self.workers = threading.BoundedSemaphore(num_workers)
+        self.stats = LatencyStats()
+        self.stopped = False
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def submit(self, image_bytes, file_name):
+        """Queue a request. Raise `Full` when the queue is full."""
+        request = InferenceRequest(image_bytes, file_name)
+        self.queue.put_nowait(request)
+        return request
+
+    def _next_batch(self):
+        try:
+            batch = [self.queue.get(timeout=0.1)]
+        except Empty:
+            return []
+
+        deadline = time.time() + self.batch_timeout
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+                continue
+            except Empty:
+                pass
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except Empty:
+                break
+        return batch
+
+    def _run(self):
+        last_report = time.time()
+        while not self.stopped:
+            if self.report_interval and time.time() - last_report > self.report_interval:
+                logger.info("stats: {}".format(json.dumps(self.stats.summary(), sort_keys=True)))
+                last_report = time.time()
+
+            self.workers.acquire()
+            batch = self._next_batch()
+            if not batch:
+                self.workers.release()
+                continue
+
+            self.pool.apply_async(
+                _run_batch,
+                ([(request.image_bytes, request.file_name) for request in batch], ),
+                callback=lambda results, batch=batch: self._finish(batch, results),
+                error_callback=lambda error, batch=batch: self._fail(batch, error),
+            )
+
+    def _finish(self, batch, results):
+        self.workers.release()
+        for request, (status, body) in zip(batch, results):
+            request.status = status
+            request.body = body
+        self.stats.add_batch(batch)
+        for request in batch:
+            request.done.set()
+
+    def _fail(self, batch, error):
+        # the worker raised out of `_run_batch` or failed to return the results, e.g. they can't be pickled.
+        # finish the batch anyway, otherwise the worker slot leaks and the requests wait until the timeout.
+        message = "Failed to run a batch: {}".format(error)
+        self._finish(batch, [(500, message)] * len(batch))
+
+    def stop(self):
+        self.stopped = True
+        self.thread.join()
+
+
+class InferenceHandler(BaseHTTPRequestHandler):
+    batcher = None
+    request_timeout = 30
+
+    def _send_json(self, status, body):
+        body = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error_json(self, status, message):
+        self._send_json(status, json.dumps({"error": message}))
+
+    def do_GET(self):
+        if urlparse(self.path).path != "/stats":
+            return self._send_error_json(404, "Not found: {}".format(self.path))
+
+        self._send_json(200, json.dumps(self.batcher.stats.summary(), indent=4, sort_keys=True))
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/predict":
+            return self._send_error_json(404, "Not found: {}".format(self.path))
+
+        length = int(self.headers.get("Content-Length", 0))
+        if length == 0:
+            return self._send_error_json(400, "Request body should be an encoded image.")
+        image_bytes = self.rfile.read(length)
+        file_name = parse_qs(url.query).get("file", ["image"])[0]
+
+        try:
+            request = self.batcher.submit(image_bytes, file_name)
+        except Full:
+            return self._send_error_json(503, "Too many requests are queued.")
+
+        if not request.done.wait(self.request_timeout):
+            return self._send_error_json(504, "Inference timed out.")
+
+        if request.status != 200:
+            return self._send_error_json(request.status, request.body)
+
+        self._send_json(200, request.body)
+
+    def address_string(self):
+        # client address of unix domain socket is not a tuple of (host, port).
+        if isinstance(self.client_address, tuple):
+            return self.client_address[0]
+        return "unix"
+
+
+class ThreadedHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class ThreadedUnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+        UnixStreamServer.server_bind(self)
+
+
+def run(model, config_file, host="127.0.0.1", port=8080, unix_socket=None, num_workers=1, max_batch_size=8,
+        batch_timeout=2.0, max_queue_size=256, request_timeout=30.0, report_interval=60.0):
+    pool = Pool(processes=num_workers, initializer=_init_worker, initargs=(model, config_file))
+    batcher = MicroBatcher(
+        pool,
+        num_workers,
+        max_batch_size=max_batch_size,
+        batch_timeout=batch_timeout / 1000,
+        max_queue_size=max_queue_size,
+        report_interval=report_interval,
+    )
+    InferenceHandler.batcher = batcher
+    InferenceHandler.request_timeout = request_timeout
+
+    if unix_socket:
+        server = ThreadedUnixHTTPServer(unix_socket, InferenceHandler)
+        logger.info("server starting on unix socket {}".format(unix_socket))
+    else:
+        server = ThreadedHTTPServer((host, port), InferenceHandler)
+        logger.info("server starting on {}:{}".format(host, port))
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("KeyboardInterrupt in server - ending server")
+    finally:
+        server.server_close()
+        logger.info("stats: {}".format(json.dumps(batcher.stats.summary(), sort_keys=True)))
+        pool.terminate()
+        pool.join()
+
+
+@click.command(context_settings=dict(help_option_names=['-h', '--help']))
+@click.option(
+    "-m",
+    "--model",
+    type=click.Path(exists=True),
+    help="Inference Model filename",
+    default="../models/lib/lib_fpga.so",
+)
+@click.option(
+    "-c",
+    "--config_file",
+    type=click.Path(exists=True),
+    help="Config file Path",
+    default="../models/meta.yaml",
+)
+@click.option("--host", default="127.0.0.1", help="Host address to listen.")
+@click.option("-p", "--port", default=8080, help="Port number to listen.")
+@click.option("--unix_socket", default=None, help="Listen on this unix domain socket instead of TCP.")
+@click.option("-n", "--num_workers", default=1, help="Number of worker processes, each loads the model once.")
+@click.option("--max_batch_size", default=8, help="Max number of requests in a micro-batch.")
+@click.option("--batch_timeout", default=2.0, help="Milliseconds to wait for filling a micro-batch.")
+@click.option("--max_queue_size", default=256, help="Max number of queued requests. 0 is unlimited.")
+@click.option("--request_timeout", default=30.0, help="Seconds to wait for an inference result.")
+@click.option("--report_interval", default=60.0, help="Seconds between latency logs. 0 disables logs.")
+def main(model, config_file, host, port, unix_socket, num_workers, max_batch_size, batch_timeout, max_queue_size,
+         request_timeout, report_interval):
+    """Serve inference of a model over HTTP with request queueing and dynamic micro-batching.
+
+    \b
+    $ curl --data-binary @image.jpg "http://127.0.0.1:8080/predict?file=image.jpg"
+    $ curl http://127.0.0.1:8080/stats
+    """
+    run(model, config_file, host, port, unix_socket, num_workers, max_batch_size, batch_timeout, max_queue_size,
+        request_timeout, report_interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -15,6 +15,8 @@
 # =============================================================================
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import multiprocessing
+import threading
 import time
 from itertools import product as itr_prod
 from threading import Thread
@@ -24,10 +26,9 @@ import numpy as np
 
 # HACK: cross py2-py3 compatible version
 try:
-    from queue import Queue
+    from queue import Empty, Full, Queue
 except ImportError:
-    from Queue import Queue
-
+    from Queue import Empty, Full, Queue
 
 
 COLORS = [tuple(p) for p in itr_prod([0, 180, 255], repeat=3)]
@@ -160,3 +161,181 @@ def run_inference(image, nn, pre_process, post_process):
 
     fps = 1.0/(time.clock() - start)
     return output, fps, fps_only_network
+
+
+class PipelineStage(object):
+    """A stage of `StagedPipeline`.
+
+    Args:
+        name (str): Stage name used in `StagedPipeline.stats()`.
+        func (callable): `func(item)` returns the item for the next stage, or None to drop the frame.
+            `func()` without argument is called in the first (source) stage.
+        init (callable): Called once in the thread or process of the stage before the first `func` call,
+            e.g. `nn.init` to initialize the network in the inference process.
+        use_process (bool): Run the stage in a process forked from the main process instead of a thread.
+    """
+
+    def __init__(self, name, func, init=None, use_process=False):
+        self.name = name
+        self.func = func
+        self.init = init
+        self.use_process = use_process
+
+        # shared with the stage process.
+        self._num_frames = multiprocessing.Value("l", 0)
+        self._num_dropped = multiprocessing.Value("l", 0)
+        self._total_time = multiprocessing.Value("d", 0.0)
+
+    def _add(self, elapsed):
+        with self._num_frames.get_lock():
+            self._num_frames.value += 1
+            self._total_time.value += elapsed
+
+    def _drop(self):
+        with self._num_dropped.get_lock():
+            self._num_dropped.value += 1
+
+    def stats(self):
+        num_frames = self._num_frames.value
+        return {
+            "frames": num_frames,
+            "dropped": self._num_dropped.value,
+            "avg_time": self._total_time.value / num_frames if num_frames else 0.0,
+        }
+
+
+class StagedPipeline(object):
+    """Run capture, pre process, inference, post process and render stages concurrently.
+
+    The stages are connected by bounded queues, so that pre process of frame N+1 and post process of frame N-1
+    overlap with inference of frame N. When a stage is slower than the previous one, the oldest queued frame
+    is dropped (`drop_frames=True`) to show recent frames, or the previous stage waits.
+
+    Args:
+        stages (list): `PipelineStage` list. The first stage is the source of frames.
+        queue_size (int): Size of each queue between stages.
+        drop_frames (bool): Drop the oldest queued frame instead of blocking when a queue is full.
+
+    Example:
+        pipeline = StagedPipeline([
+            PipelineStage("capture", stream.read),
+            PipelineStage("pre_process", pre_process_frame),
+            PipelineStage("inference", run_network, init=nn.init, use_process=True),
+            PipelineStage("post_process", post_process_frame),
+        ])
+        pipeline.start()
+        while True:
+            image, result = pipeline.get()
+    """
+
+    def __init__(self, stages, queue_size=1, drop_frames=True):
+        self.stages = stages
+        self.drop_frames = drop_frames
+        self.stopped = multiprocessing.Event()
+        # output queue of each stage. use process queue when either side of it is a process.
+        self.queues = []
+        for stage, next_stage in zip(stages, stages[1:] + [None]):
+            if stage.use_process or (next_stage and next_stage.use_process):
+                self.queues.append(multiprocessing.Queue(queue_size))
+            else:
+                self.queues.append(Queue(queue_size))
+        self.workers = []
+        self._output_times = []
+
+    def _put(self, stage, queue, item):
+        while not self.stopped.is_set():
+            try:
+                if self.drop_frames:
+                    queue.put_nowait(item)
+                else:
+                    queue.put(item, timeout=0.1)
+                return
+            except Full:
+                if not self.drop_frames:
+                    continue
+            # drop the oldest frame to make room for the new one.
+            try:
+                queue.get_nowait()
+                stage._drop()
+            except Empty:
+                pass
+
+    def _get(self, queue):
+        while not self.stopped.is_set():
+            try:
+                return queue.get(timeout=0.1)
+            except Empty:
+                continue
+        return None
+
+    def _run_stage(self, index):
+        stage = self.stages[index]
+        input_queue = self.queues[index - 1] if index > 0 else None
+        output_queue = self.queues[index]
+
+        if stage.init:
+            stage.init()
+
+        while not self.stopped.is_set():
+            if input_queue is None:
+                start = time.time()
+                item = stage.func()
+            else:
+                item = self._get(input_queue)
+                if item is None:
+                    continue
+                start = time.time()
+                item = stage.func(item)
+
+            stage._add(time.time() - start)
+            if item is not None:
+                self._put(stage, output_queue, item)
+
+    def start(self):
+        """Start the stages, all the process stages before any thread stage.
+
+        Forking a process while other threads run can deadlock the child on a lock held by those threads,
+        e.g. of OpenCV. Open devices in `init` of a thread stage, not before `start`, so that no thread runs yet.
+        """
+        for use_process in [True, False]:
+            for index, stage in enumerate(self.stages):
+                if stage.use_process != use_process:
+                    continue
+                if stage.use_process:
+                    worker = multiprocessing.Process(target=self._run_stage, args=(index,))
+                else:
+                    worker = Thread(target=self._run_stage, args=(index,))
+                worker.daemon = True
+                worker.start()
+                self.workers.append(worker)
+
+    def get(self, timeout=None):
+        """Return output item of the last stage, or None when timed out."""
+        try:
+            item = self.queues[-1].get(timeout=timeout)
+        except Empty:
+            return None
+
+        self._output_times = (self._output_times + [time.time()])[-10:]
+        return item
+
+    @property
+    def fps(self):
+        """Output frames per second of the last 10 frames."""
+        if len(self._output_times) < 2:
+            return 0.0
+        return (len(self._output_times) - 1) / (self._output_times[-1] - self._output_times[0])
+
+    def stats(self):
+        """Return {stage name: {"frames", "dropped", "avg_time"}} of each stage."""
+        return {stage.name: stage.stats() for stage in self.stages}
+
+    def stop(self):
+        self.stopped.set()
+        for worker in self.workers:
+            if isinstance(worker, multiprocessing.Process):
+                worker.join(timeout=1.0)
+                if worker.is_alive():
+                    worker.terminate()
+            elif worker is not threading.current_thread():
+                worker.join(timeout=1.0)
@@ -18,15 +18,13 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
-from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
 from io import BytesIO
-from multiprocessing import Pool
 import os
-import signal
 import sys
-from SocketServer import ThreadingMixIn
+import threading
 
 import click
+import numpy as np
 
 from lmnet.nnlib import NNLib
 from lmnet.utils.config import (
@@ -35,8 +33,9 @@ from lmnet.utils.config import (
     build_post_process,
 )
 from lmnet.utils.demo import (
+    PipelineStage,
+    StagedPipeline,
     VideoStream,
-    run_inference,
 )
 from lmnet.visualize import (
     draw_fps,
@@ -45,6 +44,13 @@ from lmnet.visualize import (
     visualize_semantic_segmentation,
 )
 
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+
 
 # global variable for multi process or multi thread.
 nn = None
@@ -52,7 +58,8 @@ pre_process = None
 post_process = None
 stream = None
 config = None
-pool = None
+pipeline = None
+latest_frame = None
 
 # camera settings.
 CAMERA_WIDTH = 320
@@ -61,80 +68,116 @@ CAMERA_FPS = 10
 CAMERA_SOURCE = 0
 
 
+class LatestFrame(object):
+    """Latest JPEG frame, shared with all HTTP connections."""
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.frame = None
+        self.count = 0
+
+    def set(self, frame):
+        with self.condition:
+            self.frame = frame
+            self.count += 1
+            self.condition.notify_all()
+
+    def wait_next(self, count, timeout=1.0):
+        """Return (frame, count) newer than `count`."""
+        with self.condition:
+            if self.count == count:
+                self.condition.wait(timeout)
+            return self.frame, self.count
+
+
 class MotionJpegHandler(BaseHTTPRequestHandler):
     def do_GET(self):
-        global config, stream, pool
-        result = None
-        fps = 0.0
-        fps_only_network = 0.0
-
-        camera_img = stream.read()
-        pool_result = pool.apply_async(_run_inference, (camera_img, ))
+        count = 0
 
         self.send_response(200)
         self.send_header('Content-type', 'multipart/x-mixed-replace; boundary=jpgboundary')
         self.end_headers()
 
         while True:
+            frame, new_count = latest_frame.wait_next(count)
+            if frame is None or new_count == count:
+                continue
+            count = new_count
+
             try:
-                pool_result.wait()
+                self.send_header('Content-type', 'image/jpeg')
+                self.end_headers()
+                self.wfile.write(frame)
+            finally:
+                self.wfile.write(b"\r\n--jpgboundary\r\n")
 
-                if pool_result.ready():
-                    window_img = camera_img
-                    result, fps, fps_only_network = pool_result.get()
+        return
 
-                    camera_img = stream.read()
-                    pool_result = pool.apply_async(_run_inference, (camera_img, ))
 
-                else:
-                    result = None
+class ThreadedHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
 
-                if result is not None:
-                    result = result[0]
-                    if config.TASK == "IMAGE.CLASSIFICATION":
-                        image = visualize_classification(window_img, result, config)
 
-                    if config.TASK == "IMAGE.OBJECT_DETECTION":
-                        image = visualize_object_detection(window_img, result, config)
+def _init_capture():
+    # the reader thread of the stream starts after the stage processes are forked.
+    global stream
+    stream = VideoStream(CAMERA_SOURCE, CAMERA_WIDTH, CAMERA_HEIGHT, CAMERA_FPS)
 
-                    if config.TASK == "IMAGE.SEMANTIC_SEGMENTATION":
-                        image = visualize_semantic_segmentation(window_img, result, config)
 
-                    draw_fps(image, fps, fps_only_network)
-                    tmp = BytesIO()
-                    image.save(tmp, "JPEG")
+def _capture_frame():
+    return stream.read()
 
-                self.send_header('Content-type', 'image/jpeg')
-                self.end_headers()
-                self.wfile.write(tmp.getvalue())
 
-            finally:
-                self.wfile.write(b"\r\n--jpgboundary\r\n")
+def _pre_process_frame(camera_img):
+    data = pre_process(image=camera_img)["image"]
+    data = np.expand_dims(data, axis=0)
+    return camera_img, data
 
-        return
 
+def _init_network():
+    nn.init()
 
-class ThreadedHTTPServer(ThreadingMixIn, HTTPServer):
-    daemon_threads = True
 
+def _infer_frame(item):
+    camera_img, data = item
+    return camera_img, nn.run(data)
 
-def _run_inference(inputs):
-    global nn, pre_process, post_process
-    res, fps, fps_only_network = run_inference(inputs, nn, pre_process, post_process)
-    return res, fps, fps_only_network
 
+def _post_process_frame(item):
+    camera_img, result = item
+    return camera_img, post_process(outputs=result)['outputs']
 
-def _init_worker():
-    global nn
-    # ignore SIGINT in pooled process.
-    signal.signal(signal.SIGINT, signal.SIG_IGN)
 
-    # init
-    nn.init()
+def _render_frame(item):
+    """Visualize result and encode to JPEG outside of HTTP handler threads."""
+    window_img, result = item
+    result = result[0]
+    if config.TASK == "IMAGE.CLASSIFICATION":
+        image = visualize_classification(window_img, result, config)
+
+    if config.TASK == "IMAGE.OBJECT_DETECTION":
+        image = visualize_object_detection(window_img, result, config)
+
+    if config.TASK == "IMAGE.SEMANTIC_SEGMENTATION":
+        image = visualize_semantic_segmentation(window_img, result, config)
+
+    inference_time = pipeline.stats()["inference"]["avg_time"]
+    fps_only_network = 1.0 / inference_time if inference_time else 0.0
+    draw_fps(image, pipeline.fps, fps_only_network)
+    tmp = BytesIO()
+    image.save(tmp, "JPEG")
+    return tmp.getvalue()
+
+
+def _publish_frames():
+    while True:
+        frame = pipeline.get(timeout=1.0)
+        if frame is not None:
+            latest_frame.set(frame)
 
 
 def run(model, config_file, port=80):
-    global nn, pre_process, post_process, config, stream, pool
+    global nn, pre_process, post_process, config, pipeline, latest_frame
 
     filename, file_extension = os.path.splitext(model)
     supported_files = ['.so', '.pb']
@@ -155,17 +198,25 @@ def run(model, config_file, port=80):
         from lmnet.tensorflow_graph_runner import TensorflowGraphRunner
         nn = TensorflowGraphRunner(model)
 
-    nn = NNLib()
-    nn.load(model)
-
-    stream = VideoStream(CAMERA_SOURCE, CAMERA_WIDTH, CAMERA_HEIGHT, CAMERA_FPS)
-
     config = load_yaml(config_file)
 
     pre_process = build_pre_process(config.PRE_PROCESSOR)
     post_process = build_post_process(config.POST_PROCESSOR)
 
-    pool = Pool(processes=1, initializer=_init_worker)
+    # inference overlaps with pre/post process and rendering of other frames.
+    pipeline = StagedPipeline([
+        PipelineStage("capture", _capture_frame, init=_init_capture),
+        PipelineStage("pre_process", _pre_process_frame, use_process=True),
+        PipelineStage("inference", _infer_frame, init=_init_network, use_process=True),
+        PipelineStage("post_process", _post_process_frame, use_process=True),
+        PipelineStage("render", _render_frame),
+    ])
+    latest_frame = LatestFrame()
+    pipeline.start()
+
+    publisher = threading.Thread(target=_publish_frames)
+    publisher.daemon = True
+    publisher.start()
 
     try:
         server = ThreadedHTTPServer(('', port), MotionJpegHandler)
@@ -173,9 +224,11 @@ def run(model, config_file, port=80):
         server.serve_forever()
     except KeyboardInterrupt as e:
         print("KeyboardInterrpt in server - ending server")
-        stream.release()
-        pool.terminate()
-        pool.join()
+        pipeline.stop()
+        if stream is not None:
+            stream.release()
+        for name, stats in pipeline.stats().items():
+            print("{}: {}".format(name, stats))
         server.socket.close()
         server.shutdown()
 
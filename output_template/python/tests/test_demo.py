@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 The Blueoil Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+import itertools
+import time
+
+import pytest
+
+from lmnet.utils.demo import PipelineStage, StagedPipeline
+
+
+def sleep_and(seconds, func):
+    def stage_func(*args):
+        time.sleep(seconds)
+        return func(*args)
+    return stage_func
+
+
+@pytest.fixture
+def pipelines():
+    created = []
+    yield created.append
+    for pipeline in created:
+        pipeline.stop()
+
+
+def get_outputs(pipeline, num):
+    outputs = []
+    for _ in range(num):
+        item = pipeline.get(timeout=10)
+        assert item is not None
+        outputs.append(item)
+    return outputs
+
+
+def test_staged_pipeline_order(pipelines):
+    counter = itertools.count()
+    pipeline = StagedPipeline([
+        PipelineStage("capture", lambda: next(counter)),
+        PipelineStage("double", lambda item: item * 2, use_process=True),
+        PipelineStage("add_one", lambda item: item + 1),
+    ], queue_size=2, drop_frames=False)
+    pipelines(pipeline)
+    pipeline.start()
+
+    # without dropping frames, every frame comes out in the captured order.
+    assert get_outputs(pipeline, 20) == [i * 2 + 1 for i in range(20)]
+
+
+def test_staged_pipeline_drop_frames(pipelines):
+    counter = itertools.count()
+    pipeline = StagedPipeline([
+        PipelineStage("capture", sleep_and(0.001, lambda: next(counter))),
+        PipelineStage("render", sleep_and(0.05, lambda item: item)),
+    ], queue_size=1, drop_frames=True)
+    pipelines(pipeline)
+    pipeline.start()
+
+    outputs = get_outputs(pipeline, 5)
+    pipeline.stop()
+
+    # the slow stage skips the frames dropped from its full input queue, and the rest keep the order.
+    assert outputs == sorted(outputs)
+    assert outputs[-1] - outputs[0] > len(outputs) - 1
+    stats = pipeline.stats()
+    assert stats["capture"]["dropped"] > 0
+    assert stats["capture"]["frames"] > stats["render"]["frames"]
+
+
+def test_staged_pipeline_stats(pipelines):
+    counter = itertools.count()
+    pipeline = StagedPipeline([
+        PipelineStage("capture", lambda: next(counter)),
+        PipelineStage("inference", sleep_and(0.02, lambda item: item)),
+        PipelineStage("post_process", lambda item: item),
+    ], drop_frames=False)
+    pipelines(pipeline)
+    pipeline.start()
+
+    get_outputs(pipeline, 5)
+    pipeline.stop()
+
+    stats = pipeline.stats()
+    assert set(stats) == {"capture", "inference", "post_process"}
+    for stage_stats in stats.values():
+        assert stage_stats["frames"] >= 5
+        assert stage_stats["dropped"] == 0
+    assert stats["inference"]["avg_time"] >= 0.02
+    assert stats["post_process"]["avg_time"] < 0.02
+    assert pipeline.fps > 0
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 The Blueoil Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# =============================================================================
+import json
+from io import BytesIO
+from multiprocessing import Pool
+
+import numpy as np
+import PIL.Image
+import pytest
+
+import inference_server
+from inference_server import MicroBatcher
+
+CLASSES = ["cat", "dog"]
+NUM_WORKERS = 1
+
+
+class StubNN(object):
+    """Network which returns the mean of each image as the probability of the first class."""
+
+    def run_batch(self, images):
+        mean = images.reshape(len(images), -1).mean(axis=1)
+        return np.stack([mean, 1 - mean], axis=1)
+
+
+class StubConfig(object):
+
+    def __init__(self, task):
+        self.TASK = task
+        self.CLASSES = CLASSES
+        self.IMAGE_SIZE = [4, 4]
+        self.DATA_FORMAT = "NHWC"
+
+
+def _init_stub_worker(task):
+    inference_server.nn = StubNN()
+    inference_server.pre_process = lambda image: {"image": image.astype(np.float32) / 255}
+    inference_server.post_process = lambda outputs: {"outputs": outputs}
+    inference_server.config = StubConfig(task)
+
+
+def _encode_image(value):
+    buf = BytesIO()
+    PIL.Image.fromarray(np.full((4, 4, 3), value, dtype=np.uint8)).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+@pytest.fixture
+def batcher_of_task(request):
+    pools = []
+    batchers = []
+
+    def create(task):
+        pool = Pool(processes=NUM_WORKERS, initializer=_init_stub_worker, initargs=(task,))
+        batcher = MicroBatcher(pool, NUM_WORKERS, max_batch_size=4, batch_timeout=0.05, report_interval=0)
+        pools.append(pool)
+        batchers.append(batcher)
+        return batcher
+
+    yield create
+
+    for batcher in batchers:
+        # not `stop()`, which waits forever if the dispatcher thread is blocked by leaked worker slots.
+        batcher.stopped = True
+        batcher.thread.join(1)
+    for pool in pools:
+        pool.terminate()
+        pool.join()
+
+
+def test_micro_batcher(batcher_of_task):
+    batcher = batcher_of_task("IMAGE.CLASSIFICATION")
+
+    requests = [
+        batcher.submit(_encode_image(0), "black.png"),
+        batcher.submit(_encode_image(255), "white.png"),
+        batcher.submit(b"not an image", "broken.png"),
+    ]
+    for request in requests:
+        assert request.done.wait(10)
+
+    black, white, broken = requests
+    assert black.status == 200
+    assert white.status == 200
+    assert broken.status == 400
+
+    result = json.loads(white.body)["results"][0]
+    assert result["file_path"] == "white.png"
+    assert float(result["prediction"][0]["probability"]) == pytest.approx(1.0)
+
+    summary = batcher.stats.summary()
+    assert summary["requests"] == 3
+    assert summary["errors"] == 1
+
+
+def test_micro_batcher_worker_error(batcher_of_task):
+    # `_run_batch` raises out of the worker with an unknown task.
+    batcher = batcher_of_task("UNKNOWN")
+
+    # more batches than the workers, each one must release its worker slot.
+    for i in range(NUM_WORKERS + 2):
+        request = batcher.submit(_encode_image(0), "image.png")
+        assert request.done.wait(10)
+        assert request.status == 500
+        assert "UNKNOWN" in request.body
+
+    summary = batcher.stats.summary()
+    assert summary["requests"] == NUM_WORKERS + 2
+    assert summary["errors"] == NUM_WORKERS + 2
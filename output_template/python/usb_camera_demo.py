@@ -18,12 +18,8 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
-import time
 import os
 import sys
-from multiprocessing import Process, Queue
-from time import sleep
-from collections import deque
 
 import click
 import cv2
@@ -39,7 +35,8 @@ from lmnet.utils.config import (
 from lmnet.utils.demo import (
     add_rectangle,
     add_fps,
-    run_inference,
+    PipelineStage,
+    StagedPipeline,
 )
 
 from lmnet.visualize import (
@@ -52,6 +49,10 @@ from lmnet.pre_processor import resize
 nn = None
 pre_process = None
 post_process = None
+vc = None
+
+CAMERA_WIDTH = 320
+CAMERA_HEIGHT = 240
 
 
 def init_camera(camera_width, camera_height):
@@ -79,14 +80,37 @@ def add_class_label(canvas,
     cv2.putText(canvas, text, dl_corner, font, font_scale, font_color, line_type)
 
 
-def infer_loop(q_input, q_output):
-    global nn, pre_process, post_process
+def init_capture():
+    global vc
+    vc = init_camera(CAMERA_WIDTH, CAMERA_HEIGHT)
+
+
+def capture_frame():
+    valid, img = vc.read()
+    if valid:
+        return img
+
+
+def pre_process_frame(img_orig):
+    img = cv2.cvtColor(img_orig, cv2.COLOR_BGR2RGB)
+    data = pre_process(image=img)["image"]
+    data = np.expand_dims(data, axis=0)
+    return img_orig, data
+
+
+def init_network():
     nn.init()
-    while True:
-        img_orig, fps = q_input.get()
-        img = cv2.cvtColor(img_orig, cv2.COLOR_BGR2RGB)
-        result, _, _ = run_inference(img, nn, pre_process, post_process)
-        q_output.put((result, fps, img_orig))
+
+
+def infer_frame(item):
+    img_orig, data = item
+    return img_orig, nn.run(data)
+
+
+def post_process_frame(item):
+    img_orig, result = item
+    return img_orig, post_process(outputs=result)['outputs']
+
 
 def show_object_detection(img, result, fps, window_height, window_width, config):
     window_img = resize(img, size=[window_height, window_width])
@@ -132,35 +156,16 @@ def show_keypoint_detection(img, result, fps, window_height, window_width, confi
     window_name = "Keypoint Detection Demo"
     cv2.imshow(window_name, window_img)
 
-def capture_loop(q_input):
-    camera_width = 320
-    camera_height = 240
-
-    vc = init_camera(camera_width, camera_height)
-
-    count_frames = 10
-    prev_1 = time.clock()
-    prev = deque([prev_1] * count_frames)
-
-    while True:
-        valid, img = vc.read()
-        if valid:
-            now = time.clock()
-            prev.append(now)
-            old = prev.popleft()
-            fps = count_frames / (now - old)
-            q_input.put((img, fps))
 
 def run_impl(config):
-    # Set variables
-    q_input = Queue(2)
-    q_output = Queue(4)
-
-    p_capture = Process(target=capture_loop, args=(q_input,))
-    p_capture.start()
-
-    p_infer = Process(target=infer_loop, args=(q_input, q_output))
-    p_infer.start()
+    # each stage runs in a process, so that pre/post process of other frames overlap with inference.
+    pipeline = StagedPipeline([
+        PipelineStage("capture", capture_frame, init=init_capture, use_process=True),
+        PipelineStage("pre_process", pre_process_frame, use_process=True),
+        PipelineStage("inference", infer_frame, init=init_network, use_process=True),
+        PipelineStage("post_process", post_process_frame, use_process=True),
+    ])
+    pipeline.start()
 
     window_width = 320
     window_height = 240
@@ -175,14 +180,15 @@ def run_impl(config):
 
     #  ----------- Beginning of Main Loop ---------------
     while True:
-        if not q_output.empty():
-            result, fps, img = q_output.get()
-            show_handle(img, result, fps, window_height, window_width, config)
+        item = pipeline.get(timeout=1.0)
+        if item is not None:
+            img, result = item
+            show_handle(img, result, pipeline.fps, window_height, window_width, config)
             key = cv2.waitKey(1)    # Wait for 1ms
             if key == 27:           # ESC to quit
-                sleep(1.0)          # Wait for worker's current task is finished
-                p_capture.terminate()
-                p_infer.terminate()
+                pipeline.stop()
+                for name, stats in pipeline.stats().items():
+                    print("{}: {}".format(name, stats))
                 return
     # --------------------- End of main Loop -----------------------
 
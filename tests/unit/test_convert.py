@@ -0,0 +1,113 @@
+import os
+import stat
+import sys
+
+import pytest
+
+from blueoil.cmd.convert import TARGETS, group_targets, make_all, sync_build_directory
+
+# `make` which writes the output file of each target, or fails on the targets in $FAKE_MAKE_FAIL.
+FAKE_MAKE = """#!{python}
+import os
+import sys
+
+outputs = {outputs!r}
+failures = os.environ.get("FAKE_MAKE_FAIL", "").split()
+targets = [arg for arg in sys.argv[1:] if not arg.startswith("-") and "=" not in arg]
+for target in targets:
+    if target in failures:
+        print("error: " + target)
+        sys.exit(2)
+    with open(outputs[target], "w") as f:
+        f.write(" ".join(sys.argv[1:]) + "\\n" + os.environ.get("CXXFLAGS", ""))
+"""
+
+
+@pytest.fixture
+def fake_make(tmpdir, monkeypatch):
+    bin_dir = tmpdir.mkdir("bin")
+    make = bin_dir.join("make")
+    make.write(FAKE_MAKE.format(python=sys.executable, outputs=TARGETS))
+    make.chmod(make.stat().mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", str(bin_dir) + os.pathsep + os.environ["PATH"])
+    monkeypatch.delenv("CXXFLAGS", raising=False)
+    return make
+
+
+@pytest.fixture
+def project_dir(tmpdir):
+    project = tmpdir.mkdir("project")
+    project.join("Makefile").write("all:\n")
+    project.mkdir("src").join("network.cpp").write("int main() {}\n")
+    return project
+
+
+def test_group_targets():
+    groups = group_targets(["lib_x86", "lm_x86", "ar_x86", "lib_arm", "lm_arm", "lib_x86"])
+
+    assert list(groups.items()) == [
+        ("lib_x86", ["lib_x86", "ar_x86"]),
+        ("lm_x86", ["lm_x86"]),
+        ("lib_arm", ["lib_arm"]),
+        ("lm_arm", ["lm_arm"]),
+    ]
+
+
+def test_group_targets_unknown():
+    with pytest.raises(ValueError, match="lib_unknown"):
+        group_targets(["lib_x86", "lib_unknown"])
+
+
+def test_sync_build_directory(project_dir):
+    build_dir = project_dir.join("build", "lib_x86")
+    source = project_dir.join("src", "network.cpp")
+    mirror = build_dir.join("src", "network.cpp")
+
+    sync_build_directory(str(project_dir), str(build_dir))
+    assert os.path.samefile(str(source), str(mirror))
+    assert build_dir.join("Makefile").check(file=1)
+    # the build directories are not mirrored into themselves.
+    assert not build_dir.join("build").check()
+
+    # objects of earlier builds are kept, and a replaced source is linked again.
+    build_dir.join("src", "network.o").write("object")
+    new_source = project_dir.join("src", "network.cpp.new")
+    new_source.write("int main() { return 1; }\n")
+    new_source.move(source)
+
+    sync_build_directory(str(project_dir), str(build_dir))
+    assert os.path.samefile(str(source), str(mirror))
+    assert mirror.read() == "int main() { return 1; }\n"
+    assert build_dir.join("src", "network.o").read() == "object"
+    assert not build_dir.join("src", "network.cpp.new").check()
+
+
+def test_make_all(fake_make, project_dir, tmpdir):
+    output_dir = tmpdir.mkdir("output")
+    targets = ["lib_aarch64", "ar_aarch64", "lm_aarch64"]
+
+    results = make_all(str(project_dir), str(output_dir), targets=targets, jobs=4)
+
+    assert [result.targets for result in results] == [["lib_aarch64", "ar_aarch64"], ["lm_aarch64"]]
+    assert all(result.returncode == 0 for result in results)
+    for target in targets:
+        assert output_dir.join(TARGETS[target]).check(file=1)
+    # each group of targets is built with its share of the jobs.
+    assert "-j2" in output_dir.join("lib_aarch64.so").read()
+    assert "-DFUNC_TIME_MEASUREMENT" in output_dir.join("lm_aarch64.elf").read()
+    assert "-DFUNC_TIME_MEASUREMENT" not in output_dir.join("lib_aarch64.so").read()
+
+
+def test_make_all_failure(fake_make, project_dir, tmpdir, monkeypatch, capsys):
+    output_dir = tmpdir.mkdir("output")
+    monkeypatch.setenv("FAKE_MAKE_FAIL", "lm_aarch64")
+
+    with pytest.raises(RuntimeError, match="lm_aarch64"):
+        make_all(str(project_dir), str(output_dir), targets=["lib_aarch64", "lm_aarch64"], jobs=2)
+
+    # the other targets are still built, and the log of the failed one is reported.
+    assert output_dir.join("lib_aarch64.so").check(file=1)
+    assert not output_dir.join("lm_aarch64.elf").check()
+    log_path = project_dir.join("build", "lm_aarch64", "make.log")
+    assert "error: lm_aarch64" in log_path.read()
+    assert "FAILED (see {})".format(log_path) in capsys.readouterr().out